@@ -4,9 +4,27 @@ Simple topic → video → upload workflow
 """
 
 import streamlit as st
+import functools
 import os
-import docx
-import requests
+import uuid
+from concurrent.futures import Future
+
+from utils import api_client, ratelimit, tracing
+from utils.assets import load_prompt, load_sample_scripts
+from utils.audio import audio_file_info
+from utils.cache import BlobCache
+from utils.catalog import CATALOG_TTL, CatalogCache, CatalogError, CatalogIndex
+from utils.context_cache import set_context_caching
+from utils.gemini import generate_script_gemini, get_script_modes, set_response_schema, stream_script_gemini
+from utils.heygen import submit_video as submit_heygen_video
+from utils.jobs import DONE, JOBS_DB_PATH, QUEUED, RUNNING, JobQueue
+from utils.media import MEDIA_DIR, MediaQuotaError, MediaStore, serve_media
+from utils.pipeline import SegmentPipeline
+from utils.script_cache import CACHED, SHARED, ScriptCache
+from utils.script_edit import VoiceTake, retake, version_segments
+from utils.tts import SynthesisError, text_to_speech
+from utils.variants import VariantRunner
+from utils.youtube import QuotaExhaustedError, upload_video
 
 # Page config
 st.set_page_config(
@@ -57,6 +75,51 @@ gemini_api_key = st.secrets["gemini_api"] if "gemini_api" in st.secrets else Non
 elevenlab_api_key = st.secrets["elevenlab_api"] if "elevenlab_api" in st.secrets else None
 heygen_api_key = st.secrets["heygen_api"] if "heygen_api" in st.secrets else None
 
+# Optional (connect, read) timeout in seconds for every external API call
+if "api_timeout_seconds" in st.secrets:
+    api_client.set_timeout(tuple(st.secrets["api_timeout_seconds"]))
+
+# Optional per-provider request limits shared by every session, e.g.
+# [rate_limits.elevenlabs]
+# rate = 2.0            # requests per second
+# max_concurrent = 2    # requests in flight
+if "rate_limits" in st.secrets:
+    ratelimit.configure_all(st.secrets["rate_limits"])
+
+# Every pipeline span is appended here as an OpenTelemetry-style JSON line ("" to disable);
+# the file is rotated at trace_log_max_bytes
+tracing.set_export_path(
+    st.secrets.get("trace_log_path", os.path.join(".cache", "traces.jsonl")),
+    max_bytes=int(st.secrets.get("trace_log_max_bytes", tracing.EXPORT_MAX_BYTES))
+)
+
+# Upload the static prompt + sample scripts to Gemini once (cachedContents) and reference it per request
+set_context_caching(bool(st.secrets.get("gemini_context_cache", True)))
+
+# Ask Gemini for JSON matching the script schema (responseSchema); false describes the format in the prompt only
+set_response_schema(bool(st.secrets.get("gemini_response_schema", True)))
+
+# Stream scripts from Gemini (segments appear while it writes); set to false to use the blocking call
+gemini_streaming = bool(st.secrets.get("gemini_streaming", True))
+
+# Max ElevenLabs segment requests in flight at once (lower it if your plan has a small concurrency limit)
+tts_max_in_flight = int(st.secrets.get("tts_max_in_flight", 4))
+
+# On-disk cache of synthesized speech, shared by every session of this process
+@st.cache_resource
+def get_tts_cache():
+    cache_dir = st.secrets.get("tts_cache_dir", os.path.join(".cache", "tts"))
+    max_mb = int(st.secrets.get("tts_cache_max_mb", 512))
+    return BlobCache(cache_dir, max_bytes=max_mb * 1024 * 1024)
+
+# Generated scripts, keyed by topic + prompt/samples/model; concurrent requests for a topic share one call
+@st.cache_resource
+def get_script_cache():
+    return ScriptCache(st.secrets.get("script_cache_dir", os.path.join(".cache", "scripts")))
+
+# Reuse a script generated for the same topic within this many hours (0 = always generate a fresh one)
+script_reuse_hours = float(st.secrets.get("script_reuse_hours", 0))
+
 # YouTube API credentials from Streamlit secrets
 youtube_credentials = {
     "client_id": st.secrets.get("youtube_client_id"),
@@ -66,615 +129,428 @@ youtube_credentials = {
     "auth_provider_x509_cert_url": st.secrets.get("youtube_auth_provider_x509_cert_url"),
     "client_secret": st.secrets.get("youtube_client_secret"),
     "redirect_uris": [st.secrets.get("youtube_redirect_uris")] if st.secrets.get("youtube_redirect_uris") else [],
-    "javascript_origins": [st.secrets.get("youtube_javascript_origins")] if st.secrets.get("youtube_javascript_origins") else []
+    "javascript_origins": [st.secrets.get("youtube_javascript_origins")] if st.secrets.get("youtube_javascript_origins") else [],
+    "refresh_token": st.secrets.get("youtube_refresh_token"),
+    "access_token": st.secrets.get("youtube_access_token")
 }
 
-# ElevenLabs get voices function (must be defined before use)
-def get_elevenlabs_voices(api_key):
-    url = "https://api.elevenlabs.io/v1/voices"
-    headers = {"xi-api-key": api_key}
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            voices_data = response.json()
-            return voices_data.get('voices', [])
-        else:
-            st.error(f"Failed to load voices: {response.status_code}")
-            return []
-    except Exception as e:
-        st.error(f"Error loading voices: {str(e)}")
-        return []
-
-# HeyGen get avatars function (must be defined before use)
-def get_heygen_avatars(api_key):
-    url = "https://api.heygen.com/v2/avatars"
-    headers = {"X-API-KEY": api_key}
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            avatars_data = response.json()
-            return avatars_data.get('data', {}).get('avatars', [])
-        else:
-            st.error(f"Failed to load avatars: {response.status_code}")
-            return []
-    except Exception as e:
-        st.error(f"Error loading avatars: {str(e)}")
-        return []
-
-# Load prompt.txt
-def load_prompt():
-    with open("assets/prompt.txt", encoding="utf-8") as f:
-        return f.read()
-
-# Load sample_scripts.docx
-def load_sample_scripts():
-    doc = docx.Document("assets/sample_scripts.docx")
-    scripts = []
-    for para in doc.paragraphs:
-        text = para.text.strip()
-        if text:
-            scripts.append(text)
-    return "\n".join(scripts)
-
-# Gemini API call
-def generate_script_gemini(topic, prompt, samples, api_key):
-    # Updated Gemini API endpoint and model
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    
-    # Enhanced prompt to ensure Roman Urdu output in JSON format
-    enhanced_prompt = f"""
-{prompt}
-
-IMPORTANT: You MUST write the entire script in ROMAN URDU only. Do not use English except for technical terms that don't have Roman Urdu equivalents.
-
-Examples of Roman Urdu style you should follow:
-- "Aaj main aap ko bataunga..."
-- "Yeh kya baat hai..."
-- "Dekho yaar..."
-- "Lagta hai..."
-- "Samajh gaye?"
-
-Sample Scripts for Reference:
-{samples}
-
-Video Topic: {topic}
+# Voice/avatar catalogs, shared by every session and persisted across restarts
+@st.cache_resource
+def get_catalog_cache():
+    cache_dir = st.secrets.get("catalog_cache_dir", os.path.join(".cache", "catalogs"))
+    ttl = int(st.secrets.get("catalog_ttl_seconds", CATALOG_TTL))
+    return CatalogCache(cache_dir, ttl=ttl)
 
-CRITICAL: Return the script in this EXACT JSON format:
-{{
-  "title": "Video title in Roman Urdu",
-  "segments": [
-    {{
-      "start_time": 0,
-      "end_time": 10,
-      "delay_after": 0,
-      "text": "Roman Urdu text for first segment"
-    }},
-    {{
-      "start_time": 10,
-      "end_time": 25,
-      "delay_after": 1,
-      "text": "Roman Urdu text for second segment"
-    }}
-  ]
-}}
+# Load both catalogs in parallel
+def load_avatars_and_voices(heygen_key, elevenlabs_key):
+    """
+    Returns (avatars, voices); a catalog that failed to load comes back empty
+    """
+    results = get_catalog_cache().get_many({'avatars': heygen_key, 'voices': elevenlabs_key})
+    for name in ('avatars', 'voices'):
+        if isinstance(results[name], CatalogError):
+            st.error(f"Failed to load {name}: {str(results[name])}")
+            results[name] = []
+    return results['avatars'], results['voices']
 
-Remember: 
-- Write ONLY in Roman Urdu with casual, witty tone
-- Include proper timing based on your script timestamps
-- Add delay_after in seconds for pauses between segments
-- Return ONLY the JSON, no extra text before or after
-"""
-    
-    data = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": enhanced_prompt}
-                ]
-            }
-        ],
-        "generationConfig": {
-            "temperature": 0.7,
-            "topK": 40,
-            "topP": 0.95,
-            "maxOutputTokens": 2048
-        }
-    }
+# Stream the script from Gemini, showing each segment as soon as it is complete
+def stream_script_to_page(topic, prompt, samples, api_key):
+    """
+    Returns the script JSON, or an error string like generate_script_gemini
+    """
+    live_box = st.empty()
+    streamed_lines = []
+    script_json = "[Error: Gemini stream ended without a script]"
     
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        
-        if response.status_code == 200:
-            result = response.json()
-            try:
-                script_text = result['candidates'][0]['content']['parts'][0]['text']
-                
-                # Try to parse as JSON
-                import json
-                try:
-                    # Clean up the response (remove markdown formatting if present)
-                    cleaned_text = script_text.strip()
-                    if cleaned_text.startswith('```json'):
-                        cleaned_text = cleaned_text.replace('```json', '').replace('```', '').strip()
-                    
-                    script_json = json.loads(cleaned_text)
-                    return script_json
-                except json.JSONDecodeError:
-                    return f"[Error: Generated script is not valid JSON - {script_text[:200]}...]"
-                    
-            except (KeyError, IndexError) as e:
-                return f"[Error: Unexpected Gemini API response format - {str(e)}]"
+    for event in stream_script_gemini(topic, prompt, samples, api_key):
+        if event['type'] == 'title':
+            streamed_lines.append(f"**Title:** {event['title']}")
+        elif event['type'] == 'segment':
+            segment = event['segment']
+            streamed_lines.append(f"**({segment.get('start_time', 0)}-{segment.get('end_time', 0)} seconds)** {segment.get('text', '')}")
+        elif event['type'] == 'script':
+            script_json = event['script']
         else:
-            # More detailed error information
-            error_detail = ""
-            try:
-                error_response = response.json()
-                error_detail = f" - {error_response.get('error', {}).get('message', 'Unknown error')}"
-            except:
-                error_detail = f" - Response: {response.text[:200]}"
-            
-            return f"[Error: Gemini API returned {response.status_code}{error_detail}]"
-            
-    except requests.exceptions.RequestException as e:
-        return f"[Error: Network error - {str(e)}]"
-    except Exception as e:
-        return f"[Error: Unexpected error - {str(e)}]"
+            script_json = event['message']
+        live_box.markdown("\n\n".join(streamed_lines))
+    
+    live_box.empty()
+    return script_json
 
 # ElevenLabs API call for single text
 def generate_voice_elevenlabs(script, api_key, voice_id):
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-    headers = {
-        "xi-api-key": api_key,
-        "Content-Type": "application/json"
-    }
-    data = {
-        "text": script,
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.75
-        }
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code == 200:
-        return response.content
-    else:
-        st.error(f"ElevenLabs API error: {response.status_code}")
+    try:
+        return text_to_speech(script, api_key, voice_id, cache=get_tts_cache())
+    except SynthesisError as e:
+        st.error(str(e))
         return None
 
 # Generate voice segments with delays from JSON script
-def generate_voice_segments_with_delays(script_json, api_key, voice_id):
+def generate_voice_segments_with_delays(script_json, api_key, voice_id, max_in_flight=None):
     """
     Generate voice segments from JSON script with delays
-    Returns list of audio segments with timing information
+    Each segment is synthesized as raw PCM (at most tts_max_in_flight at once) and
+    placed on the audio timeline as soon as the segments before it are done, so
+    the finished WAV is ready right after the slowest segment
+    Returns (list of audio segments with timing information, WAV bytes)
     """
     try:
-        import time
-        audio_segments = []
-        
-        for i, segment in enumerate(script_json.get('segments', [])):
-            # Generate voice for this segment
-            segment_text = segment.get('text', '')
-            
-            if segment_text.strip():
-                # Generate audio for this segment (silent processing)
-                audio_bytes = generate_voice_elevenlabs(segment_text, api_key, voice_id)
-                
-                if audio_bytes:
-                    # Store segment with timing info
-                    audio_segments.append({
-                        'audio': audio_bytes,
-                        'start_time': segment.get('start_time', 0),
-                        'end_time': segment.get('end_time', 0),
-                        'delay_after': segment.get('delay_after', 0),
-                        'text': segment_text
-                    })
-                    
-                    # Add small delay between API calls to avoid rate limiting
-                    time.sleep(0.5)
-                else:
-                    return None
-        
-        return audio_segments
+        pipeline = SegmentPipeline(
+            api_key,
+            voice_id,
+            max_in_flight=max_in_flight or tts_max_in_flight,
+            cache=get_tts_cache()
+        )
+        return pipeline.run(script_json.get('segments', []))
         
     except Exception as e:
         st.error(f"Error generating voice segments: {str(e)}")
-        return None
+        return None, None
+
+# Generated audio and rendered videos live in this directory; session state only keeps their media ids
+# With media_server_port set, the browser streams them straight from disk (media_public_url if behind a proxy)
+@st.cache_resource
+def get_media_store():
+    media_port = st.secrets.get("media_server_port")
+    store = MediaStore(
+        st.secrets.get("media_dir", MEDIA_DIR),
+        session_quota=int(st.secrets.get("media_session_quota_mb", 500)) * 1024 * 1024,
+        idle_timeout=float(st.secrets.get("media_idle_hours", 2)) * 3600,
+        url_prefix=st.secrets.get("media_public_url") or (f"http://localhost:{media_port}" if media_port else None)
+    )
+    if media_port:
+        serve_media(store, st.secrets.get("media_server_host", "127.0.0.1"), int(media_port))
+    return store
+
+# This browser session's owner key in the media store
+def media_owner():
+    if 'media_owner' not in st.session_state:
+        st.session_state.media_owner = uuid.uuid4().hex
+    return st.session_state.media_owner
 
-# Simple audio concatenation without external libraries
-def concatenate_audio_segments(audio_segments):
+# Point a session slot (e.g. generated_audio_id) at new media, releasing what it held before
+def set_session_media(slot, media_id):
+    previous = st.session_state.get(slot)
+    st.session_state[slot] = media_id
+    if previous and previous != media_id:
+        get_media_store().release(previous, owner=media_owner())
+
+# Path of the media in a session slot, or None if there is none or it was evicted
+def session_media_path(slot):
+    return get_media_store().path(st.session_state.get(slot))
+
+# Keep this session's media alive; media of sessions idle for media_idle_hours is released
+get_media_store().touch(media_owner())
+
+# HeyGen render, run by a background job worker (no Streamlit calls in here)
+def render_video_job(payload, progress, media_store):
     """
-    Simple audio concatenation by joining bytes
-    This is a basic approach - for production, consider using proper audio libraries
+    Uploads the audio and starts the render, then hands the job back as a
+    Future: the worker is free for the next job while the shared poller
+    watches the render
     """
+    errors = []
+    
+    def notify(level, message):
+        if level == 'error':
+            errors.append(message)
+        # Status polls arrive on the shared poller thread; don't write the job record for each
+        if level != 'status':
+            progress(message)
+    
+    def release_audio():
+        # Drop the job's hold on the audio (taken in submit_render_job)
+        if payload.get('audio_media_id'):
+            media_store.release(payload['audio_media_id'])
+    
+    active = tracing.start_span('render.job', avatar_id=payload['avatar_id'])
     try:
-        if not audio_segments:
-            return None
-        
-        # For now, just return the first segment as a simple fallback
-        # In a production environment, you'd use proper audio processing
-        combined_audio = b""
-        
-        for segment in audio_segments:
-            combined_audio += segment['audio']
-            
-            # Note: This doesn't add actual silence delays
-            # It just concatenates the audio files
-            
-        return combined_audio if combined_audio else audio_segments[0]['audio']
-        
+        with tracing.use_span(active), open(payload['audio_path'], 'rb') as audio_file:
+            render = submit_heygen_video(
+                audio_file, heygen_api_key, payload['avatar_id'],
+                notify=notify,
+                video_path=payload['video_path']
+            )
     except Exception as e:
-        st.error(f"Error concatenating audio: {str(e)}")
-        return audio_segments[0]['audio'] if audio_segments else None
+        active.record_error(e)
+        tracing.end_span(active)
+        release_audio()
+        raise
+    
+    result = Future()
+    
+    def finish(render):
+        release_audio()
+        video_path = render.result()
+        if video_path:
+            result.set_result({'video_path': video_path})
+        else:
+            error = errors[-1] if errors else "Failed to generate video"
+            active.record_error(error)
+            result.set_exception(RuntimeError(error))
+        tracing.end_span(active)
+    
+    render.add_done_callback(finish)
+    return result
+
+# Most (voice, avatar) combinations rendered at once from the A/B Variants panel
+max_variants = int(st.secrets.get("max_variants", 6))
+
+# A/B variants of one script, run by a background job worker (no Streamlit calls in here)
+def render_variants_job(payload, progress, media_store, tts_cache):
+    def notify(level, message):
+        if level != 'status':
+            progress(message)
+    
+    runner = VariantRunner(
+        {'elevenlabs': elevenlab_api_key, 'heygen': heygen_api_key},
+        media_store.directory,
+        tts_max_in_flight=tts_max_in_flight,
+        tts_cache=tts_cache,
+        notify=notify
+    )
+    # Returns once the renders have started, like render_video_job
+    render = runner.submit(payload['script'], [tuple(pair) for pair in payload['pairs']])
+    result = Future()
+    
+    def finish(render):
+        variants = render.result()
+        if all(variant['status'] == 'failed' for variant in variants):
+            result.set_exception(RuntimeError(variants[0].get('error', "All variants failed") if variants else "No variants"))
+        else:
+            result.set_result({'variants': variants})
+    
+    render.add_done_callback(finish)
+    return result
 
-# HeyGen API call (placeholder)
-def generate_video_heygen(audio_bytes, api_key, avatar_id):
+# Render jobs run on a worker pool shared by all sessions; records live in SQLite.
+# Workers only prepare and upload audio and start renders; the shared HeyGen
+# poller watches the renders, so any number of them can run at once
+@st.cache_resource
+def get_job_queue():
+    queue = JobQueue(
+        st.secrets.get("jobs_db_path", JOBS_DB_PATH),
+        workers=int(st.secrets.get("render_workers", 2))
+    )
+    queue.register('render', functools.partial(render_video_job, media_store=get_media_store()))
+    queue.register('variants', functools.partial(
+        render_variants_job, media_store=get_media_store(), tts_cache=get_tts_cache()
+    ))
+    queue.start()
+    return queue
+
+# Queue a HeyGen render for the current audio
+def submit_render_job(audio_media_id, avatar_id):
     """
-    Generate video using HeyGen API with avatar and custom ElevenLabs audio
+    Returns the job id; the job's result holds the video path once done
+    The job holds its own reference to the audio, so it survives the session replacing it
     """
-    try:
-        import requests
-        import time
-        import tempfile
-        import os
-        
-        headers = {
-            "X-API-KEY": api_key
-        }
-        
-        # Try multiple approaches to upload the custom audio
-        
-        # Approach 1: Try the v1/assets endpoint (corrected)
-        try:
-            upload_url = "https://api.heygen.com/v1/assets/upload"
-            
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-            
-            # Upload as multipart form data
-            with open(temp_file_path, 'rb') as audio_file:
-                files = {
-                    'file': ('audio.mp3', audio_file, 'audio/mpeg')
-                }
-                
-                upload_response = requests.post(upload_url, headers=headers, files=files)
-            
-            # Clean up temp file
-            os.unlink(temp_file_path)
-            
-            if upload_response.status_code == 200 or upload_response.status_code == 201:
-                upload_result = upload_response.json()
-                audio_asset_id = upload_result.get('data', {}).get('asset_id') or upload_result.get('data', {}).get('id') or upload_result.get('asset_id') or upload_result.get('id')
-                
-                if audio_asset_id:
-                    st.success(f"✅ Successfully uploaded audio asset: {audio_asset_id}")
-                    
-                    # Generate video using the uploaded audio asset
-                    video_url = "https://api.heygen.com/v2/video/generate"
-                    
-                    video_headers = {
-                        "X-API-KEY": api_key,
-                        "Content-Type": "application/json"
-                    }
-                    
-                    payload = {
-                        "video_inputs": [
-                            {
-                                "character": {
-                                    "type": "avatar",
-                                    "avatar_id": avatar_id
-                                },
-                                "voice": {
-                                    "type": "audio",
-                                    "audio_asset_id": audio_asset_id
-                                }
-                            }
-                        ],
-                        "dimension": {
-                            "width": 720,
-                            "height": 480
-                        },
-                        "aspect_ratio": "16:9"
-                    }
-                    
-                    st.info("🎬 Generating video with your custom ElevenLabs voice...")
-                    
-                    response = requests.post(video_url, json=payload, headers=video_headers)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        video_id = result.get('data', {}).get('video_id')
-                        
-                        if video_id:
-                            st.info(f"Video generation started with ID: {video_id}")
-                            
-                            # Poll for video completion
-                            status_url = f"https://api.heygen.com/v1/video_status.get?video_id={video_id}"
-                            
-                            max_attempts = 60
-                            for attempt in range(max_attempts):
-                                status_response = requests.get(status_url, headers=headers)
-                                
-                                if status_response.status_code == 200:
-                                    status_data = status_response.json()
-                                    video_status = status_data.get('data', {}).get('status')
-                                    
-                                    st.info(f"Video status: {video_status} (attempt {attempt + 1})")
-                                    
-                                    if video_status == 'completed':
-                                        video_url_result = status_data.get('data', {}).get('video_url')
-                                        if video_url_result:
-                                            video_response = requests.get(video_url_result)
-                                            if video_response.status_code == 200:
-                                                return video_response.content
-                                    elif video_status == 'failed':
-                                        error_msg = status_data.get('data', {}).get('error', 'Unknown error')
-                                        st.error(f"Video generation failed: {error_msg}")
-                                        return None
-                                
-                                time.sleep(10)
-                            
-                            st.error("Video generation timed out")
-                            return None
-                    else:
-                        st.error(f"Video generation failed: {response.status_code} - {response.text}")
-            else:
-                st.warning(f"v1/assets/upload failed: {upload_response.status_code} - {upload_response.text}")
-        
-        except Exception as e1:
-            st.warning(f"v1/assets/upload approach failed: {str(e1)}")
-        
-        # Approach 2: Try v2/assets endpoint
-        try:
-            upload_url = "https://api.heygen.com/v2/assets"
-            
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-            
-            # Upload as multipart form data
-            with open(temp_file_path, 'rb') as audio_file:
-                files = {
-                    'file': ('audio.mp3', audio_file, 'audio/mpeg')
-                }
-                data = {
-                    'type': 'audio'
-                }
-                
-                upload_response = requests.post(upload_url, headers=headers, files=files, data=data)
-            
-            # Clean up temp file
-            os.unlink(temp_file_path)
-            
-            if upload_response.status_code == 200 or upload_response.status_code == 201:
-                upload_result = upload_response.json()
-                audio_asset_id = upload_result.get('data', {}).get('asset_id') or upload_result.get('data', {}).get('id')
+    media_store = get_media_store()
+    media_store.acquire(audio_media_id)
+    return get_job_queue().submit('render', {
+        'audio_path': media_store.path_for(audio_media_id),
+        'audio_media_id': audio_media_id,
+        'avatar_id': avatar_id,
+        'video_path': media_store.new_path('.mp4')
+    }, owner=media_owner())
+
+# Live status of the current render job (re-runs on its own every few seconds)
+@st.fragment(run_every=5)
+def show_render_job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return
+    
+    if job['status'] in (QUEUED, RUNNING):
+        st.info(f"🎬 Video {job['status']}: {job['message'] or ''}")
+    elif job['status'] == DONE:
+        video_path = job['result']['video_path']
+        if st.session_state.get('generated_video_id') != os.path.basename(video_path):
+            try:
+                set_session_media('generated_video_id', get_media_store().adopt(media_owner(), video_path))
+            except OSError:
+                st.warning("This video is no longer available; please render it again")
+                return
+            except MediaQuotaError as e:
+                st.error(f"Not enough media space for this session: {str(e)}")
+                return
+            st.session_state.video_ready = True
+            st.rerun()
+        st.success("✅ Video generated successfully!")
+    else:
+        st.error(f"Failed to generate video: {job['error']}")
+
+# Keep a finished variants job's files as this session's media (replacing the previous comparison)
+def set_session_variants(variants):
+    store = get_media_store()
+    owner = media_owner()
+    for variant in st.session_state.get('variants', []):
+        for slot in ('audio_id', 'video_id'):
+            if variant.get(slot):
+                store.release(variant[slot], owner=owner)
+    
+    kept = []
+    for variant in variants:
+        variant = dict(variant)
+        for slot, path_key in (('audio_id', 'audio_path'), ('video_id', 'video_path')):
+            if variant.get(path_key):
+                try:
+                    variant[slot] = store.adopt(owner, variant[path_key])
+                except (OSError, MediaQuotaError) as e:
+                    variant.update(status='failed', error=f"Not kept: {str(e)}")
+        kept.append(variant)
+    st.session_state.variants = kept
+
+# Live status of the current variants job (re-runs on its own every few seconds)
+@st.fragment(run_every=5)
+def show_variants_job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return
+    
+    if job['status'] in (QUEUED, RUNNING):
+        st.info(f"🧪 Variants {job['status']}: {job['message'] or ''}")
+    elif job['status'] == DONE:
+        if st.session_state.get('variants_loaded_job') != job_id:
+            set_session_variants(job['result']['variants'])
+            st.session_state.variants_loaded_job = job_id
+            st.rerun()
+    else:
+        st.error(f"Failed to render variants: {job['error']}")
+
+# Variants side by side: one card per (voice, avatar) with its player and timings
+def show_variant_comparison(variants):
+    store = get_media_store()
+    voice_index = get_catalog_index('voice_index', 'available_voices', 'voice_id', 'name')
+    avatar_index = get_catalog_index('avatar_index', 'available_avatars', 'avatar_id', 'avatar_name')
+    
+    for row_start in range(0, len(variants), 3):
+        columns = st.columns(3)
+        for column, variant in zip(columns, variants[row_start:row_start + 3]):
+            with column:
+                voice = voice_index.get(variant['voice_id']) or {}
+                label = voice.get('name', variant['voice_id'])
+                if variant.get('avatar_id'):
+                    avatar = avatar_index.get(variant['avatar_id']) or {}
+                    label += f" · {avatar.get('avatar_name', variant['avatar_id'])}"
+                st.markdown(f"**{label}**")
                 
-                if audio_asset_id:
-                    st.success(f"✅ Successfully uploaded audio asset: {audio_asset_id}")
-                    
-                    # Generate video using the uploaded audio asset
-                    video_url = "https://api.heygen.com/v2/video/generate"
-                    
-                    video_headers = {
-                        "X-API-KEY": api_key,
-                        "Content-Type": "application/json"
-                    }
-                    
-                    payload = {
-                        "video_inputs": [
-                            {
-                                "character": {
-                                    "type": "avatar",
-                                    "avatar_id": avatar_id
-                                },
-                                "voice": {
-                                    "type": "audio",
-                                    "audio_asset_id": audio_asset_id
-                                }
-                            }
-                        ],
-                        "dimension": {
-                            "width": 720,
-                            "height": 480
-                        },
-                        "aspect_ratio": "16:9"
-                    }
-                    
-                    st.info("🎬 Generating video with your custom ElevenLabs voice...")
-                    
-                    response = requests.post(video_url, json=payload, headers=video_headers)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        video_id = result.get('data', {}).get('video_id')
-                        
-                        if video_id:
-                            st.info(f"Video generation started with ID: {video_id}")
-                            
-                            # Poll for video completion
-                            status_url = f"https://api.heygen.com/v1/video_status.get?video_id={video_id}"
-                            
-                            max_attempts = 60
-                            for attempt in range(max_attempts):
-                                status_response = requests.get(status_url, headers=headers)
-                                
-                                if status_response.status_code == 200:
-                                    status_data = status_response.json()
-                                    video_status = status_data.get('data', {}).get('status')
-                                    
-                                    st.info(f"Video status: {video_status} (attempt {attempt + 1})")
-                                    
-                                    if video_status == 'completed':
-                                        video_url_result = status_data.get('data', {}).get('video_url')
-                                        if video_url_result:
-                                            video_response = requests.get(video_url_result)
-                                            if video_response.status_code == 200:
-                                                return video_response.content
-                                    elif video_status == 'failed':
-                                        error_msg = status_data.get('data', {}).get('error', 'Unknown error')
-                                        st.error(f"Video generation failed: {error_msg}")
-                                        return None
-                                
-                                time.sleep(10)
-                            
-                            st.error("Video generation timed out")
-                            return None
-                    else:
-                        st.error(f"Video generation failed: {response.status_code} - {response.text}")
-            else:
-                st.warning(f"v2/assets upload failed: {upload_response.status_code}")
-        
-        except Exception as e1:
-            st.warning(f"v2/assets approach failed: {str(e1)}")
-        
-        # Approach 3: Try direct audio URL approach
-        try:
-            st.info("🔄 Trying direct audio URL approach...")
-            
-            # Try using audio_url instead of asset upload
-            video_url = "https://api.heygen.com/v2/video/generate"
-            
-            video_headers = {
-                "X-API-KEY": api_key,
-                "Content-Type": "application/json"
-            }
-            
-            # Create a data URL for the audio
-            import base64
-            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-            audio_data_url = f"data:audio/mpeg;base64,{audio_base64}"
-            
-            payload = {
-                "video_inputs": [
-                    {
-                        "character": {
-                            "type": "avatar",
-                            "avatar_id": avatar_id
-                        },
-                        "voice": {
-                            "type": "audio",
-                            "audio_url": audio_data_url
-                        }
-                    }
-                ],
-                "dimension": {
-                    "width": 720,
-                    "height": 480
-                },
-                "aspect_ratio": "16:9"
-            }
-            
-            response = requests.post(video_url, json=payload, headers=video_headers)
-            
-            if response.status_code == 200:
-                result = response.json()
-                video_id = result.get('data', {}).get('video_id')
+                video_path = store.path(variant.get('video_id'))
+                audio_path = store.path(variant.get('audio_id'))
+                if variant['status'] != 'done':
+                    st.error(variant.get('error', "Failed"))
+                elif video_path:
+                    st.video(store.url(variant['video_id']) or video_path)
+                elif audio_path:
+                    st.audio(store.url(variant['audio_id']) or audio_path, format="audio/wav")
+                else:
+                    st.warning("No longer available")
                 
-                if video_id:
-                    st.success("✅ Audio URL approach working!")
-                    st.info(f"Video generation started with ID: {video_id}")
-                    
-                    # Poll for video completion
-                    status_url = f"https://api.heygen.com/v1/video_status.get?video_id={video_id}"
-                    
-                    max_attempts = 60
-                    for attempt in range(max_attempts):
-                        status_response = requests.get(status_url, headers=headers)
-                        
-                        if status_response.status_code == 200:
-                            status_data = status_response.json()
-                            video_status = status_data.get('data', {}).get('status')
-                            
-                            st.info(f"Video status: {video_status} (attempt {attempt + 1})")
-                            
-                            if video_status == 'completed':
-                                video_url_result = status_data.get('data', {}).get('video_url')
-                                if video_url_result:
-                                    video_response = requests.get(video_url_result)
-                                    if video_response.status_code == 200:
-                                        return video_response.content
-                            elif video_status == 'failed':
-                                error_msg = status_data.get('data', {}).get('error', 'Unknown error')
-                                st.error(f"Video generation failed: {error_msg}")
-                                return None
-                        
-                        time.sleep(10)
-                    
-                    st.error("Video generation timed out")
-                    return None
-            else:
-                st.warning(f"Audio URL approach failed: {response.status_code} - {response.text}")
-        
-        except Exception as e2:
-            st.warning(f"Audio URL approach failed: {str(e2)}")
-        
-        # Approach 4: Try streaming avatar API if assets don't work
-        try:
-            st.info("🔄 Trying streaming avatar approach...")
-            
-            # Use streaming avatar real-time API
-            streaming_url = "https://api.heygen.com/v1/streaming.create_token"
-            
-            streaming_response = requests.post(streaming_url, headers=headers)
+                details = [f"{variant['duration_seconds']}s audio"] if variant.get('duration_seconds') else []
+                details += [f"{stage} {seconds}s" for stage, seconds in variant.get('timings', {}).items()]
+                st.caption(" · ".join(details))
+
+# Most previous script versions kept for undo
+SCRIPT_HISTORY_SIZE = 20
+
+# Editable view of the current script, with segment versions and which segments the current audio is missing
+def show_script_editor():
+    script_json = st.session_state.generated_script
+    segments = script_json.get('segments', [])
+    revision = len(st.session_state.get('script_history', []))
+    take = st.session_state.get('voice_take')
+    stale = set(VoiceTake.from_dict(take).pending(segments)) if take else set()
+    voiced = [index for index, segment in enumerate(segments) if str(segment.get('text', '')).strip()]
+    stale = {voiced[position] for position in stale}
+    
+    with st.expander("✏️ Edit Script", expanded=bool(stale)):
+        if stale:
+            st.caption(f"{len(stale)} segment(s) changed since the voice was generated; Generate Voice re-voices only those")
+        with st.form(f"script_editor_{revision}"):
+            title = st.text_input("Title", value=script_json.get('title', ''))
+            edited = []
+            for index, segment in enumerate(segments):
+                marker = " · ✏️ not voiced yet" if index in stale else ""
+                text_col, start_col, delay_col = st.columns([0.7, 0.15, 0.15])
+                with text_col:
+                    text = st.text_area(
+                        f"Segment {index + 1} · v{segment.get('version', 1)}{marker}",
+                        value=segment.get('text', ''), height=90, key=f"edit_{revision}_{index}_text"
+                    )
+                with start_col:
+                    start_time = st.number_input(
+                        "Start (s)", value=float(segment.get('start_time', 0) or 0), min_value=0.0, step=0.5,
+                        key=f"edit_{revision}_{index}_start"
+                    )
+                with delay_col:
+                    delay_after = st.number_input(
+                        "Pause after (s)", value=float(segment.get('delay_after', 0) or 0), min_value=0.0, step=0.5,
+                        key=f"edit_{revision}_{index}_delay"
+                    )
+                if text.strip():
+                    edited.append(dict(segment, text=text.strip(), start_time=start_time, delay_after=delay_after))
+            new_text = st.text_area("Add a segment at the end (optional)", value="", height=70, key=f"edit_{revision}_new")
+            if new_text.strip():
+                last_end = max([float(segment.get('end_time', 0) or 0) for segment in edited] or [0])
+                edited.append({'text': new_text.strip(), 'start_time': last_end, 'end_time': last_end, 'delay_after': 0})
             
-            if streaming_response.status_code == 200:
-                st.info("📺 Streaming approach available, but falling back to text for now...")
+            saved = st.form_submit_button("Save Changes")
         
-        except Exception as e2:
-            st.warning(f"Streaming approach failed: {str(e2)}")
-        
-        # Fallback: STOP if we can't use custom audio
-        st.error("❌ Could not upload your custom ElevenLabs audio to HeyGen")
-        st.error("🚫 Video generation cancelled - we need your custom voice for proper lip-sync")
-        st.info("💡 Your ElevenLabs audio is available in the Generated Audio section")
-        st.info("🔧 Please check your HeyGen API plan or try again later")
-        
-        return None
-            
-    except Exception as e:
-        st.error(f"Video generation error: {str(e)}")
-        return None
+        history = st.session_state.get('script_history', [])
+        if history and st.button("↩️ Undo Last Edit", key=f"undo_edit_{revision}"):
+            st.session_state.generated_script = history[-1]
+            st.session_state.script_history = history[:-1]
+            st.rerun()
+    
+    if saved:
+        new_script = dict(script_json, title=title, segments=version_segments(segments, edited))
+        if new_script != script_json:
+            st.session_state.script_history = (history + [script_json])[-SCRIPT_HISTORY_SIZE:]
+            st.session_state.generated_script = new_script
+            st.rerun()
 
 # YouTube upload function using credentials from secrets
 def upload_to_youtube(video_file, title, credentials_dict):
     """
     Upload video to YouTube using credentials from Streamlit secrets
+    Resumable: if the upload is interrupted, uploading the same video again continues where it stopped
     Args:
         video_file: Path to the video file
         title: Video title
         credentials_dict: Dictionary containing YouTube API credentials
     """
+    progress_bar = st.progress(0, text="Uploading to YouTube...")
+    
+    def show_progress(sent, total):
+        progress_bar.progress(min(100, sent * 100 // max(1, total)), text=f"Uploading to YouTube... {sent * 100 // max(1, total)}%")
+    
+    # Per-chunk status messages are covered by the progress bar
+    def notify(level, message):
+        if level == 'warning':
+            st.warning(message)
+        elif level == 'error':
+            st.error(message)
+        elif level != 'status':
+            st.info(message)
+    
     try:
-        # Import required libraries for YouTube upload
-        # from google.oauth2.credentials import Credentials
-        # from googleapiclient.discovery import build
-        # from googleapiclient.http import MediaFileUpload
-        
-        # Create credentials object from secrets
-        # client_config = {
-        #     "web": {
-        #         "client_id": credentials_dict["client_id"],
-        #         "client_secret": credentials_dict["client_secret"],
-        #         "auth_uri": credentials_dict["auth_uri"],
-        #         "token_uri": credentials_dict["token_uri"],
-        #         "redirect_uris": credentials_dict["redirect_uris"]
-        #     }
-        # }
-        
-        # TODO: Implement actual YouTube upload logic here
-        # This would involve OAuth2 flow and video upload
-        
-        # Placeholder return for now
-        return "https://youtube.com/watch?v=placeholder"
+        result = upload_video(video_file, title, credentials_dict, notify=notify, on_progress=show_progress)
+        progress_bar.progress(100, text=f"Uploaded at {result['bytes_per_second'] / (1024 * 1024):.1f} MB/s")
+        return result['url']
         
+    except QuotaExhaustedError as e:
+        st.error(f"YouTube quota reached: {str(e)}")
+        return None
     except Exception as e:
         st.error(f"YouTube upload error: {str(e)}")
         return None
 
+# Id -> record index for a loaded catalog (built once per load, not per rerun)
+def get_catalog_index(index_key, items_key, id_field, name_field):
+    if index_key not in st.session_state:
+        st.session_state[index_key] = CatalogIndex(st.session_state.get(items_key, []), id_field, name_field)
+    return st.session_state[index_key]
+
 # Single line: Load Avatars and Voices button, Select Avatar dropdown, Select Voice dropdown (conditional layout)
 voices_loaded = 'voices_loaded' in st.session_state and st.session_state.voices_loaded
 avatars_loaded = 'avatars_loaded' in st.session_state and st.session_state.avatars_loaded
@@ -686,16 +562,16 @@ if not voices_loaded or not avatars_loaded:
         if st.button("Load Avatars and Voices", key="load_all"):
             if heygen_api_key and elevenlab_api_key:
                 with st.spinner("Loading avatars and voices..."):
-                    # Load avatars
-                    avatars = get_heygen_avatars(heygen_api_key)
+                    # Load both catalogs at once (served from the shared cache when fresh)
+                    avatars, voices = load_avatars_and_voices(heygen_api_key, elevenlab_api_key)
                     if avatars:
                         st.session_state.available_avatars = avatars
+                        st.session_state.avatar_index = CatalogIndex(avatars, 'avatar_id', 'avatar_name')
                         st.session_state.avatars_loaded = True
                     
-                    # Load voices
-                    voices = get_elevenlabs_voices(elevenlab_api_key)
                     if voices:
                         st.session_state.available_voices = voices
+                        st.session_state.voice_index = CatalogIndex(voices, 'voice_id', 'name')
                         st.session_state.voices_loaded = True
                     
                     # Force refresh to show new layout immediately
@@ -711,7 +587,9 @@ else:
         with avatar_col:
             # Avatar dropdown (shows only if loaded successfully)
             if avatars_loaded:
-                avatar_options = [(f"{avatar['avatar_name']}", avatar['avatar_id']) for avatar in st.session_state.available_avatars]
+                avatar_index = get_catalog_index('avatar_index', 'available_avatars', 'avatar_id', 'avatar_name')
+                avatar_query = st.text_input("Search avatars", key="avatar_search", placeholder="Type to filter...")
+                avatar_options = avatar_index.search(avatar_query) if avatar_query else avatar_index.options
                 selected_avatar = st.selectbox(
                     "Select Avatar", 
                     avatar_options,
@@ -724,7 +602,9 @@ else:
         with voice_col:
             # Voice dropdown (shows only if loaded successfully)
             if voices_loaded:
-                voice_options = [(f"{voice['name']}", voice['voice_id']) for voice in st.session_state.available_voices]
+                voice_index = get_catalog_index('voice_index', 'available_voices', 'voice_id', 'name')
+                voice_query = st.text_input("Search voices", key="voice_search", placeholder="Type to filter...")
+                voice_options = voice_index.search(voice_query) if voice_query else voice_index.options
                 selected_voice = st.selectbox(
                     "Select Voice", 
                     voice_options,
@@ -826,11 +706,8 @@ if voices_loaded and avatars_loaded:
                 
                 if st.session_state.get('selected_avatar_id'):
                     # Find selected avatar details
-                    selected_avatar_details = None
-                    for avatar in st.session_state.get('available_avatars', []):
-                        if avatar['avatar_id'] == st.session_state.selected_avatar_id:
-                            selected_avatar_details = avatar
-                            break
+                    avatar_index = get_catalog_index('avatar_index', 'available_avatars', 'avatar_id', 'avatar_name')
+                    selected_avatar_details = avatar_index.get(st.session_state.selected_avatar_id)
                     
                     if selected_avatar_details:
                         # Compact image display
@@ -863,11 +740,8 @@ if voices_loaded and avatars_loaded:
                 
                 if st.session_state.get('selected_voice_id'):
                     # Find selected voice details
-                    selected_voice_details = None
-                    for voice in st.session_state.get('available_voices', []):
-                        if voice['voice_id'] == st.session_state.selected_voice_id:
-                            selected_voice_details = voice
-                            break
+                    voice_index = get_catalog_index('voice_index', 'available_voices', 'voice_id', 'name')
+                    selected_voice_details = voice_index.get(st.session_state.selected_voice_id)
                     
                     if selected_voice_details:
                         # Very compact voice info
@@ -942,7 +816,7 @@ with col_center:
         st.markdown('<div style="margin-top: 28px;"></div>', unsafe_allow_html=True)
         create_video_clicked = st.button(
             "Create Video", 
-            disabled=not content_enabled or not st.session_state.get('generated_audio'), 
+            disabled=not content_enabled or not session_media_path('generated_audio_id'), 
             key="create_video"
         )
     
@@ -950,7 +824,7 @@ with col_center:
         st.markdown('<div style="margin-top: 28px;"></div>', unsafe_allow_html=True)
         upload_video_clicked = st.button(
             "Upload Video", 
-            disabled=not content_enabled or not st.session_state.get('generated_video'),
+            disabled=not content_enabled or not session_media_path('generated_video_id'),
             key="upload_video"
         )
     
@@ -959,8 +833,30 @@ with col_center:
         try:
             prompt = load_prompt()
             samples = load_sample_scripts()
-            script_json = generate_script_gemini(topic, prompt, samples, gemini_api_key)
+            def generate_script():
+                if gemini_streaming:
+                    return stream_script_to_page(topic, prompt, samples, gemini_api_key)
+                return generate_script_gemini(topic, prompt, samples, gemini_api_key)
+            
+            with st.spinner("Generating script..."):
+                script_json, script_source = get_script_cache().get_or_generate(
+                    topic, prompt, samples, generate_script, max_age=script_reuse_hours * 3600
+                )
+            if isinstance(script_json, dict):
+                # Segment versions start at 1; the script editor bumps them as segments are edited
+                script_json = dict(script_json, segments=version_segments([], script_json.get('segments', [])))
             st.session_state.generated_script = script_json
+            st.session_state.script_history = []
+            if script_source == CACHED:
+                st.caption(f"♻️ Reused a script generated for this topic in the last {script_reuse_hours:g} hours")
+            elif script_source == SHARED:
+                st.caption("♻️ Joined a generation of this topic that was already running")
+            else:
+                mode_stats = get_script_modes().stats()
+                st.caption("First-try scripts: " + ", ".join(
+                    f"{mode} {row['first_try_rate']:.0%} of {row['requests']}"
+                    for mode, row in mode_stats.items() if row['requests']
+                ))
             
             # Display generated script
             if isinstance(script_json, dict):
@@ -985,27 +881,61 @@ with col_center:
         except Exception as e:
             st.error(f"Script generation error: {str(e)}")
     
+    # Editable script: edits bump segment versions, and Generate Voice then re-voices only those segments
+    if isinstance(st.session_state.get('generated_script'), dict):
+        show_script_editor()
+    
     # Handle Generate Voice button click
     if generate_voice_clicked and st.session_state.get('generated_script'):
         try:
             voice_id = st.session_state.get('selected_voice_id', 'your_cloned_voice_id')
             script_json = st.session_state.generated_script
             
-            if isinstance(script_json, dict):
+            take = st.session_state.get('voice_take')
+            take_path = session_media_path('generated_audio_id')
+            
+            if isinstance(script_json, dict) and take and take['voice_id'] == voice_id and take['wav_path'] == take_path:
+                # Same voice as the current audio: re-voice only the segments edited since
+                with st.spinner("Updating edited voice segments..."):
+                    media_store = get_media_store()
+                    new_path = media_store.new_path('.wav')
+                    new_take, retake_stats = retake(
+                        VoiceTake.from_dict(take), script_json.get('segments', []), elevenlab_api_key, new_path,
+                        max_in_flight=tts_max_in_flight, cache=get_tts_cache()
+                    )
+                    set_session_media('generated_audio_id', media_store.adopt(media_owner(), new_path))
+                    st.session_state.voice_take = new_take.to_dict()
+                    st.session_state.generated_audio_segments = new_take.segments
+                    st.session_state.audio_ready = True
+                    st.caption(
+                        f"♻️ Re-voiced {retake_stats['resynthesized']} changed segment(s), "
+                        f"reused {retake_stats['reused']}"
+                        + (f", dropped {retake_stats['removed']}" if retake_stats['removed'] else "")
+                    )
+            elif isinstance(script_json, dict):
                 with st.spinner("Generating voice segments..."):
-                    # Generate individual voice segments
-                    audio_segments = generate_voice_segments_with_delays(script_json, elevenlab_api_key, voice_id)
+                    # Generate voice segments, assembled into one timeline as they finish
+                    audio_segments, combined_audio = generate_voice_segments_with_delays(script_json, elevenlab_api_key, voice_id)
                     
                     if audio_segments:
-                        # Store segments for later use
-                        st.session_state.generated_audio_segments = audio_segments
-                        
-                        # Simple concatenation (basic approach)
-                        combined_audio = concatenate_audio_segments(audio_segments)
+                        # Keep segment timing for later use; their audio stays in the TTS cache, not in session state
+                        st.session_state.generated_audio_segments = [
+                            {key: value for key, value in segment.items() if key != 'audio'}
+                            for segment in audio_segments
+                        ]
                         
                         if combined_audio:
-                            st.session_state.generated_audio = combined_audio
+                            audio_filename, _ = audio_file_info(combined_audio)
+                            audio_id = get_media_store().put(media_owner(), combined_audio, os.path.splitext(audio_filename)[1])
+                            set_session_media('generated_audio_id', audio_id)
                             st.session_state.audio_ready = True
+                            # Layout of this audio, so later script edits only re-voice what changed
+                            st.session_state.voice_take = VoiceTake.from_audio_segments(
+                                voice_id, audio_segments, get_media_store().path_for(audio_id)
+                            ).to_dict()
+                            
+                            cache_hits = sum(1 for segment in audio_segments if segment['cached'])
+                            st.caption(f"Voice cache: {cache_hits} hits / {len(audio_segments) - cache_hits} misses")
                         else:
                             st.error("Failed to combine audio segments")
                     else:
@@ -1017,33 +947,75 @@ with col_center:
             st.error(f"Voice generation error: {str(e)}")
     
     # Handle Create Video button click
-    if create_video_clicked and st.session_state.get('generated_audio'):
+    if create_video_clicked and session_media_path('generated_audio_id'):
         try:
             avatar_id = st.session_state.get('selected_avatar_id')
-            audio_bytes = st.session_state.get('generated_audio')
+            audio_media_id = st.session_state.get('generated_audio_id')
             
             if not avatar_id:
                 st.error("Please select an avatar first")
             elif not heygen_api_key:
                 st.error("HeyGen API key not configured")
             else:
-                with st.spinner("Creating video with avatar... This may take a few minutes..."):
-                    video_bytes = generate_video_heygen(audio_bytes, heygen_api_key, avatar_id)
-                    
-                    if video_bytes:
-                        st.session_state.generated_video = video_bytes
-                        st.session_state.video_ready = True
-                        st.success("✅ Video generated successfully!")
-                    else:
-                        st.error("Failed to generate video")
+                # The render runs in the background; keep the job id in the URL so a refresh can pick it up again
+                job_id = submit_render_job(audio_media_id, avatar_id)
+                st.session_state.render_job_id = job_id
+                st.query_params["render_job"] = job_id
                 
         except Exception as e:
             st.error(f"Video generation error: {str(e)}")
     
+    # Show the status of the current render job, including one restored from the URL after a refresh
+    if not st.session_state.get('render_job_id') and st.query_params.get("render_job"):
+        st.session_state.render_job_id = st.query_params["render_job"]
+    if st.session_state.get('render_job_id'):
+        show_render_job_status(st.session_state.render_job_id)
+    
+    # A/B variants: the current script voiced and rendered several ways, compared side by side
+    if content_enabled and isinstance(st.session_state.get('generated_script'), dict):
+        with st.expander("🧪 A/B Variants", expanded=bool(st.session_state.get('variants_job_id'))):
+            voice_index = get_catalog_index('voice_index', 'available_voices', 'voice_id', 'name')
+            avatar_index = get_catalog_index('avatar_index', 'available_avatars', 'avatar_id', 'avatar_name')
+            variant_voices = st.multiselect(
+                "Voices", voice_index.options, format_func=lambda x: x[0], key="variant_voices"
+            )
+            variant_avatars = st.multiselect(
+                "Avatars (none: compare the audio only)", avatar_index.options, format_func=lambda x: x[0],
+                key="variant_avatars"
+            )
+            variant_pairs = [
+                (voice[1], avatar[1]) for voice in variant_voices for avatar in variant_avatars
+            ] or [(voice[1], None) for voice in variant_voices]
+            if variant_pairs:
+                st.caption(
+                    f"{len(variant_pairs)} variants: {len(variant_voices)} voice(s), each synthesized and uploaded once"
+                    + (f", {len(variant_pairs)} renders" if variant_avatars else "")
+                )
+            if len(variant_pairs) > max_variants:
+                st.warning(f"At most {max_variants} variants at a time")
+            
+            if st.button(
+                "Render Variants",
+                disabled=not variant_pairs or len(variant_pairs) > max_variants,
+                key="render_variants"
+            ):
+                if variant_avatars and not heygen_api_key:
+                    st.error("HeyGen API key not configured")
+                else:
+                    st.session_state.variants_job_id = get_job_queue().submit('variants', {
+                        'script': st.session_state.generated_script,
+                        'pairs': variant_pairs
+                    }, owner=media_owner())
+            
+            if st.session_state.get('variants_job_id'):
+                show_variants_job_status(st.session_state.variants_job_id)
+            if st.session_state.get('variants'):
+                show_variant_comparison(st.session_state.variants)
+    
     # Handle Upload Video button click
-    if upload_video_clicked and st.session_state.get('generated_video'):
+    if upload_video_clicked and session_media_path('generated_video_id'):
         try:
-            video_path = st.session_state.get('generated_video')
+            video_path = session_media_path('generated_video_id')
             video_title = st.session_state.get('generated_script', {}).get('title', 'AI Generated Video')
             
             with st.spinner("Uploading to YouTube..."):
@@ -1053,6 +1025,7 @@ with col_center:
                     st.success(f"✅ Video uploaded successfully!")
                     st.markdown(f"**YouTube URL:** [Watch Video]({youtube_url})")
                     st.session_state.video_uploaded = True
+                    st.session_state.youtube_url = youtube_url
                 else:
                     st.error("Failed to upload video to YouTube")
                     
@@ -1060,7 +1033,7 @@ with col_center:
             st.error(f"Upload error: {str(e)}")
 
 # Third line: Generated Audio Player and Download (futuristic design)
-if st.session_state.get('audio_ready', False):
+if st.session_state.get('audio_ready', False) or st.session_state.get('video_ready', False):
     st.markdown('<div style="margin-top: 60px;"></div>', unsafe_allow_html=True)  # Add padding from second line
     
     # Futuristic styling for audio section
@@ -1116,19 +1089,25 @@ if st.session_state.get('audio_ready', False):
             st.markdown('<h3 style="text-align: center; color: #00ffff; margin: 8px 0; font-size: 1rem;">🎵 Generated Audio</h3>', unsafe_allow_html=True)
             
             # Audio player
-            if st.session_state.get('generated_audio'):
-                st.audio(st.session_state.generated_audio, format="audio/mp3")
-                
-                # Download button
-                import base64
-                audio_b64 = base64.b64encode(st.session_state.generated_audio).decode()
-                href = f'data:audio/mp3;base64,{audio_b64}'
+            audio_path = session_media_path('generated_audio_id')
+            if audio_path:
+                with open(audio_path, 'rb') as audio_file:
+                    audio_filename, audio_mime = audio_file_info(audio_file.read(4))
+                download_name = "generated_voice_audio." + audio_filename.rsplit('.', 1)[1]
+                audio_url = get_media_store().url(st.session_state.generated_audio_id)
                 
-                st.markdown(f'''
-                    <a href="{href}" download="generated_voice_audio.mp3" class="download-btn">
-                        💾 Download Audio
-                    </a>
-                ''', unsafe_allow_html=True)
+                if audio_url:
+                    # Played and downloaded straight from the media server
+                    st.audio(audio_url, format=audio_mime)
+                    st.markdown(f'''
+                        <a href="{get_media_store().url(st.session_state.generated_audio_id, download=True)}" download="{download_name}" class="download-btn">
+                            💾 Download Audio
+                        </a>
+                    ''', unsafe_allow_html=True)
+                else:
+                    st.audio(audio_path, format=audio_mime)
+                    with open(audio_path, 'rb') as audio_file:
+                        st.download_button("💾 Download Audio", data=audio_file, file_name=download_name, mime=audio_mime)
             else:
                 st.markdown('<div style="text-align: center; padding: 40px; color: rgba(255,255,255,0.5); font-size: 0.9rem;">Audio will appear here</div>', 
                           unsafe_allow_html=True)
@@ -1139,14 +1118,21 @@ if st.session_state.get('audio_ready', False):
             st.markdown('<div style="border: 2px solid rgba(0, 255, 255, 0.3); border-radius: 10px; padding: 15px; background: rgba(0, 255, 255, 0.05);">', unsafe_allow_html=True)
             st.markdown('<h3 style="text-align: center; color: #00ffff; margin: 8px 0; font-size: 1rem;">🎬 Generated Video</h3>', unsafe_allow_html=True)
             
-            if st.session_state.get('generated_video'):
-                st.video(st.session_state.generated_video)
+            video_path = session_media_path('generated_video_id')
+            if video_path:
+                video_url = get_media_store().url(st.session_state.generated_video_id)
                 
-                st.markdown('''
-                    <a href="#" class="download-btn">
-                        💾 Download Video
-                    </a>
-                ''', unsafe_allow_html=True)
+                if video_url:
+                    st.video(video_url)
+                    st.markdown(f'''
+                        <a href="{get_media_store().url(st.session_state.generated_video_id, download=True)}" download="generated_video.mp4" class="download-btn">
+                            💾 Download Video
+                        </a>
+                    ''', unsafe_allow_html=True)
+                else:
+                    st.video(video_path)
+                    with open(video_path, 'rb') as video_file:
+                        st.download_button("💾 Download Video", data=video_file, file_name="generated_video.mp4", mime="video/mp4")
             else:
                 st.markdown('<div style="text-align: center; padding: 40px; color: rgba(255,255,255,0.5); font-size: 0.9rem;">Video will appear here</div>', 
                           unsafe_allow_html=True)
@@ -1165,6 +1151,28 @@ if st.session_state.get('audio_ready', False):
                 st.markdown('<div style="text-align: center; padding: 40px; color: rgba(255,255,255,0.5); font-size: 0.9rem;">Upload status will appear here</div>', 
                           unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
+# Per-stage latency over recent runs in this process
+with st.expander("⏱️ Pipeline timings", expanded=False):
+    stage_stats = tracing.stage_stats()
+    if stage_stats:
+        st.dataframe(
+            [
+                {
+                    "Stage": name,
+                    "Runs": stats["count"],
+                    "Errors": stats["errors"],
+                    "p50 (ms)": stats["p50_ms"],
+                    "p95 (ms)": stats["p95_ms"],
+                    "Max (ms)": stats["max_ms"]
+                }
+                for name, stats in stage_stats.items()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("Timings appear here after the first script, voice or video run")
+
 # Footer
 st.markdown("---")
 st.caption("AI Video Maker - Powered by Gemini, ElevenLabs, HeyGen & YouTube APIs")
@@ -5,9 +5,10 @@ Simple topic → video → upload workflow
 
 import streamlit as st
 import os
-import docx
 import requests
 
+from utils.assets import load_prompt, load_sample_scripts
+
 # Page config
 st.set_page_config(
     page_title="AI Video Maker",
@@ -70,21 +71,6 @@ with col_c:
     if st.button("Load Voices", help="Load available ElevenLabs voices"):
         st.success("Voices loaded!")
 
-# Load prompt.txt
-def load_prompt():
-    with open("assets/prompt.txt", encoding="utf-8") as f:
-        return f.read()
-
-# Load sample_scripts.docx
-def load_sample_scripts():
-    doc = docx.Document("assets/sample_scripts.docx")
-    scripts = []
-    for para in doc.paragraphs:
-        text = para.text.strip()
-        if text:
-            scripts.append(text)
-    return "\n".join(scripts)
-
 # Gemini API call
 def generate_script_gemini(topic, prompt, samples, api_key):
     url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key=" + api_key
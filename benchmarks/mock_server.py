@@ -0,0 +1,542 @@
+"""
+Local stand-in for the Gemini, ElevenLabs, HeyGen and YouTube endpoints the app uses
+Each provider is served under its own path prefix (http://host:port/gemini, ...)
+so point_clients_at() can route every provider here without them sharing a
+rate limiter. Latency, error rate and payload sizes are configurable per endpoint.
+
+Run standalone:
+    python -m benchmarks.mock_server --port 8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from utils import api_client
+
+# Endpoint names used as keys for latency / error_rate settings
+ENDPOINTS = (
+    'generate_content', 'stream_generate_content', 'cached_contents', 'text_to_speech', 'voices', 'avatars',
+    'assets_upload', 'video_generate', 'video_status', 'video_download', 'youtube_token', 'youtube_upload'
+)
+
+DEFAULT_CONFIG = {
+    # Seconds added to every response, per endpoint (missing endpoints: 0)
+    'latency': {
+        'generate_content': 1.5,
+        'stream_generate_content': 1.5,
+        'cached_contents': 0.5,
+        'text_to_speech': 0.4,
+        'voices': 0.2,
+        'avatars': 0.3,
+        'assets_upload': 0.3,
+        'video_generate': 0.3,
+        'video_status': 0.05,
+        'video_download': 0.05,
+        'youtube_token': 0.1,
+        'youtube_upload': 0.05
+    },
+    # +/- fraction of random variation applied to each latency
+    'latency_jitter': 0.2,
+    # Fraction of requests per endpoint answered with error_status
+    'error_rate': {},
+    'error_status': 429,
+    # Retry-After sent with 429/503 errors, seconds
+    'retry_after': 0.2,
+    # Script shape returned by Gemini
+    'segments': 8,
+    'words_per_segment': 20,
+    # Context caching: prefixes shorter than this are refused with a 400 (like the
+    # real minimum token count), and requests that reference a cache get this
+    # fraction of the normal latency
+    'context_cache_min_chars': 0,
+    'cached_latency_factor': 0.6,
+    # Chunks a streamed script is split into
+    'stream_chunks': 12,
+    # Fraction of scripts with typical model slips (markdown fence, trailing commas),
+    # and of scripts cut off partway with finishReason MAX_TOKENS
+    'defect_rate': 0.0,
+    'truncate_rate': 0.0,
+    # Whether generationConfig.responseSchema is accepted (JSON mode answers never have the slips above)
+    'response_schema': True,
+    # Raw 24 kHz 16-bit PCM returned per character of TTS text (~ 15 chars/second of speech)
+    'tts_bytes_per_char': 3200,
+    'catalog_size': 200,
+    # HeyGen render time from video/generate to 'completed', seconds
+    'render_seconds': 3.0,
+    'video_bytes': 5 * 1024 * 1024,
+    # Fraction of YouTube upload chunks of which only the first half is stored
+    # (acknowledged with a shorter Range, as the real API may do)
+    'upload_partial_rate': 0.0
+}
+
+_WORDS = ("aaj hum baat karenge technology future pakistan log zindagi kaam "
+          "naya tareeqa seekhna dunya badal rahi hai").split()
+
+
+def _merge_config(overrides):
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class MockState:
+    """Server-side state shared by all handler threads: renders and request counts"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.renders = {}
+        self.cached_contents = {}
+        # upload_id -> {'total': bytes expected, 'received': bytes stored}
+        self.uploads = {}
+        self.requests = {}
+        self.errors = {}
+        self.bytes_received = 0
+
+    def count(self, endpoint, error=False):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if error:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'errors': dict(self.errors), 'bytes_received': self.bytes_received}
+
+
+def _script(topic, config):
+    segments = []
+    cursor = 0
+    for index in range(config['segments']):
+        words = [random.choice(_WORDS) for _ in range(config['words_per_segment'])]
+        duration = max(1, config['words_per_segment'] // 3)
+        segments.append({
+            'start_time': cursor,
+            'end_time': cursor + duration,
+            'text': f"{index + 1}. " + " ".join(words),
+            'delay_after': 0.5 if index % 2 else 0
+        })
+        cursor += duration + 1
+    return {'title': f"{topic} - benchmark script", 'segments': segments}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockAPI/1.0"
+
+    # Quiet by default; the benchmark reports its own numbers
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    @property
+    def config(self):
+        return self.server.state.config
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = parse_qs(parts.query)
+        routes = [
+            ('POST', r'^/gemini/v1beta/models/[^/]+:generateContent$', 'generate_content', self._generate_content),
+            ('POST', r'^/gemini/v1beta/models/[^/]+:streamGenerateContent$', 'stream_generate_content', self._stream_generate_content),
+            ('POST', r'^/gemini/v1beta/cachedContents$', 'cached_contents', self._create_cached_content),
+            ('DELETE', r'^/gemini/v1beta/cachedContents/[^/]+$', 'cached_contents', self._delete_cached_content),
+            ('POST', r'^/elevenlabs/v1/text-to-speech/[^/]+$', 'text_to_speech', self._text_to_speech),
+            ('GET', r'^/elevenlabs/v1/voices$', 'voices', self._voices),
+            ('GET', r'^/heygen/v2/avatars$', 'avatars', self._avatars),
+            ('POST', r'^/heygen/v1/assets/upload$', 'assets_upload', self._assets_upload),
+            ('POST', r'^/heygen/v2/assets$', 'assets_upload', self._assets_upload),
+            ('POST', r'^/heygen/v2/video/generate$', 'video_generate', self._video_generate),
+            ('GET', r'^/heygen/v1/video_status\.get$', 'video_status', self._video_status),
+            ('GET', r'^/cdn/videos/[^/]+\.mp4$', 'video_download', self._video_download),
+            ('POST', r'^/youtube/oauth2/token$', 'youtube_token', self._youtube_token),
+            ('POST', r'^/youtube/upload/youtube/v3/videos$', 'youtube_upload', self._youtube_start_upload),
+            ('PUT', r'^/youtube/upload/youtube/v3/videos$', 'youtube_upload', self._youtube_upload_chunk)
+        ]
+        for method, pattern, endpoint, handler in routes:
+            if method == self.command and re.match(pattern, path):
+                return endpoint, handler, path, query
+        return None, None, path, query
+
+    def _handle(self):
+        endpoint, handler, path, query = self._route()
+        body = self._read_body()
+        if handler is None:
+            self._send_json(404, {'error': {'message': f"No mock for {self.command} {path}"}})
+            return
+
+        latency = self.config['latency'].get(endpoint, 0)
+        if endpoint in ('generate_content', 'stream_generate_content') and b'"cachedContent"' in body:
+            latency *= self.config['cached_latency_factor']
+        if latency:
+            jitter = self.config['latency_jitter']
+            time.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+
+        if random.random() < self.config['error_rate'].get(endpoint, 0):
+            self.state.count(endpoint, error=True)
+            status = self.config['error_status']
+            headers = {'Retry-After': str(self.config['retry_after'])} if status in (429, 503) else {}
+            self._send_json(status, {'error': {'message': 'Injected mock error'}}, headers)
+            return
+
+        self.state.count(endpoint)
+        handler(path, query, body)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        received = 0
+        chunks = []
+        while received < length:
+            chunk = self.rfile.read(min(256 * 1024, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+            # Only JSON bodies are kept; uploads are counted and dropped
+            if 'json' in (self.headers.get('Content-Type') or ''):
+                chunks.append(chunk)
+        with self.state.lock:
+            self.state.bytes_received += received
+        return b''.join(chunks)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json', headers)
+
+    def _base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    # --- Gemini
+
+    def _prompt_topic(self, body):
+        try:
+            text = json.loads(body)['contents'][0]['parts'][0]['text']
+        except (ValueError, KeyError, IndexError):
+            return 'topic'
+        # With a cached prefix the text starts with the topic itself
+        match = re.search(r'Video Topic:\s*(.+)', text)
+        lines = (match.group(1) if match else text).strip().splitlines()
+        return lines[0] if lines else 'topic'
+
+    def _cache_missing(self, body):
+        # A request referencing an unknown or expired cache gets a 404, like Gemini
+        try:
+            name = json.loads(body).get('cachedContent')
+        except ValueError:
+            return False
+        if not name:
+            return False
+        with self.state.lock:
+            expires_at = self.state.cached_contents.get(name)
+        if expires_at is None or expires_at < time.monotonic():
+            self._send_json(404, {'error': {'message': f"CachedContent not found: {name}"}})
+            return True
+        return False
+
+    def _schema_refused(self, body):
+        # Models without JSON mode reject the schema with a 400, like Gemini
+        try:
+            generation_config = json.loads(body).get('generationConfig', {})
+        except ValueError:
+            return False
+        if 'responseSchema' not in generation_config or self.config['response_schema']:
+            return False
+        self._send_json(400, {'error': {'message': 'Invalid JSON payload received. Unknown name "responseSchema"'}})
+        return True
+
+    def _create_cached_content(self, path, query, body):
+        try:
+            request = json.loads(body)
+            ttl = float(str(request.get('ttl', '3600s')).rstrip('s'))
+            size = sum(len(part.get('text', '')) for content in request['contents'] for part in content['parts'])
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': {'message': 'Invalid cachedContents request'}})
+            return
+        if size < self.config['context_cache_min_chars']:
+            self._send_json(400, {'error': {'message': 'Cached content is too small'}})
+            return
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        with self.state.lock:
+            self.state.cached_contents[name] = time.monotonic() + ttl
+        self._send_json(200, {'name': name, 'model': request.get('model')})
+
+    def _delete_cached_content(self, path, query, body):
+        with self.state.lock:
+            self.state.cached_contents.pop(path.split('/v1beta/', 1)[1], None)
+        self._send_json(200, {})
+
+    def _script_text(self, body):
+        """(model text, finishReason): a script, or the rest of one when the request continues a cut-off answer"""
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = {}
+        contents = request.get('contents', [])
+        json_mode = request.get('generationConfig', {}).get('responseMimeType') == 'application/json'
+        model_turns = [content for content in contents if content.get('role') == 'model']
+        if model_turns:
+            try:
+                done = len(json.loads(model_turns[-1]['parts'][0]['text'])['segments'])
+            except (ValueError, KeyError, IndexError, TypeError):
+                done = 0
+            rest = _script('continuation', self.config)['segments'][done:]
+            return json.dumps({'segments': rest}, ensure_ascii=False), 'STOP'
+
+        text = json.dumps(_script(self._prompt_topic(body), self.config), ensure_ascii=False, indent=2)
+        if not json_mode and random.random() < self.config['defect_rate']:
+            text = "```json\n" + re.sub(r'(\}|\d)\n', r'\1,\n', text) + "\n```"
+        if random.random() < self.config['truncate_rate']:
+            return text[:int(len(text) * 0.6)], 'MAX_TOKENS'
+        return text, 'STOP'
+
+    def _generate_content(self, path, query, body):
+        if self._cache_missing(body) or self._schema_refused(body):
+            return
+        script, finish_reason = self._script_text(body)
+        self._send_json(200, {'candidates': [{'content': {'parts': [{'text': script}]}, 'finishReason': finish_reason}]})
+
+    def _stream_generate_content(self, path, query, body):
+        if self._cache_missing(body) or self._schema_refused(body):
+            return
+        script, finish_reason = self._script_text(body)
+        pieces = max(1, self.config['stream_chunks'])
+        size = -(-len(script) // pieces)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        # The configured latency was time to first byte; spread a little more over the chunks
+        delay = self.config['latency'].get('stream_generate_content', 0) / pieces
+        for start in range(0, len(script), size):
+            event = {'candidates': [{'content': {'parts': [{'text': script[start:start + size]}]}}]}
+            if start + size >= len(script):
+                event['candidates'][0]['finishReason'] = finish_reason
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    # --- ElevenLabs
+
+    def _text_to_speech(self, path, query, body):
+        try:
+            text = json.loads(body).get('text', '')
+        except ValueError:
+            text = ''
+        size = len(text) * self.config['tts_bytes_per_char']
+        size -= size % 2
+        content_type = 'audio/pcm' if query.get('output_format', [''])[0].startswith('pcm') else 'audio/mpeg'
+        self._send(200, bytes(size), content_type)
+
+    def _catalog_etag(self, name):
+        return '"' + hashlib.sha1(f"{name}:{self.config['catalog_size']}".encode()).hexdigest()[:16] + '"'
+
+    def _catalog(self, name, data):
+        etag = self._catalog_etag(name)
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', 'application/json', {'ETag': etag})
+            return
+        self._send_json(200, data, {'ETag': etag})
+
+    def _voices(self, path, query, body):
+        voices = [
+            {'voice_id': f"voice-{i}", 'name': f"Voice {i}", 'category': 'generated'}
+            for i in range(self.config['catalog_size'])
+        ]
+        self._catalog('voices', {'voices': voices})
+
+    def _avatars(self, path, query, body):
+        avatars = [
+            {'avatar_id': f"avatar-{i}", 'avatar_name': f"Avatar {i}", 'gender': 'female' if i % 2 else 'male'}
+            for i in range(self.config['catalog_size'])
+        ]
+        self._catalog('avatars', {'data': {'avatars': avatars}})
+
+    # --- HeyGen
+
+    def _assets_upload(self, path, query, body):
+        self._send_json(200, {'data': {'id': uuid.uuid4().hex}})
+
+    def _video_generate(self, path, query, body):
+        video_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.renders[video_id] = time.monotonic() + self.config['render_seconds']
+        self._send_json(200, {'data': {'video_id': video_id}})
+
+    def _video_status(self, path, query, body):
+        video_id = query.get('video_id', [''])[0]
+        with self.state.lock:
+            ready_at = self.state.renders.get(video_id)
+        if ready_at is None:
+            self._send_json(200, {'data': {'status': 'failed', 'error': 'unknown video_id'}})
+        elif time.monotonic() < ready_at:
+            self._send_json(200, {'data': {'status': 'processing'}})
+        else:
+            self._send_json(200, {'data': {'status': 'completed', 'video_url': f"{self._base()}/cdn/videos/{video_id}.mp4"}})
+
+    def _video_download(self, path, query, body):
+        total = self.config['video_bytes']
+        start = 0
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            if start >= total:
+                self._send(416, b'', 'video/mp4', {'Content-Range': f"bytes */{total}"})
+                return
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(total - start))
+        if start:
+            self.send_header('Content-Range', f"bytes {start}-{total - 1}/{total}")
+        self.end_headers()
+        block = bytes(256 * 1024)
+        remaining = total - start
+        while remaining > 0:
+            chunk = block[:min(len(block), remaining)]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+    # --- YouTube
+
+    def _youtube_token(self, path, query, body):
+        self._send_json(200, {'access_token': uuid.uuid4().hex, 'expires_in': 3600, 'token_type': 'Bearer'})
+
+    def _youtube_start_upload(self, path, query, body):
+        # Resumable protocol only: the session URI comes back in Location
+        total = self.headers.get('X-Upload-Content-Length')
+        if query.get('uploadType', [''])[0] != 'resumable' or not (total or '').isdigit():
+            self._send_json(400, {'error': {'message': 'Expected a resumable upload with X-Upload-Content-Length'}})
+            return
+        upload_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.uploads[upload_id] = {'total': int(total), 'received': 0}
+        location = f"{self._base()}/youtube/upload/youtube/v3/videos?uploadType=resumable&upload_id={upload_id}"
+        self._send_json(200, {}, {'Location': location})
+
+    def _youtube_upload_chunk(self, path, query, body):
+        upload_id = query.get('upload_id', [''])[0]
+        match = re.match(r'bytes (?:(\d+)-(\d+)|\*)/(\d+)$', self.headers.get('Content-Range') or '')
+        with self.state.lock:
+            upload = self.state.uploads.get(upload_id)
+            if upload is None:
+                status = 404
+            elif match is None or int(match.group(3)) != upload['total']:
+                status = 400
+            else:
+                status = None
+                if match.group(1) is not None:
+                    start, end = int(match.group(1)), int(match.group(2))
+                    length = int(self.headers.get('Content-Length') or 0)
+                    # A chunk starting past what was stored is ignored; the client resends from Range
+                    if start <= upload['received'] and length == end - start + 1:
+                        if random.random() < self.config['upload_partial_rate'] and end + 1 < upload['total']:
+                            end = start + length // 2 - 1
+                        upload['received'] = max(upload['received'], end + 1)
+                received = upload['received']
+                done = received >= upload['total']
+        if status is not None:
+            self._send_json(status, {'error': {'message': 'Unknown upload session' if status == 404 else 'Bad Content-Range'}})
+        elif done:
+            self._send_json(200, {'id': upload_id[:11], 'kind': 'youtube#video', 'status': {'uploadStatus': 'uploaded'}})
+        else:
+            self._send(308, b'', 'text/plain', {'Range': f"bytes=0-{received - 1}"} if received else {})
+
+
+class MockServer:
+    """
+    Threaded mock API server, usable as a context manager:
+
+        with MockServer({'render_seconds': 1}) as server:
+            server.point_clients_at()
+            ...
+    """
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = _merge_config(config)
+        self.state = MockState(self.config)
+        self._httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.state = self.state
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def point_clients_at(self):
+        """Route every provider in api_client to this server"""
+        for provider in api_client.BASE_URLS:
+            api_client.set_base_url(provider, f"{self.url}/{provider}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        for provider in api_client.BASE_URLS:
+            api_client.set_base_url(provider)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve mock Gemini/ElevenLabs/HeyGen/YouTube APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--config", help="JSON file overriding DEFAULT_CONFIG")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            config = json.load(f)
+    server = MockServer(config, host=args.host, port=args.port)
+    print(f"Mock APIs on {server.url} - set e.g. GEMINI_BASE_URL={server.url}/gemini")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Offline benchmark suite
+Runs each pipeline stage, full batch runs and parallel YouTube uploads against
+the local mock APIs and reports latency (p50/p95 per stage) and throughput. No
+real API is called.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --batch-sizes 1,10 --latency-scale 0.5 --error-rate 0.05
+    python -m benchmarks.run --config slow_heygen.json --out report.json
+    python -m benchmarks.run --iterations 0 --batch-sizes '' --uploads 8 --upload-mb 20
+    python -m benchmarks.run --iterations 0 --batch-sizes '' --uploads 0 --script-modes 50 --defect-rate 0.3
+
+--config takes a JSON file of mock server settings (see DEFAULT_CONFIG in
+benchmarks/mock_server.py), e.g. {"latency": {"text_to_speech": 1.2}}.
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.mock_server import DEFAULT_CONFIG, ENDPOINTS, MockServer
+from utils import api_client, ratelimit, tracing
+from utils.assets import load_prompt, load_sample_scripts
+from utils.batch import BatchRunner
+from utils.catalog import fetch_avatars, fetch_voices
+from utils.gemini import (PROMPT_MODE, SCHEMA_MODE, generate_script_gemini, get_script_modes, set_response_schema,
+                          stream_script_gemini)
+from utils.heygen import generate_video_heygen, set_render_estimate
+from utils.pipeline import SegmentPipeline
+from utils.youtube import QuotaBudget, upload_many
+
+logger = logging.getLogger(__name__)
+
+API_KEYS = {'gemini': 'bench', 'elevenlabs': 'bench', 'heygen': 'bench'}
+YOUTUBE_CREDENTIALS = {'access_token': 'bench'}
+VOICE_ID = "voice-0"
+AVATAR_ID = "avatar-0"
+
+# Limits high enough that the mock, not the limiter, is what gets measured
+UNTHROTTLED = {'rate': 1000.0, 'burst': 1000, 'max_concurrent': 64}
+
+
+def _summary(prefix):
+    return {
+        name[len(prefix):]: stats
+        for name, stats in tracing.stage_stats().items()
+        if name.startswith(prefix)
+    }
+
+
+def _timed(name, iterations, func):
+    """
+    Run func iterations times, each inside a bench.<name> span; returns ops/second
+    Failures (e.g. injected errors) are recorded on the span and counted, not raised
+    """
+    started = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            with tracing.span(f"bench.{name}"):
+                func()
+        except Exception as e:
+            logger.info("%s failed: %s", name, e)
+    elapsed = time.perf_counter() - started
+    return round(iterations / elapsed, 3) if elapsed else None
+
+
+def _require_script(script_json):
+    if not isinstance(script_json, dict):
+        raise RuntimeError(str(script_json))
+    return script_json
+
+
+def run_stages(iterations, tts_max_in_flight, work_dir):
+    """Each stage on its own, sequentially; returns {stage: stats}"""
+    tracing.clear()
+    prompt, samples = load_prompt(), load_sample_scripts()
+    # A script to voice; retried because the mock may be injecting errors
+    for attempt in range(10):
+        script = generate_script_gemini("benchmark", prompt, samples, API_KEYS['gemini'])
+        if isinstance(script, dict):
+            break
+    script = _require_script(script)
+    throughput = {}
+
+    throughput['gemini.generate'] = _timed('gemini.generate', iterations, lambda: _require_script(
+        generate_script_gemini("benchmark", prompt, samples, API_KEYS['gemini'])
+    ))
+
+    def consume_stream():
+        for event in stream_script_gemini("benchmark", prompt, samples, API_KEYS['gemini']):
+            if event['type'] == 'error':
+                raise RuntimeError(event['message'])
+
+    throughput['gemini.stream'] = _timed('gemini.stream', iterations, consume_stream)
+    throughput['catalog.voices'] = _timed('catalog.voices', iterations, lambda: fetch_voices(API_KEYS['elevenlabs']))
+    throughput['catalog.avatars'] = _timed('catalog.avatars', iterations, lambda: fetch_avatars(API_KEYS['heygen']))
+
+    pipeline = SegmentPipeline(API_KEYS['elevenlabs'], VOICE_ID, max_in_flight=tts_max_in_flight)
+    audio = {}
+
+    def voice():
+        audio['wav'] = pipeline.run(script['segments'])[1]
+
+    throughput['voice.pipeline'] = _timed('voice.pipeline', iterations, voice)
+
+    def render():
+        path = generate_video_heygen(
+            audio['wav'], API_KEYS['heygen'], AVATAR_ID,
+            notify=lambda level, message: None,
+            video_path=os.path.join(work_dir, 'stage-video.mp4')
+        )
+        if not path:
+            raise RuntimeError("HeyGen render failed")
+
+    # Renders are dominated by the mock's render_seconds, so fewer iterations
+    throughput['heygen.render'] = _timed('heygen.render', max(1, iterations // 4), render)
+
+    return {
+        'throughput_per_second': throughput,
+        'latency': _summary('bench.'),
+        'spans': _summary('')
+    }
+
+
+def run_batch(size, render_workers, tts_max_in_flight, work_dir):
+    """Full topic -> video runs through BatchRunner; returns wall time and per-topic stats"""
+    tracing.clear()
+    topics = [{'topic': f"Benchmark topic {i + 1}"} for i in range(size)]
+    runner = BatchRunner(
+        API_KEYS, VOICE_ID, AVATAR_ID,
+        os.path.join(work_dir, f"batch-{size}"),
+        render_workers=render_workers,
+        tts_max_in_flight=tts_max_in_flight
+    )
+    started = time.perf_counter()
+    results = runner.run(topics)
+    elapsed = time.perf_counter() - started
+    failed = [job for job in results if job['status'] == 'failed']
+    return {
+        'topics': size,
+        'failed': len(failed),
+        'wall_seconds': round(elapsed, 3),
+        'topics_per_minute': round(size / elapsed * 60, 2) if elapsed else None,
+        'stages': _summary('batch.'),
+        'spans': _summary('')
+    }
+
+
+def run_uploads(count, size_mb, workers, work_dir):
+    """count videos of size_mb uploaded in parallel; returns throughput and per-chunk stats"""
+    tracing.clear()
+    size = int(size_mb * 1024 * 1024)
+    videos = []
+    for index in range(count):
+        path = os.path.join(work_dir, f"upload-{index}.mp4")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        videos.append({'path': path, 'title': f"Benchmark upload {index + 1}"})
+
+    # A budget of its own: the benchmark must not use up (or be stopped by) the real daily count
+    quota = QuotaBudget(os.path.join(work_dir, 'youtube_quota.json'), daily_units=float('inf'))
+    started = time.perf_counter()
+    results = upload_many(videos, YOUTUBE_CREDENTIALS, max_workers=workers, quota=quota)
+    elapsed = time.perf_counter() - started
+    done = [result for result in results if result['status'] == 'done']
+    return {
+        'uploads': count,
+        'failed': count - len(done),
+        'bytes': size * len(done),
+        'wall_seconds': round(elapsed, 3),
+        'mb_per_second': round(size * len(done) / elapsed / (1024 * 1024), 2) if elapsed else None,
+        'per_upload_mb_per_second': [
+            round(result['bytes_per_second'] / (1024 * 1024), 2) for result in done if result['bytes_per_second']
+        ],
+        'spans': _summary('youtube.')
+    }
+
+
+def run_script_modes(count):
+    """
+    count script requests in JSON mode (responseSchema), then count in prompt-only
+    mode; returns per mode the outcome counts, first-try success rate and latency
+    """
+    prompt, samples = load_prompt(), load_sample_scripts()
+    script_modes = get_script_modes()
+    results = {}
+    try:
+        for mode in (SCHEMA_MODE, PROMPT_MODE):
+            set_response_schema(mode == SCHEMA_MODE)
+            script_modes.clear()
+            tracing.clear()
+            started = time.perf_counter()
+            for index in range(count):
+                generate_script_gemini(f"modes {index}", prompt, samples, API_KEYS['gemini'])
+            elapsed = time.perf_counter() - started
+            results[mode] = dict(
+                script_modes.stats()[mode],
+                wall_seconds=round(elapsed, 3),
+                spans=_summary('gemini.')
+            )
+    finally:
+        set_response_schema(True)
+    return results
+
+
+def _print_table(title, stats):
+    print(f"\n{title}")
+    print(f"  {'stage':<28}{'n':>6}{'err':>6}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}")
+    for name, row in stats.items():
+        print(f"  {name:<28}{row['count']:>6}{row['errors']:>6}{row['p50_ms']:>11}{row['p95_ms']:>11}{row['max_ms']:>11}")
+
+
+def _mock_config(args):
+    config = {}
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            config = json.load(f)
+    if args.latency_scale != 1.0:
+        latency = dict(DEFAULT_CONFIG['latency'], **config.get('latency', {}))
+        config['latency'] = {name: value * args.latency_scale for name, value in latency.items()}
+    if args.error_rate:
+        # Downloads are excluded: their retry path is Range resume, not tested here
+        config['error_rate'] = dict(
+            {name: args.error_rate for name in ENDPOINTS if name != 'video_download'},
+            **config.get('error_rate', {})
+        )
+    for key in ('render_seconds', 'segments'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    if args.video_mb is not None:
+        config['video_bytes'] = int(args.video_mb * 1024 * 1024)
+    for key in ('defect_rate', 'truncate_rate'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local mock APIs")
+    parser.add_argument("--batch-sizes", default="1,10,100", help="Comma-separated topic counts ('' to skip)")
+    parser.add_argument("--iterations", type=int, default=10, help="Runs per stage benchmark (0 to skip)")
+    parser.add_argument("--render-workers", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=4, help="Videos in the YouTube upload benchmark (0 to skip)")
+    parser.add_argument("--upload-mb", type=float, default=16, help="Size of each uploaded video")
+    parser.add_argument("--upload-workers", type=int, default=2)
+    parser.add_argument("--script-modes", type=int, default=20,
+                        help="Script requests per mode in the JSON vs prompt-only comparison (0 to skip)")
+    parser.add_argument("--tts-max-in-flight", type=int, default=4)
+    parser.add_argument("--config", help="JSON file of mock server settings")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every mock latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Error fraction for every endpoint")
+    parser.add_argument("--render-seconds", type=float, help="Mock HeyGen render time")
+    parser.add_argument("--segments", type=int, help="Segments per mock script")
+    parser.add_argument("--video-mb", type=float, help="Mock video size")
+    parser.add_argument("--defect-rate", type=float, help="Fraction of prompt-only scripts with JSON slips")
+    parser.add_argument("--truncate-rate", type=float, help="Fraction of scripts cut off at maxOutputTokens")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="Keep the default per-provider rate limits instead of lifting them")
+    parser.add_argument("--out", default="benchmark_report.json", help="JSON report path")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+    out_path = os.path.abspath(args.out)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size.strip()]
+
+    if not args.real_limits:
+        ratelimit.configure_all({provider: UNTHROTTLED for provider in ratelimit.DEFAULT_LIMITS})
+
+    report = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args)}
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir, MockServer(_mock_config(args)) as server:
+        # Run inside the temp dir so .cache/ state (upload strategy memory, media) stays out of the project
+        os.chdir(work_dir)
+        try:
+            server.point_clients_at()
+            report['mock_config'] = server.config
+            # Mock renders take a fixed time, whatever the audio length
+            set_render_estimate(server.config['render_seconds'], 0)
+
+            if args.iterations:
+                report['stages'] = run_stages(args.iterations, args.tts_max_in_flight, work_dir)
+                _print_table("Stages (sequential)", report['stages']['latency'])
+                print("  throughput/s:", report['stages']['throughput_per_second'])
+
+            report['batches'] = []
+            for size in batch_sizes:
+                result = run_batch(size, args.render_workers, args.tts_max_in_flight, work_dir)
+                report['batches'].append(result)
+                _print_table(
+                    f"Batch of {size}: {result['wall_seconds']} s, {result['topics_per_minute']} topics/min, "
+                    f"{result['failed']} failed",
+                    result['stages']
+                )
+
+            if args.uploads:
+                report['uploads'] = run_uploads(args.uploads, args.upload_mb, args.upload_workers, work_dir)
+                uploads = report['uploads']
+                _print_table(
+                    f"YouTube uploads: {uploads['uploads']} x {args.upload_mb} MB in {uploads['wall_seconds']} s, "
+                    f"{uploads['mb_per_second']} MB/s, {uploads['failed']} failed",
+                    uploads['spans']
+                )
+
+            if args.script_modes:
+                report['script_modes'] = run_script_modes(args.script_modes)
+                print("\nScript modes (first response)")
+                print(f"  {'mode':<10}{'n':>6}{'clean':>7}{'repaired':>10}{'continued':>11}{'failed':>8}{'first try':>11}{'s':>9}")
+                for mode, row in report['script_modes'].items():
+                    print(f"  {mode:<10}{row['requests']:>6}{row['clean']:>7}{row['repaired']:>10}{row['continued']:>11}"
+                          f"{row['failed']:>8}{str(row['first_try_rate']):>11}{row['wall_seconds']:>9}")
+
+            report['mock_server'] = server.state.stats()
+            report['rate_limits'] = ratelimit.stats()
+        finally:
+            os.chdir(original_dir)
+            api_client.close_sessions()
+
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
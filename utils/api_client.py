@@ -0,0 +1,140 @@
+"""
+Shared HTTP client for all external APIs
+One pooled keep-alive session per host, default timeouts, retry adapters, and
+overridable base URLs so every provider can be pointed at a local fake server
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import ratelimit
+
+# Production base URLs; override with set_base_url() or <PROVIDER>_BASE_URL env vars
+BASE_URLS = {
+    'gemini': "https://generativelanguage.googleapis.com",
+    'elevenlabs': "https://api.elevenlabs.io",
+    'heygen': "https://api.heygen.com",
+    'youtube': "https://www.googleapis.com"
+}
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 120)
+
+# Connections kept alive per host; enough for concurrent TTS segments and batch workers
+POOL_SIZE = 16
+
+_lock = threading.Lock()
+_sessions = {}
+_base_urls = dict(BASE_URLS)
+_timeout = DEFAULT_TIMEOUT
+
+
+def _retry_policy():
+    # Connection-level failures are always safe to retry. Status-based retries are
+    # limited to idempotent methods, so a POST that starts a render or bills a
+    # synthesis is never sent twice by this layer
+    return Retry(
+        total=3,
+        connect=3,
+        read=2,
+        status=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD', 'PUT', 'OPTIONS']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=_retry_policy())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_for(url):
+    """The pooled session for url's scheme and host"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _new_session()
+        return session
+
+
+def _base_url(provider):
+    env_override = os.environ.get(f"{provider.upper()}_BASE_URL")
+    with _lock:
+        return (env_override or _base_urls[provider]).rstrip('/')
+
+
+def api_url(provider, path):
+    """Full URL for a provider endpoint, honouring base URL overrides"""
+    return _base_url(provider) + path
+
+
+def provider_for(url):
+    """The provider whose API url belongs to, or None (e.g. for CDN downloads)"""
+    for provider in BASE_URLS:
+        base_url = _base_url(provider)
+        if url == base_url or url.startswith(base_url + '/'):
+            return provider
+    return None
+
+
+def set_base_url(provider, base_url=None):
+    """
+    Point a provider at another server (e.g. a local fake); None restores the default
+    """
+    with _lock:
+        _base_urls[provider] = base_url or BASE_URLS[provider]
+
+
+def set_timeout(timeout):
+    """Default timeout for requests that don't pass one: seconds or (connect, read)"""
+    global _timeout
+    _timeout = timeout
+
+
+def close_sessions():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request on the pooled session for url. Provider API calls wait for
+    their provider's shared rate limiter first and report the response back to
+    it (for streamed responses, until the headers arrive)
+    """
+    kwargs.setdefault('timeout', _timeout)
+    limiter = ratelimit.limiter_for(provider_for(url))
+    if limiter is None:
+        return session_for(url).request(method, url, **kwargs)
+    with limiter.slot():
+        response = session_for(url).request(method, url, **kwargs)
+        limiter.observe(response.status_code, response.headers)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
@@ -0,0 +1,80 @@
+"""
+Prompt and sample-script loading
+Parsed assets are kept in process memory and re-read only when the file changes
+"""
+
+import hashlib
+import os
+import threading
+
+import docx
+
+from utils import tracing
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+PROMPT_PATH = os.path.join(ASSETS_DIR, "prompt.txt")
+SAMPLES_PATH = os.path.join(ASSETS_DIR, "sample_scripts.docx")
+
+_lock = threading.Lock()
+# path -> {'stat': (mtime_ns, size), 'hash': sha256, 'value': parsed content}
+_cache = {}
+
+
+def _read_prompt(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _read_samples(path):
+    doc = docx.Document(path)
+    scripts = []
+    for para in doc.paragraphs:
+        text = para.text.strip()
+        if text:
+            scripts.append(text)
+    return "\n".join(scripts)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cached(path, parser):
+    """
+    Return the parsed value for path
+    A matching mtime/size skips all I/O; a changed stat re-hashes the file and
+    only re-parses if the content really changed
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        entry = _cache.get(path)
+        if entry and entry['stat'] == signature:
+            return entry['value']
+
+    content_hash = _file_hash(path)
+    if entry and entry['hash'] == content_hash:
+        value = entry['value']
+    else:
+        value = parser(path)
+
+    with _lock:
+        _cache[path] = {'stat': signature, 'hash': content_hash, 'value': value}
+    return value
+
+
+# Load prompt.txt
+@tracing.traced('assets.load_prompt')
+def load_prompt(path=PROMPT_PATH):
+    return _load_cached(path, _read_prompt)
+
+
+# Load sample_scripts.docx
+@tracing.traced('assets.load_sample_scripts')
+def load_sample_scripts(path=SAMPLES_PATH):
+    return _load_cached(path, _read_samples)
+
@@ -0,0 +1,125 @@
+"""
+Audio timeline assembly
+Places synthesized segments on a sample-accurate timeline and encodes one WAV file
+"""
+
+import struct
+
+# ElevenLabs raw PCM output: 16-bit little-endian mono
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+PCM_OUTPUT_FORMAT = f"pcm_{SAMPLE_RATE}"
+
+WAV_HEADER_SIZE = 44
+
+
+def seconds_to_samples(seconds, sample_rate=SAMPLE_RATE):
+    return int(round(float(seconds or 0) * sample_rate))
+
+
+def pcm_duration(pcm, sample_rate=SAMPLE_RATE):
+    """Length of a raw PCM buffer in seconds"""
+    return len(pcm) // (SAMPLE_WIDTH * CHANNELS) / sample_rate
+
+
+def place_segment(cursor, segment, frames, sample_rate=SAMPLE_RATE, use_start_times=True):
+    """
+    The placement rule: a segment of frames samples starts at cursor (the end of
+    the previous one plus its delay_after pause), and never before its own
+    start_time (when use_start_times is set)
+    Returns (offset_in_samples, cursor for the next segment)
+    """
+    offset = cursor
+    if use_start_times:
+        offset = max(offset, seconds_to_samples(segment.get('start_time', 0), sample_rate))
+    return offset, offset + frames + seconds_to_samples(segment.get('delay_after', 0), sample_rate)
+
+
+def plan_timeline(audio_segments, sample_rate=SAMPLE_RATE, use_start_times=True):
+    """
+    Work out where each segment starts on the output timeline (see place_segment)
+    Returns (list of (offset_in_samples, pcm) pairs, total length in samples)
+    """
+    frame_size = SAMPLE_WIDTH * CHANNELS
+    placements = []
+    cursor = 0
+    for segment in audio_segments:
+        pcm = segment['audio']
+        # Drop a trailing partial frame rather than shifting every later sample
+        frames = len(pcm) // frame_size
+        offset, cursor = place_segment(cursor, segment, frames, sample_rate, use_start_times)
+        placements.append((offset, pcm[:frames * frame_size]))
+    return placements, cursor
+
+
+def wav_header(data_size, sample_rate=SAMPLE_RATE):
+    byte_rate = sample_rate * SAMPLE_WIDTH * CHANNELS
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, CHANNELS, sample_rate, byte_rate, SAMPLE_WIDTH * CHANNELS, SAMPLE_WIDTH * 8,
+        b'data', data_size
+    )
+
+
+def audio_file_info(audio_bytes):
+    """
+    Return (filename, mime type) for an audio blob, for uploads and downloads
+    """
+    if audio_bytes[:4] == b'RIFF':
+        return 'audio.wav', 'audio/wav'
+    return 'audio.mp3', 'audio/mpeg'
+
+
+class TimelineWriter:
+    """
+    Builds one WAV file from raw PCM segments that finish out of order
+    add(index, segment) may be called in any order; each segment is written to the
+    timeline as soon as every segment before it has arrived, using the same
+    placement rule as plan_timeline (place_segment). finish() only has to fill in the WAV header.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, use_start_times=True):
+        self.sample_rate = sample_rate
+        self.use_start_times = use_start_times
+        self._buffer = bytearray(WAV_HEADER_SIZE)
+        self._pending = {}
+        self._next_index = 0
+        self._cursor = 0
+
+    @property
+    def written(self):
+        """Number of segments already placed on the timeline"""
+        return self._next_index
+
+    def add(self, index, segment):
+        self._pending[index] = segment
+        while self._next_index in self._pending:
+            self._place(self._pending.pop(self._next_index))
+            self._next_index += 1
+
+    def _place(self, segment):
+        frame_size = SAMPLE_WIDTH * CHANNELS
+        pcm = segment['audio']
+        frames = len(pcm) // frame_size
+        offset, self._cursor = place_segment(self._cursor, segment, frames, self.sample_rate, self.use_start_times)
+        self._pad_to(offset)
+        self._buffer += memoryview(pcm)[:frames * frame_size]
+
+    def _pad_to(self, samples):
+        missing = WAV_HEADER_SIZE + samples * SAMPLE_WIDTH * CHANNELS - len(self._buffer)
+        if missing > 0:
+            self._buffer += bytes(missing)
+
+    def finish(self):
+        """
+        Returns the WAV file as the writer's own bytearray (not copied again);
+        raises ValueError if a segment before the last one never arrived
+        """
+        if self._pending:
+            raise ValueError(f"Timeline is missing segment {self._next_index}")
+        self._pad_to(self._cursor)
+        data_size = len(self._buffer) - WAV_HEADER_SIZE
+        self._buffer[:WAV_HEADER_SIZE] = wav_header(data_size, self.sample_rate)
+        return self._buffer
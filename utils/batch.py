@@ -0,0 +1,543 @@
+"""
+Headless batch mode
+Runs topic → script → voice → video (→ YouTube with --upload) for a whole file
+of topics. The stages run as a pipeline, so the next topic's script and voice
+are generated while earlier topics are still rendering on HeyGen, and each
+script is streamed into the voice pipeline, so its first segments are voiced
+while Gemini is still writing the rest (--no-stream turns that off). Renders are
+watched by HeyGen's shared status poller, so up to --max-renders of them can be
+in flight without a thread each.
+
+Usage:
+    python -m utils.batch topics.csv --voice-id VOICE_ID --avatar-id AVATAR_ID
+
+Topics can be CSV (a 'topic' column, or the first column), JSONL (strings or
+objects with 'topic' and optional 'voice_id'/'avatar_id'), or plain text with
+one topic per line. API keys come from GEMINI_API_KEY / ELEVENLABS_API_KEY /
+HEYGEN_API_KEY or from .streamlit/secrets.toml, same names as the app; YouTube
+credentials likewise (youtube_refresh_token plus client id/secret, or
+YOUTUBE_ACCESS_TOKEN).
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from utils import ratelimit, tracing
+from utils.assets import load_prompt, load_sample_scripts
+from utils.cache import BlobCache
+from utils.gemini import generate_script_gemini, get_script_modes, set_response_schema, stream_script_gemini
+from utils.heygen import audio_seconds, estimate_render_seconds, submit_render, upload_voice
+from utils.pipeline import SegmentPipeline
+from utils.script_cache import ScriptCache
+from utils.script_parser import normalize_segment
+from utils.tts import MAX_IN_FLIGHT
+from utils.youtube import AccessToken, credentials_from_secrets, upload_video
+
+logger = logging.getLogger(__name__)
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+# Env var -> secrets.toml key
+API_KEY_NAMES = {
+    'gemini': ("GEMINI_API_KEY", "gemini_api"),
+    'elevenlabs': ("ELEVENLABS_API_KEY", "elevenlab_api"),
+    'heygen': ("HEYGEN_API_KEY", "heygen_api")
+}
+
+# Jobs allowed to wait between two stages before the earlier stage pauses
+STAGE_QUEUE_SIZE = 2
+# HeyGen renders in flight at once (keep within the plan's concurrency limit)
+MAX_RENDERS = 10
+# Topics scripted and voiced at once when scripts are streamed into the voice stage
+STREAM_WORKERS = 2
+
+_STOP = object()
+
+
+def read_topics(path):
+    """
+    Returns a list of dicts with 'topic' and optional 'voice_id'/'avatar_id'
+    """
+    topics = []
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline='') as f:
+        if extension == '.jsonl':
+            for line in f:
+                line = line.strip()
+                if line:
+                    item = json.loads(line)
+                    topics.append(item if isinstance(item, dict) else {'topic': str(item)})
+        elif extension == '.csv':
+            rows = list(csv.reader(f))
+            if rows and 'topic' in [cell.strip().lower() for cell in rows[0]]:
+                header = [cell.strip().lower() for cell in rows[0]]
+                topics = [dict(zip(header, row)) for row in rows[1:]]
+            else:
+                topics = [{'topic': row[0]} for row in rows if row]
+        else:
+            topics = [{'topic': line.strip()} for line in f if line.strip()]
+    return [item for item in topics if str(item.get('topic', '')).strip()]
+
+
+def load_secrets(secrets_path=SECRETS_PATH):
+    """The Streamlit secrets file as a dict (empty if missing or unreadable)"""
+    if os.path.exists(secrets_path):
+        try:
+            import tomllib
+            with open(secrets_path, 'rb') as f:
+                return tomllib.load(f)
+        except (ImportError, ValueError) as e:
+            logger.warning("Could not read %s: %s", secrets_path, e)
+    return {}
+
+
+def load_api_keys(secrets_path=SECRETS_PATH):
+    """
+    API keys from the environment, falling back to the Streamlit secrets file
+    """
+    secrets = load_secrets(secrets_path)
+    return {
+        name: os.environ.get(env_name) or secrets.get(secret_name)
+        for name, (env_name, secret_name) in API_KEY_NAMES.items()
+    }
+
+
+def _slug(text, length=40):
+    slug = re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+    return slug[:length] or 'topic'
+
+
+def _timed(segment):
+    # What the voice of a segment depends on
+    return segment['text'], segment.get('start_time', 0), segment.get('delay_after', 0)
+
+
+def _write(path, data):
+    mode = 'wb' if isinstance(data, (bytes, bytearray)) else 'w'
+    with open(path, mode, **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+        f.write(data)
+
+
+class BatchRunner:
+    """
+    Pipelined stages (script, voice, video, and upload when youtube_credentials
+    are given) connected by bounded queues. Script and voice run one job at a
+    time; with stream_script they are one stage instead (see stream_stage),
+    running STREAM_WORKERS jobs at a time. Video uploads the audio and starts the render on render_workers
+    threads, then leaves the job to the shared render poller until its video is
+    downloaded, with up to max_renders renders in flight. Upload uses
+    upload_workers threads sharing one access token. A job that fails in any
+    stage is passed through untouched and recorded in the manifest.
+
+    A stage function either finishes the job before returning or returns a
+    Future; the job moves on to the next stage when the Future resolves.
+    """
+
+    def __init__(self, api_keys, voice_id, avatar_id, out_dir, render_workers=2, max_renders=MAX_RENDERS,
+                 tts_max_in_flight=MAX_IN_FLIGHT, tts_cache=None, skip_video=False,
+                 script_cache=None, script_max_age=None, youtube_credentials=None,
+                 upload_workers=2, upload_privacy="private", stream_script=True):
+        self.api_keys = api_keys
+        self.voice_id = voice_id
+        self.avatar_id = avatar_id
+        self.out_dir = out_dir
+        self.render_workers = render_workers
+        self.max_renders = max_renders
+        self.tts_max_in_flight = tts_max_in_flight
+        self.tts_cache = tts_cache
+        self.skip_video = skip_video
+        self.script_cache = script_cache
+        self.script_max_age = script_max_age
+        self.youtube_token = AccessToken(youtube_credentials) if youtube_credentials else None
+        self.upload_workers = upload_workers
+        self.upload_privacy = upload_privacy
+        self.stream_script = stream_script
+
+    # --- stages
+
+    def script_stage(self, job):
+        prompt, samples = load_prompt(), load_sample_scripts()
+
+        def generate():
+            return generate_script_gemini(job['topic'], prompt, samples, self.api_keys['gemini'])
+
+        if self.script_cache is not None:
+            script_json, job['script_source'] = self.script_cache.get_or_generate(
+                job['topic'], prompt, samples, generate, max_age=self.script_max_age
+            )
+        else:
+            script_json = generate()
+        self._write_script(job, script_json)
+
+    def voice_stage(self, job):
+        self._write_voice(job, self._voice_pipeline(job).run(job['script'].get('segments', [])))
+
+    def stream_stage(self, job):
+        """
+        script_stage and voice_stage in one: the script is streamed from Gemini
+        and each segment goes to the voice pipeline as soon as it is complete.
+        Cached and shared scripts are voiced as usual. If the finished script's
+        segments differ from the streamed ones (repaired or continued output),
+        the voice is redone from the script; unchanged segments come from the
+        TTS cache.
+        """
+        prompt, samples = load_prompt(), load_sample_scripts()
+        pipeline = self._voice_pipeline(job)
+        streamed = {}
+
+        def segments(events):
+            previous_end = 0
+            for event in events:
+                if event['type'] == 'segment':
+                    segment, _ = normalize_segment(event['segment'], previous_end)
+                    if segment is not None:
+                        previous_end = segment['end_time']
+                        yield segment
+                elif event['type'] == 'script':
+                    streamed['script'] = event['script']
+                elif event['type'] == 'error':
+                    streamed['script'] = event['message']
+
+        def generate():
+            events = stream_script_gemini(job['topic'], prompt, samples, self.api_keys['gemini'])
+            streamed['voice'] = pipeline.run(segments(events))
+            return streamed.get('script', "[Error: Script stream ended early]")
+
+        if self.script_cache is not None:
+            script_json, job['script_source'] = self.script_cache.get_or_generate(
+                job['topic'], prompt, samples, generate, max_age=self.script_max_age
+            )
+        else:
+            script_json = generate()
+        self._write_script(job, script_json)
+
+        voice = streamed.get('voice')
+        script_segments = [segment for segment in script_json['segments'] if segment.get('text', '').strip()]
+        if voice is None or [_timed(segment) for segment in voice[0]] != [_timed(segment) for segment in script_segments]:
+            if voice is not None:
+                logger.info("[%s] Streamed segments differ from the final script; voicing it again", job['topic'])
+            voice = pipeline.run(script_json['segments'])
+        self._write_voice(job, voice)
+
+    def _voice_pipeline(self, job):
+        return SegmentPipeline(
+            self.api_keys['elevenlabs'],
+            job['voice_id'],
+            max_in_flight=self.tts_max_in_flight,
+            cache=self.tts_cache
+        )
+
+    def _write_script(self, job, script_json):
+        if not isinstance(script_json, dict):
+            raise RuntimeError(str(script_json))
+        job['title'] = script_json.get('title')
+        job['script_path'] = os.path.join(job['dir'], 'script.json')
+        _write(job['script_path'], json.dumps(script_json, ensure_ascii=False, indent=2))
+        job['script'] = script_json
+
+    def _write_voice(self, job, voice):
+        audio_segments, wav = voice
+        if not audio_segments:
+            raise RuntimeError("Script has no voice segments")
+        job['audio_path'] = os.path.join(job['dir'], 'audio.wav')
+        _write(job['audio_path'], wav)
+
+    def video_stage(self, job):
+        if self.skip_video:
+            return
+
+        def notify(level, message):
+            logger.log(logging.DEBUG if level == 'status' else logging.INFO, "[%s] %s", job['topic'], message)
+
+        # The audio is streamed to HeyGen from disk, never loaded whole
+        with open(job['audio_path'], 'rb') as audio_file:
+            voice = upload_voice(audio_file, self.api_keys['heygen'], notify=notify)
+            eta = estimate_render_seconds(audio_seconds(audio_file))
+        if voice is None:
+            raise RuntimeError("Could not upload the audio to HeyGen")
+        render = submit_render(
+            voice, self.api_keys['heygen'], job['avatar_id'],
+            notify=notify, video_path=os.path.join(job['dir'], 'video.mp4'), eta=eta
+        )
+        video = Future()
+
+        def finish(render):
+            try:
+                video_path = render.result()
+                if not video_path:
+                    raise RuntimeError("HeyGen video generation failed")
+            except Exception as e:
+                video.set_exception(e)
+                return
+            job['video_path'] = video_path
+            video.set_result(video_path)
+
+        render.add_done_callback(finish)
+        return video
+
+    def upload_stage(self, job):
+        if not job.get('video_path'):
+            return
+
+        def notify(level, message):
+            logger.log(logging.DEBUG if level == 'status' else logging.INFO, "[%s] %s", job['topic'], message)
+
+        result = upload_video(
+            job['video_path'], job.get('title') or job['topic'], None,
+            privacy=self.upload_privacy, notify=notify, token=self.youtube_token
+        )
+        job['youtube_url'] = result['url']
+        job['upload'] = {key: result[key] for key in ('bytes', 'resumed_from', 'seconds', 'bytes_per_second')}
+
+    # --- plumbing
+
+    def _run_stage(self, name, func, inbox, outbox, workers, max_pending=None):
+        """
+        Run func on jobs from inbox with workers threads, passing them to outbox
+        Jobs whose func returned a Future (at most max_pending at once) are passed
+        on when it resolves; a forwarder thread does the (blocking) hand-off, so
+        the thread resolving the Future is never held up by a full outbox
+        """
+        state = {'workers': workers, 'pending': 0}
+        changed = threading.Condition()
+        completed = queue.Queue()
+
+        def complete(job, active, started, error=None):
+            if error is not None:
+                job['status'] = 'failed'
+                job['failed_stage'] = name
+                job['error'] = str(error)
+                active.record_error(error)
+                logger.error("[%s] %s stage failed: %s", job['topic'], name, error)
+            job['timings'][name] = round(time.monotonic() - started, 3)
+            tracing.end_span(active)
+            completed.put(job)
+
+        def release():
+            with changed:
+                state['pending'] -= 1
+                changed.notify_all()
+
+        def resolved(job, active, started, future):
+            try:
+                future.result()
+                error = None
+            except Exception as e:
+                error = e
+            complete(job, active, started, error)
+            release()
+
+        def worker():
+            while True:
+                job = inbox.get()
+                if job is _STOP:
+                    # Let sibling workers see the stop marker too; the last one forwards it
+                    inbox.put(_STOP)
+                    with changed:
+                        state['workers'] -= 1
+                        if state['workers'] == 0:
+                            changed.wait_for(lambda: state['pending'] == 0)
+                            completed.put(_STOP)
+                    return
+                if job['status'] == 'failed':
+                    completed.put(job)
+                    continue
+
+                # Take a pending slot up front, so workers together never exceed max_pending
+                with changed:
+                    changed.wait_for(lambda: not max_pending or state['pending'] < max_pending)
+                    state['pending'] += 1
+                started = time.monotonic()
+                active = tracing.start_span(f"batch.{name}", topic=job['topic'], index=job['index'])
+                try:
+                    with tracing.use_span(active):
+                        result = func(job)
+                except Exception as e:
+                    complete(job, active, started, e)
+                    release()
+                    continue
+                if not isinstance(result, Future):
+                    complete(job, active, started)
+                    release()
+                    continue
+                result.add_done_callback(lambda future, job=job, active=active, started=started:
+                                         resolved(job, active, started, future))
+
+        def forward():
+            while True:
+                job = completed.get()
+                outbox.put(job)
+                if job is _STOP:
+                    return
+
+        threads = [
+            threading.Thread(target=worker, name=f"batch-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        threads.append(threading.Thread(target=forward, name=f"batch-{name}-forward", daemon=True))
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, topics):
+        """
+        Process all topics and write manifest.jsonl (as jobs finish) and
+        manifest.json (at the end) into out_dir
+        Returns the list of per-topic result records, in input order
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        to_script = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+        to_video = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+        finished = queue.Queue()
+
+        if self.stream_script:
+            self._run_stage('script_voice', self.stream_stage, to_script, to_video, STREAM_WORKERS)
+        else:
+            to_voice = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+            self._run_stage('script', self.script_stage, to_script, to_voice, 1)
+            self._run_stage('voice', self.voice_stage, to_voice, to_video, 1)
+        if self.youtube_token is not None:
+            to_upload = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+            self._run_stage('video', self.video_stage, to_video, to_upload, max(1, self.render_workers),
+                            max_pending=self.max_renders)
+            self._run_stage('upload', self.upload_stage, to_upload, finished, max(1, self.upload_workers))
+        else:
+            self._run_stage('video', self.video_stage, to_video, finished, max(1, self.render_workers),
+                            max_pending=self.max_renders)
+
+        def feed():
+            for index, item in enumerate(topics):
+                topic = str(item['topic']).strip()
+                job_dir = os.path.join(self.out_dir, f"{index + 1:03d}-{_slug(topic)}")
+                os.makedirs(job_dir, exist_ok=True)
+                to_script.put({
+                    'index': index,
+                    'topic': topic,
+                    'voice_id': item.get('voice_id') or self.voice_id,
+                    'avatar_id': item.get('avatar_id') or self.avatar_id,
+                    'dir': job_dir,
+                    'status': 'running',
+                    'timings': {}
+                })
+            to_script.put(_STOP)
+
+        threading.Thread(target=feed, name="batch-feed", daemon=True).start()
+
+        results = []
+        manifest_path = os.path.join(self.out_dir, 'manifest.jsonl')
+        with open(manifest_path, 'a', encoding='utf-8') as manifest:
+            while True:
+                job = finished.get()
+                if job is _STOP:
+                    break
+                job.pop('script', None)
+                if job['status'] != 'failed':
+                    job['status'] = 'done'
+                results.append(job)
+                manifest.write(json.dumps(job, ensure_ascii=False) + "\n")
+                manifest.flush()
+                logger.info("[%s] %s (%s)", job['topic'], job['status'], job['timings'])
+
+        results.sort(key=lambda job: job['index'])
+        _write(os.path.join(self.out_dir, 'manifest.json'), json.dumps(results, ensure_ascii=False, indent=2))
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate videos for a list of topics")
+    parser.add_argument("topics", help="CSV, JSONL or text file of topics")
+    parser.add_argument("--voice-id", required=True, help="ElevenLabs voice id")
+    parser.add_argument("--avatar-id", help="HeyGen avatar id (required unless --skip-video)")
+    parser.add_argument("--out", default="batch_output", help="Output directory")
+    parser.add_argument("--render-workers", type=int, default=2,
+                        help="Threads uploading audio to HeyGen and starting renders")
+    parser.add_argument("--max-renders", type=int, default=MAX_RENDERS,
+                        help="HeyGen renders in flight at once (your plan's concurrency limit)")
+    parser.add_argument("--tts-max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="ElevenLabs segment requests in flight per topic")
+    parser.add_argument("--tts-cache-dir", default=os.path.join(".cache", "tts"))
+    parser.add_argument("--script-cache-dir", default=os.path.join(".cache", "scripts"))
+    parser.add_argument("--reuse-hours", type=float, default=0,
+                        help="Reuse scripts generated for the same topic within this many hours")
+    parser.add_argument("--prompt-only", action="store_true",
+                        help="Describe the script JSON in the prompt only, without Gemini's responseSchema")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Generate each script whole before voicing it, instead of voicing segments as they stream in")
+    parser.add_argument("--skip-video", action="store_true", help="Stop after the voice stage")
+    parser.add_argument("--upload", action="store_true", help="Upload finished videos to YouTube")
+    parser.add_argument("--upload-workers", type=int, default=2, help="YouTube uploads in flight at once")
+    parser.add_argument("--privacy", default="private", choices=("private", "unlisted", "public"),
+                        help="Privacy status of uploaded videos")
+    parser.add_argument("--trace-log", help="Span log (JSON lines), default OUT/traces.jsonl")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
+    if not args.skip_video and not args.avatar_id:
+        parser.error("--avatar-id is required unless --skip-video is set")
+    api_keys = load_api_keys()
+    needed = ['gemini', 'elevenlabs'] + ([] if args.skip_video else ['heygen'])
+    missing = [name for name in needed if not api_keys.get(name)]
+    if missing:
+        parser.error(f"Missing API keys: {', '.join(missing)}")
+    youtube_credentials = None
+    if args.upload:
+        if args.skip_video:
+            parser.error("--upload needs videos; drop --skip-video")
+        youtube_credentials = credentials_from_secrets(load_secrets())
+        if not (youtube_credentials['access_token'] or youtube_credentials['refresh_token']):
+            parser.error("--upload needs YOUTUBE_ACCESS_TOKEN or youtube_refresh_token")
+
+    # Same provider limits as the app; all batch workers share them
+    ratelimit.configure_all(load_secrets().get('rate_limits'))
+    set_response_schema(not args.prompt_only)
+
+    tracing.set_export_path(args.trace_log or os.path.join(args.out, 'traces.jsonl'))
+
+    topics = read_topics(args.topics)
+    runner = BatchRunner(
+        api_keys,
+        args.voice_id,
+        args.avatar_id,
+        args.out,
+        render_workers=args.render_workers,
+        max_renders=args.max_renders,
+        tts_max_in_flight=args.tts_max_in_flight,
+        tts_cache=BlobCache(args.tts_cache_dir),
+        script_cache=ScriptCache(args.script_cache_dir),
+        script_max_age=args.reuse_hours * 3600,
+        skip_video=args.skip_video,
+        youtube_credentials=youtube_credentials,
+        upload_workers=args.upload_workers,
+        upload_privacy=args.privacy,
+        stream_script=not args.no_stream
+    )
+    results = runner.run(topics)
+    failed = [job for job in results if job['status'] == 'failed']
+    logger.info("Finished %d topics, %d failed", len(results), len(failed))
+    uploads = [job['upload'] for job in results if job.get('upload')]
+    if uploads:
+        sent = sum(upload['bytes'] - upload['resumed_from'] for upload in uploads)
+        seconds = sum(upload['seconds'] for upload in uploads)
+        logger.info("Uploaded %d videos, %.1f MB at %.2f MB/s per upload", len(uploads),
+                    sent / (1024 * 1024), sent / seconds / (1024 * 1024) if seconds else 0)
+    for stage, stage_stats in tracing.stage_stats().items():
+        logger.info("Stage %s: %s", stage, stage_stats)
+    for provider, provider_stats in ratelimit.stats().items():
+        logger.info("Rate limiter %s: %s", provider, provider_stats)
+    for mode, mode_stats in get_script_modes().stats().items():
+        if mode_stats['requests']:
+            logger.info("Script mode %s: %s", mode, mode_stats)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+"""
+Voice and avatar catalogs
+Process-wide TTL cache persisted to disk, refreshed in the background
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils import api_client
+from utils.cache import content_key
+
+ELEVENLABS_VOICES_PATH = "/v1/voices"
+HEYGEN_AVATARS_PATH = "/v2/avatars"
+
+# Catalogs older than this are refreshed in the background
+CATALOG_TTL = 6 * 60 * 60
+
+
+class CatalogError(Exception):
+    """Raised when a catalog could not be downloaded"""
+
+
+def _fetch(url, headers, etag):
+    if etag:
+        headers = dict(headers, **{"If-None-Match": etag})
+    response = api_client.get(url, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    if response.status_code != 200:
+        raise CatalogError(f"{response.status_code}")
+    return response.json(), response.headers.get("ETag")
+
+
+def fetch_voices(api_key, etag=None):
+    """
+    Download the ElevenLabs voice list
+    Returns (voices, etag); voices is None when the server says nothing changed
+    """
+    data, etag = _fetch(api_client.api_url('elevenlabs', ELEVENLABS_VOICES_PATH), {"xi-api-key": api_key}, etag)
+    return (None if data is None else data.get('voices', [])), etag
+
+
+def fetch_avatars(api_key, etag=None):
+    """
+    Download the HeyGen avatar list
+    Returns (avatars, etag); avatars is None when the server says nothing changed
+    """
+    data, etag = _fetch(api_client.api_url('heygen', HEYGEN_AVATARS_PATH), {"X-API-KEY": api_key}, etag)
+    return (None if data is None else data.get('data', {}).get('avatars', [])), etag
+
+
+FETCHERS = {
+    'voices': fetch_voices,
+    'avatars': fetch_avatars
+}
+
+
+class CatalogCache:
+    """
+    Keeps each catalog (per API key) in memory and in a JSON file under directory.
+    Fresh entries are returned as-is; stale entries are returned immediately and
+    refreshed on a background thread (conditionally, via ETag when the provider
+    sends one). Only a missing catalog blocks on the network.
+    """
+
+    def __init__(self, directory, ttl=CATALOG_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._refreshing = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, name, api_key):
+        # Different accounts see different catalogs; never write the raw key to disk
+        return f"{name}-{content_key(api_key)[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, self._path(key))
+
+    def _refresh(self, name, api_key, key, entry):
+        etag = entry.get('etag') if entry else None
+        items, etag = FETCHERS[name](api_key, etag)
+        if items is None:
+            items = entry['items']
+        entry = {'items': items, 'etag': etag, 'fetched_at': time.time()}
+        self._store(key, entry)
+        return entry
+
+    def _refresh_in_background(self, name, api_key, key, entry):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._refresh(name, api_key, key, entry)
+            except Exception:
+                # Keep serving the stale catalog; the next read will try again
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"catalog-{name}", daemon=True).start()
+
+    def get(self, name, api_key, force=False):
+        """
+        Return the catalog 'voices' or 'avatars' for api_key
+        Raises CatalogError if there is no cached copy and the download fails
+        """
+        key = self._key(name, api_key)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._entries[key] = entry
+
+        if entry is None or force:
+            return self._refresh(name, api_key, key, entry)['items']
+        if time.time() - entry.get('fetched_at', 0) > self.ttl:
+            self._refresh_in_background(name, api_key, key, entry)
+        return entry['items']
+
+    def get_many(self, wanted, force=False):
+        """
+        Fetch several catalogs in parallel
+        wanted is a dict of name -> api_key; returns dict of name -> items or CatalogError
+        """
+        def load(name):
+            try:
+                return self.get(name, wanted[name], force=force)
+            except (CatalogError, requests.exceptions.RequestException, ValueError) as e:
+                return CatalogError(str(e))
+
+        with ThreadPoolExecutor(max_workers=max(1, len(wanted)), thread_name_prefix="catalog") as executor:
+            return dict(zip(wanted, executor.map(load, wanted)))
+
+
+class CatalogIndex:
+    """
+    Lookup structures for one loaded catalog, built once per load:
+    by_id maps id -> record, options is the (name, id) tuple list for selectboxes,
+    and search() filters names without rescanning the raw records.
+    """
+
+    def __init__(self, items, id_field, name_field):
+        self.by_id = {}
+        options = []
+        for item in items:
+            item_id = item.get(id_field)
+            if item_id is None or item_id in self.by_id:
+                continue
+            self.by_id[item_id] = item
+            options.append((str(item.get(name_field) or item_id), item_id))
+        self.options = tuple(options)
+        self._names = tuple(name.lower() for name, _ in self.options)
+
+    def __len__(self):
+        return len(self.options)
+
+    def get(self, item_id):
+        return self.by_id.get(item_id)
+
+    def search(self, query, limit=200):
+        """
+        Options whose name matches query, best matches first:
+        names starting with the query, then containing it, then containing its
+        characters in order (so 'jsh' finds 'Joshua')
+        """
+        query = query.strip().lower()
+        if not query:
+            return self.options[:limit]
+
+        ranked = []
+        for position, name in enumerate(self._names):
+            found = name.find(query)
+            if found == 0:
+                rank = 0
+            elif found > 0:
+                rank = 1
+            elif _is_subsequence(query, name):
+                rank = 2
+            else:
+                continue
+            ranked.append((rank, position))
+        ranked.sort()
+        return tuple(self.options[position] for _, position in ranked[:limit])
+
+
+def _is_subsequence(query, text):
+    remaining = iter(text)
+    return all(char in remaining for char in query)
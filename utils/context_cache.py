@@ -0,0 +1,163 @@
+"""
+Gemini context caching
+The static part of the script prompt (instructions, prompt.txt, sample scripts)
+is uploaded once as a cachedContents resource and referenced by name, so each
+script request only sends the topic. When the provider won't cache it (prefix
+below the model's minimum size, model without caching, API error) a local
+handle stands in and the prefix is sent inline as before.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+from utils import api_client
+from utils.cache import content_key
+from utils.script_prompt import render_prompt_prefix
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CACHED_CONTENTS_PATH = "/v1beta/cachedContents"
+
+# Lifetime requested for each provider-side cache, seconds
+CONTEXT_TTL = 60 * 60
+# Recreate this long before expiry so no request references an expiring cache
+EXPIRY_MARGIN = 120
+# After the provider refuses a prefix, keep using the local handle this long
+UNSUPPORTED_RETRY = 6 * 60 * 60
+# After a network error creating the cache, try again this soon
+NETWORK_RETRY = 60
+
+
+class ContextHandle:
+    """
+    Reference to the cached prompt prefix
+    remote handles carry the cachedContents name; local ones only the prefix hash.
+    Both expire: remote ones with the provider cache, local ones when it is time
+    to try creating a provider cache again.
+    """
+
+    def __init__(self, name, model, prefix_hash, expires_at=None, remote=False):
+        self.name = name
+        self.model = model
+        self.prefix_hash = prefix_hash
+        self.expires_at = expires_at
+        self.remote = remote
+
+    def usable(self, prefix_hash):
+        if prefix_hash != self.prefix_hash:
+            return False
+        if self.expires_at is None:
+            return True
+        return time.time() < self.expires_at - (EXPIRY_MARGIN if self.remote else 0)
+
+
+class ContextCache:
+    """
+    One handle per (API key, model), recreated when the prompt/sample assets
+    change (their hash is part of the handle) or the cache is about to expire.
+    Replaced provider caches are deleted in the background. Creation is
+    serialized per key so concurrent sessions don't create duplicates.
+    """
+
+    def __init__(self, ttl=CONTEXT_TTL, enabled=True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._handles = {}
+        self._stats = {'created': 0, 'reused': 0, 'local': 0, 'invalidated': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def handle(self, prompt, samples, api_key, model):
+        """The handle to build a script request with for these assets"""
+        prefix = render_prompt_prefix(prompt, samples)
+        prefix_hash = content_key(prefix)
+        local = ContextHandle(f"local/{prefix_hash[:16]}", model, prefix_hash)
+        if not self.enabled:
+            self._count('local')
+            return local
+
+        key = (content_key(api_key), model)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            current = self._handles.get(key)
+            if current is not None and current.usable(prefix_hash):
+                self._count('reused' if current.remote else 'local')
+                return current
+
+            handle, retry_in = self._create(prefix, prefix_hash, api_key, model)
+            if handle is None:
+                local.expires_at = time.time() + retry_in
+                handle = local
+            self._handles[key] = handle
+
+        if current is not None and current.remote and current.name != handle.name:
+            # The assets changed: stop paying for storage of the old prefix
+            threading.Thread(target=self._delete, args=(current, api_key), daemon=True).start()
+        self._count('created' if handle.remote else 'local')
+        return handle
+
+    def _create(self, prefix, prefix_hash, api_key, model):
+        """Returns (remote handle, None), or (None, seconds until trying again)"""
+        data = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{int(self.ttl)}s"
+        }
+        try:
+            response = api_client.post(
+                api_client.api_url('gemini', GEMINI_CACHED_CONTENTS_PATH),
+                headers={"Content-Type": "application/json"},
+                json=data,
+                params={"key": api_key}
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning("Could not create Gemini context cache: %s", e)
+            return None, NETWORK_RETRY
+        if response.status_code != 200:
+            logger.info("Gemini context caching unavailable (%s), sending the prompt inline", response.status_code)
+            return None, NETWORK_RETRY if response.status_code == 429 or response.status_code >= 500 else UNSUPPORTED_RETRY
+        name = response.json().get('name')
+        if not name:
+            return None, UNSUPPORTED_RETRY
+        return ContextHandle(name, model, prefix_hash, expires_at=time.time() + self.ttl, remote=True), None
+
+    def _delete(self, handle, api_key):
+        try:
+            api_client.request(
+                'DELETE', api_client.api_url('gemini', f"/v1beta/{handle.name}"), params={"key": api_key}
+            )
+        except requests.exceptions.RequestException:
+            pass
+
+    def invalidate(self, handle):
+        """Forget a remote handle the API no longer accepts (deleted or expired early)"""
+        with self._lock:
+            for key, current in list(self._handles.items()):
+                if current is handle:
+                    del self._handles[key]
+            self._stats['invalidated'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_context_cache = ContextCache()
+
+
+def get_context_cache():
+    """The process-wide context cache used by script generation"""
+    return _context_cache
+
+
+def set_context_caching(enabled):
+    _context_cache.enabled = enabled
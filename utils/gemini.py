@@ -0,0 +1,537 @@
+"""
+Gemini script generation
+Blocking (generateContent) and streaming (streamGenerateContent) variants.
+Scripts are requested in JSON mode (responseMimeType application/json plus a
+responseSchema for title and segments) so Gemini can only answer with the
+script structure; where the API rejects the schema, the JSON format described
+in the prompt is all there is. Either way output is parsed tolerantly (see
+utils.script_parser), and a script cut off at maxOutputTokens is completed
+with a continuation request for the missing segments only.
+"""
+
+import json
+import threading
+import time
+
+import requests
+
+from utils import api_client, tracing
+from utils.context_cache import get_context_cache
+from utils.script_parser import ScriptParseError, merge_continuation, parse_script
+from utils.script_prompt import build_script_prompt, build_topic_prompt
+
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+GEMINI_GENERATE_PATH = "/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_PATH = "/v1beta/models/{model}:streamGenerateContent"
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topK": 40,
+    "topP": 0.95,
+    "maxOutputTokens": 2048
+}
+
+# Responses that can mean a referenced cachedContent no longer exists; retried inline once
+CACHE_MISS_STATUSES = (400, 403, 404)
+
+# Continuation requests allowed for one cut-off script
+MAX_CONTINUATIONS = 2
+
+# How the script JSON is asked for: enforced by responseSchema, or described in the prompt only
+SCHEMA_MODE = 'schema'
+PROMPT_MODE = 'prompt'
+
+# Outcome of a mode's first response (see ScriptModes.record)
+CLEAN = 'clean'
+REPAIRED = 'repaired'
+CONTINUED = 'continued'
+FAILED = 'failed'
+
+# Structure of the script JSON, in the OpenAPI subset Gemini's responseSchema takes.
+# Only segments is required so continuation answers ({"segments": [...]}) fit too
+SCRIPT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "segments": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "start_time": {"type": "NUMBER"},
+                    "end_time": {"type": "NUMBER"},
+                    "text": {"type": "STRING"},
+                    "delay_after": {"type": "NUMBER"}
+                },
+                "required": ["start_time", "end_time", "text", "delay_after"],
+                "propertyOrdering": ["start_time", "end_time", "text", "delay_after"]
+            }
+        }
+    },
+    "required": ["segments"],
+    # Title first, so streamed scripts show it before the segments
+    "propertyOrdering": ["title", "segments"]
+}
+
+# After the API rejects responseSchema, use prompt-only mode this long before trying it again
+SCHEMA_UNSUPPORTED_RETRY = 6 * 60 * 60
+# Words in a 400 response that mean the schema (not the prompt or cache) was refused
+SCHEMA_ERROR_MARKERS = ('responseSchema', 'response_schema', 'responseMimeType', 'response_mime_type')
+
+# Follow-up turn asking for the rest of a cut-off script
+CONTINUE_PROMPT = (
+    "Your answer was cut off after segment {count} (ending at {end_time} seconds). "
+    "Continue the same script from segment {next}: return ONLY a JSON object "
+    '{{"segments": [...]}} with the remaining segments, in the same format. '
+    "Do not repeat earlier segments."
+)
+
+
+class ScriptModes:
+    """
+    Picks the mode for each script request and counts how each mode's first
+    response turned out: CLEAN (valid script as is), REPAIRED (usable after
+    local repairs), CONTINUED (cut off, needed continuation requests) or FAILED
+    (no usable script). First-try success means no further request was needed.
+    """
+
+    def __init__(self, schema_enabled=True):
+        self.schema_enabled = schema_enabled
+        self._lock = threading.Lock()
+        self._schema_retry_at = 0
+        self._counts = {mode: dict.fromkeys((CLEAN, REPAIRED, CONTINUED, FAILED), 0)
+                        for mode in (SCHEMA_MODE, PROMPT_MODE)}
+
+    def mode(self):
+        with self._lock:
+            if self.schema_enabled and time.time() >= self._schema_retry_at:
+                return SCHEMA_MODE
+            return PROMPT_MODE
+
+    def reject_schema(self):
+        """The API refused responseSchema: fall back to prompt-only mode for a while"""
+        with self._lock:
+            self._schema_retry_at = time.time() + SCHEMA_UNSUPPORTED_RETRY
+
+    def record(self, mode, outcome):
+        with self._lock:
+            self._counts[mode][outcome] += 1
+
+    def clear(self):
+        """Reset the counters (the schema fallback is kept)"""
+        with self._lock:
+            for counts in self._counts.values():
+                counts.update(dict.fromkeys(counts, 0))
+
+    def stats(self):
+        """Per mode: outcome counts, requests, and first_try_rate (None before any request)"""
+        with self._lock:
+            stats = {}
+            for mode, counts in self._counts.items():
+                requests_made = sum(counts.values())
+                first_try = counts[CLEAN] + counts[REPAIRED]
+                stats[mode] = dict(
+                    counts, requests=requests_made,
+                    first_try_rate=round(first_try / requests_made, 3) if requests_made else None
+                )
+            return stats
+
+
+_script_modes = ScriptModes()
+
+
+def get_script_modes():
+    """The process-wide mode selection and success counters"""
+    return _script_modes
+
+
+def set_response_schema(enabled):
+    _script_modes.schema_enabled = enabled
+
+
+class _FirstTry:
+    """
+    The first response of one script request, counted once against the mode it
+    was asked in. A schema refusal counts as that mode's failed first try, so
+    the prompt-only request sent after it is not counted at all
+    """
+
+    def __init__(self):
+        self.mode = get_script_modes().mode()
+        self.recorded = False
+
+    def record(self, outcome):
+        if not self.recorded:
+            self.recorded = True
+            get_script_modes().record(self.mode, outcome)
+
+
+def _generation_config(mode):
+    if mode == SCHEMA_MODE:
+        return dict(GENERATION_CONFIG, responseMimeType="application/json", responseSchema=SCRIPT_RESPONSE_SCHEMA)
+    return dict(GENERATION_CONFIG)
+
+
+def _script_request(topic, prompt, samples, handle=None, history=None, mode=PROMPT_MODE):
+    """history: further turns after the prompt (e.g. the cut-off answer and a continuation request)"""
+    if handle is not None and handle.remote:
+        # The instructions and samples are already on Gemini's side
+        return {
+            "cachedContent": handle.name,
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [
+                        {"text": build_topic_prompt(topic)}
+                    ]
+                }
+            ] + list(history or []),
+            "generationConfig": _generation_config(mode)
+        }
+
+    # Enhanced prompt to ensure Roman Urdu output in JSON format
+    enhanced_prompt = build_script_prompt(topic, prompt, samples)
+
+    return {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [
+                    {"text": enhanced_prompt}
+                ]
+            }
+        ] + list(history or []),
+        "generationConfig": _generation_config(mode)
+    }
+
+
+def _schema_rejected(response):
+    if response.status_code != 400:
+        return False
+    try:
+        body = response.text
+    except (ValueError, requests.exceptions.RequestException):
+        return False
+    return any(marker in body for marker in SCHEMA_ERROR_MARKERS)
+
+
+def _post_script(url, topic, prompt, samples, api_key, params=None, stream=False, history=None, first_try=None):
+    """
+    POST a script request, referencing the cached prompt prefix when there is one
+    If Gemini rejects responseSchema, the request is re-sent in prompt-only mode;
+    if it rejects the cache reference, that is dropped and the request re-sent inline
+    first_try (a _FirstTry) picks the mode and is told about a schema refusal;
+    continuation requests pass none
+    Returns (response, mode the request was made in)
+    """
+    headers = {"Content-Type": "application/json"}
+    params = dict(params or {}, key=api_key)
+    context_cache = get_context_cache()
+    handle = context_cache.handle(prompt, samples, api_key, GEMINI_MODEL)
+    script_modes = get_script_modes()
+    mode = first_try.mode if first_try is not None else script_modes.mode()
+    data = _script_request(topic, prompt, samples, handle, history, mode)
+
+    response = api_client.post(url, headers=headers, json=data, params=params, stream=stream)
+    if mode == SCHEMA_MODE and _schema_rejected(response):
+        response.close()
+        script_modes.reject_schema()
+        if first_try is not None:
+            first_try.record(FAILED)
+        mode = PROMPT_MODE
+        data = _script_request(topic, prompt, samples, handle, history, mode)
+        response = api_client.post(url, headers=headers, json=data, params=params, stream=stream)
+    if handle.remote and response.status_code in CACHE_MISS_STATUSES:
+        response.close()
+        context_cache.invalidate(handle)
+        data = _script_request(topic, prompt, samples, history=history, mode=mode)
+        response = api_client.post(url, headers=headers, json=data, params=params, stream=stream)
+    return response, mode
+
+
+def _api_error(response):
+    # More detailed error information
+    try:
+        error_response = response.json()
+        error_detail = f" - {error_response.get('error', {}).get('message', 'Unknown error')}"
+    except ValueError:
+        error_detail = f" - Response: {response.text[:200]}"
+    return f"[Error: Gemini API returned {response.status_code}{error_detail}]"
+
+
+def _candidate_text(result):
+    # Raises KeyError / IndexError when the response has no text
+    return result['candidates'][0]['content']['parts'][0]['text']
+
+
+def _request_continuation(topic, prompt, samples, api_key, script_json):
+    """The model's text for the segments after the last one in script_json"""
+    segments = script_json['segments']
+    history = [
+        {"role": "model", "parts": [{"text": json.dumps(script_json, ensure_ascii=False)}]},
+        {"role": "user", "parts": [{"text": CONTINUE_PROMPT.format(
+            count=len(segments), end_time=segments[-1].get('end_time', 0), next=len(segments) + 1
+        )}]}
+    ]
+    url = api_client.api_url('gemini', GEMINI_GENERATE_PATH.format(model=GEMINI_MODEL))
+    with tracing.span('gemini.continue_script', segments=len(segments)):
+        response, _ = _post_script(url, topic, prompt, samples, api_key, history=history)
+        if response.status_code != 200:
+            raise ScriptParseError(_api_error(response))
+        return _candidate_text(response.json())
+
+
+def _complete_script(topic, prompt, samples, api_key, script_text, active, first_try):
+    """
+    Script JSON from the model's text, or an error string if there is no usable script
+    A cut-off script is completed with up to MAX_CONTINUATIONS continuation
+    requests; if those fail, the complete segments received so far are returned
+    Repairs and continuations are recorded on the active span, the outcome on first_try
+    """
+    try:
+        parsed = parse_script(script_text)
+    except ScriptParseError:
+        first_try.record(FAILED)
+        return f"[Error: Generated script is not valid JSON - {script_text[:200]}...]"
+    if parsed.truncated:
+        first_try.record(CONTINUED)
+    else:
+        first_try.record(REPAIRED if parsed.repairs else CLEAN)
+
+    script_json = parsed.script
+    truncated = parsed.truncated
+    continuations = 0
+    while truncated and continuations < MAX_CONTINUATIONS:
+        continuations += 1
+        try:
+            tail = parse_script(_request_continuation(topic, prompt, samples, api_key, script_json))
+        except (ValueError, KeyError, IndexError, requests.exceptions.RequestException) as e:
+            active.set(continuation_error=str(e)[:200])
+            break
+        script_json = merge_continuation(script_json, tail.script['segments'])
+        truncated = tail.truncated
+    active.set(repairs=",".join(parsed.repairs), continuations=continuations, truncated=truncated)
+    return script_json
+
+
+# Gemini API call
+def generate_script_gemini(topic, prompt, samples, api_key):
+    with tracing.span('gemini.generate_script', model=GEMINI_MODEL, streaming=False) as active:
+        script_json = _generate_script(topic, prompt, samples, api_key, active)
+        if isinstance(script_json, dict):
+            active.set(segments=len(script_json.get('segments', [])))
+        else:
+            active.record_error(script_json)
+        return script_json
+
+
+def _generate_script(topic, prompt, samples, api_key, active):
+    url = api_client.api_url('gemini', GEMINI_GENERATE_PATH.format(model=GEMINI_MODEL))
+    first_try = _FirstTry()
+
+    try:
+        response, mode = _post_script(url, topic, prompt, samples, api_key, first_try=first_try)
+        active.set(mode=mode)
+
+        if response.status_code == 200:
+            result = response.json()
+            try:
+                script_text = _candidate_text(result)
+            except (KeyError, IndexError) as e:
+                first_try.record(FAILED)
+                return f"[Error: Unexpected Gemini API response format - {str(e)}]"
+            return _complete_script(topic, prompt, samples, api_key, script_text, active, first_try)
+        else:
+            first_try.record(FAILED)
+            return _api_error(response)
+
+    except requests.exceptions.RequestException as e:
+        first_try.record(FAILED)
+        return f"[Error: Network error - {str(e)}]"
+    except Exception as e:
+        first_try.record(FAILED)
+        return f"[Error: Unexpected error - {str(e)}]"
+
+
+def _loads(raw):
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+class SegmentStreamParser:
+    """
+    Incremental parser for the script JSON as it streams in.
+    feed() takes the next piece of model text and returns the segments of the
+    "segments" array that became complete with it. Each character is scanned
+    once (tracking brace depth, string/escape state and the last key seen, which
+    is how "title" and "segments" are found), and only the text of the element
+    currently being read is kept, so parsing the whole stream stays linear.
+    """
+
+    def __init__(self):
+        self.title = None
+        self.segments = []
+        self.done = False
+        self._chunks = []
+        self._buffer = ''
+        self._buffer_start = 0  # stream offset of self._buffer[0]
+        self._position = 0  # stream offset of the next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None  # last string read outside segments; a key if ':' follows
+        self._value_for = None  # key whose value comes next
+        self._array_depth = None  # depth inside the "segments" array
+        self._object_start = None
+
+    @property
+    def text(self):
+        # The whole stream so far; joined on demand rather than on every feed()
+        return ''.join(self._chunks)
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        buffer = self._buffer + chunk
+        start = self._buffer_start
+        new_segments = []
+        for index in range(self._position - start, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_start is not None:
+                        raw = buffer[self._string_start - start:index + 1]
+                        self._string_start = None
+                        if self._value_for == 'title':
+                            self._value_for = None
+                            if self.title is None:
+                                self.title = _loads(raw)
+                        else:
+                            self._key = raw
+                continue
+            if char.isspace():
+                continue
+            if char == '"':
+                self._in_string = True
+                if self._object_start is None:
+                    self._string_start = start + index
+                    if self._value_for != 'title':
+                        self._value_for = None
+                continue
+            if char == ':':
+                if self._object_start is None and self._key is not None:
+                    self._value_for = _loads(self._key)
+                self._key = None
+                continue
+            value_for, self._value_for, self._key = self._value_for, None, None
+            if char in '{[':
+                if char == '[' and value_for == 'segments' and self._array_depth is None:
+                    self._array_depth = self._depth + 1
+                elif char == '{' and self._object_start is None and not self.done \
+                        and self._depth == self._array_depth:
+                    self._object_start = start + index
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._object_start is not None and self._depth == self._array_depth:
+                    segment = _loads(buffer[self._object_start - start:index + 1])
+                    self._object_start = None
+                    if isinstance(segment, dict):
+                        self.segments.append(segment)
+                        new_segments.append(segment)
+                elif char == ']' and not self.done and self._array_depth is not None \
+                        and self._depth == self._array_depth - 1:
+                    self.done = True
+
+        # Keep only the text of the string or segment still being read
+        self._position = start + len(buffer)
+        keep = min((offset for offset in (self._string_start, self._object_start)
+                    if offset is not None), default=self._position)
+        self._buffer = buffer[keep - start:]
+        self._buffer_start = keep
+        return new_segments
+
+
+def _stream_text_chunks(response):
+    # Server-sent events: one JSON response object per 'data:' line
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        event = json.loads(line[5:].strip())
+        for candidate in event.get('candidates', [])[:1]:
+            for part in candidate.get('content', {}).get('parts', []):
+                if part.get('text'):
+                    yield part['text']
+
+
+def stream_script_gemini(topic, prompt, samples, api_key):
+    """
+    Generate the script with streamGenerateContent, yielding events as it arrives:
+        {'type': 'title', 'title': ...}
+        {'type': 'segment', 'index': i, 'segment': {...}}  as soon as each segment is complete
+        {'type': 'script', 'script': {...}}                the full script JSON, last
+        {'type': 'error', 'message': ...}                  instead of 'script' on failure
+    """
+    with tracing.span('gemini.generate_script', activate=False, model=GEMINI_MODEL, streaming=True) as active:
+        for event in _stream_script(topic, prompt, samples, api_key, active):
+            if event['type'] == 'segment' and event['index'] == 0:
+                active.set(first_segment_ms=round(active.elapsed_ms(), 1))
+            elif event['type'] == 'script':
+                active.set(segments=len(event['script'].get('segments', [])))
+            elif event['type'] == 'error':
+                active.record_error(event['message'])
+            yield event
+
+
+def _stream_script(topic, prompt, samples, api_key, active):
+    url = api_client.api_url('gemini', GEMINI_STREAM_PATH.format(model=GEMINI_MODEL))
+    parser = SegmentStreamParser()
+    first_try = _FirstTry()
+
+    try:
+        response, mode = _post_script(
+            url, topic, prompt, samples, api_key, params={"alt": "sse"}, stream=True, first_try=first_try
+        )
+        active.set(mode=mode)
+        with response:
+            if response.status_code != 200:
+                first_try.record(FAILED)
+                yield {'type': 'error', 'message': _api_error(response)}
+                return
+
+            title_sent = False
+            for chunk in _stream_text_chunks(response):
+                first_index = len(parser.segments)
+                new_segments = parser.feed(chunk)
+                if parser.title is not None and not title_sent:
+                    title_sent = True
+                    yield {'type': 'title', 'title': parser.title}
+                for offset, segment in enumerate(new_segments):
+                    yield {'type': 'segment', 'index': first_index + offset, 'segment': segment}
+    except requests.exceptions.RequestException as e:
+        first_try.record(FAILED)
+        yield {'type': 'error', 'message': f"[Error: Network error - {str(e)}]"}
+        return
+    except ValueError as e:
+        first_try.record(FAILED)
+        yield {'type': 'error', 'message': f"[Error: Unexpected Gemini API response format - {str(e)}]"}
+        return
+
+    script_json = _complete_script(topic, prompt, samples, api_key, parser.text, active, first_try)
+    if not isinstance(script_json, dict) and parser.segments:
+        # The segments streamed fine even if something after them did not parse
+        script_json = {'title': parser.title or '', 'segments': parser.segments}
+    if isinstance(script_json, dict):
+        # Segments that came from a continuation request rather than the stream
+        for index in range(len(parser.segments), len(script_json['segments'])):
+            yield {'type': 'segment', 'index': index, 'segment': script_json['segments'][index]}
+        yield {'type': 'script', 'script': script_json}
+    else:
+        yield {'type': 'error', 'message': script_json}
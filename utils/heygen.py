@@ -0,0 +1,537 @@
+"""
+HeyGen helpers
+Audio upload, video generation and one process-wide status poller with
+adaptive backoff that every render is watched by
+"""
+
+import base64
+import itertools
+import json
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from utils import api_client, tracing
+from utils.audio import WAV_HEADER_SIZE, audio_file_info
+from utils.log import notifier
+from utils.media import DownloadError, MediaStore, stream_download
+from utils.multipart import MultipartStream
+
+logger = logging.getLogger(__name__)
+
+HEYGEN_STATUS_PATH = "/v1/video_status.get"
+HEYGEN_ASSETS_UPLOAD_PATH = "/v1/assets/upload"
+HEYGEN_ASSETS_PATH = "/v2/assets"
+HEYGEN_GENERATE_PATH = "/v2/video/generate"
+
+# Where the last working audio upload strategy is remembered
+UPLOAD_STRATEGY_PATH = os.path.join(".cache", "heygen_upload_strategy.json")
+
+# Terminal states reported by v1/video_status.get
+DONE_STATES = ("completed", "failed")
+
+# Finished videos downloaded at once, across all renders of the process
+DOWNLOAD_WORKERS = 4
+
+# Bit rate assumed for MP3 audio when estimating its duration (ElevenLabs' default)
+MP3_BITRATE = 128000
+
+
+class VideoStatusPoller:
+    """
+    Polls v1/video_status.get for many renders from a single background loop.
+
+    watch() registers a video_id and returns a Future of its final status data;
+    the loop polls each video only when it is due, so no thread is held per
+    render. The delay between polls of a video starts at initial_interval and
+    grows by multiplier up to max_interval, with +/- jitter so batch renders
+    don't poll in lockstep. If an estimated render time (eta, seconds) is known,
+    the first poll is pushed out to eta_lead of it and polling then restarts at
+    the short interval around the expected finish. Videos not done by the
+    deadline are reported with status 'timeout'. Status requests that fall due
+    together go out in parallel, up to fetch_workers at a time.
+    """
+
+    def __init__(self, api_key=None, initial_interval=2.0, max_interval=6.0, multiplier=1.5,
+                 jitter=0.2, deadline=900, eta_lead=0.8, fetch_workers=8):
+        self.api_key = api_key
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.eta_lead = eta_lead
+        self._fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="heygen-status")
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._tokens = itertools.count()
+        self._thread = None
+
+    def fetch_status(self, video_id, api_key=None):
+        """
+        Return the 'data' block of the status response, or None if the request failed
+        """
+        headers = {"X-API-KEY": api_key or self.api_key}
+        try:
+            response = api_client.get(api_client.api_url('heygen', HEYGEN_STATUS_PATH), headers=headers, params={"video_id": video_id})
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json().get('data', {}) or {}
+        except (ValueError, AttributeError):
+            # Not the API's JSON (e.g. a proxy's error page)
+            return None
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def watch(self, video_id, api_key=None, eta=None, on_status=None):
+        """
+        Start watching a render; returns a Future of its final status data
+        (status is 'completed', 'failed' or 'timeout')
+        on_status(video_id, status_data, attempt) is called after every poll, on
+        the poller thread, so it must be quick and thread-safe
+        """
+        future = Future()
+        now = time.monotonic()
+        state = {
+            'video_id': video_id,
+            'api_key': api_key or self.api_key,
+            'next_poll': now + (eta * self.eta_lead if eta else 0),
+            'interval': self.initial_interval,
+            'attempt': 0,
+            'deadline': now + self.deadline,
+            'on_status': on_status,
+            'future': future
+        }
+        with self._condition:
+            self._pending[next(self._tokens)] = state
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="heygen-poller", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            # Fail the renders being watched rather than leaving their Futures unresolved
+            logger.exception("Render status poller stopped")
+            with self._condition:
+                pending, self._pending = self._pending, {}
+            for state in pending.values():
+                state['future'].set_exception(e)
+        finally:
+            with self._condition:
+                self._thread = None
+                # A watch() that came in while this thread was stopping
+                if self._pending:
+                    self._thread = threading.Thread(target=self._run, name="heygen-poller", daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                for token, state in list(self._pending.items()):
+                    if now >= state['deadline']:
+                        del self._pending[token]
+                        state['future'].set_result({'status': 'timeout'})
+                if not self._pending:
+                    # Exit when idle; the next watch() starts a new thread
+                    return
+                due = [(token, state) for token, state in self._pending.items() if state['next_poll'] <= now]
+                if not due:
+                    wake_at = min(min(state['next_poll'], state['deadline']) for state in self._pending.values())
+                    self._condition.wait(max(0, wake_at - now))
+                    continue
+
+            fetches = [
+                self._fetch_pool.submit(self.fetch_status, state['video_id'], state['api_key'])
+                for _, state in due
+            ]
+            for (token, state), fetch in zip(due, fetches):
+                try:
+                    status_data = fetch.result()
+                except Exception:
+                    # Counts as a failed poll; the video is polled again later
+                    logger.exception("Render status poll failed for %s", state['video_id'])
+                    status_data = None
+                state['attempt'] += 1
+                if state['on_status']:
+                    try:
+                        state['on_status'](state['video_id'], status_data, state['attempt'])
+                    except Exception:
+                        logger.exception("Render status callback failed for %s", state['video_id'])
+
+                with self._condition:
+                    if status_data and status_data.get('status') in DONE_STATES:
+                        del self._pending[token]
+                        state['future'].set_result(status_data)
+                        continue
+                    state['next_poll'] = time.monotonic() + self._jittered(state['interval'])
+                    state['interval'] = min(state['interval'] * self.multiplier, self.max_interval)
+
+
+_render_poller = VideoStatusPoller()
+# Threads start on first use, like the poller's status pool
+_download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="heygen-download")
+
+# Render time estimate: base seconds plus seconds per second of audio (see estimate_render_seconds)
+_render_estimate = {'base': 20.0, 'per_audio_second': 1.0}
+
+
+def get_render_poller():
+    """The process-wide poller every HeyGen render is watched by"""
+    return _render_poller
+
+
+def set_render_estimate(base, per_audio_second):
+    """Tune the render time estimate the first status poll is scheduled from"""
+    _render_estimate.update(base=base, per_audio_second=per_audio_second)
+
+
+def audio_seconds(audio):
+    """
+    Approximate duration of a WAV or MP3 buffer or file, in seconds
+    WAV is exact from its header; MP3 assumes ElevenLabs' 128 kbps
+    """
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        head, size = bytes(audio[:WAV_HEADER_SIZE]), len(audio)
+    else:
+        position = audio.tell()
+        head = audio.read(WAV_HEADER_SIZE)
+        size = audio.seek(0, os.SEEK_END)
+        audio.seek(position)
+    if head[:4] == b'RIFF' and len(head) == WAV_HEADER_SIZE:
+        byte_rate = struct.unpack('<I', head[28:32])[0]
+        return (size - WAV_HEADER_SIZE) / byte_rate if byte_rate else None
+    return size * 8 / MP3_BITRATE
+
+
+def estimate_render_seconds(duration_seconds):
+    """Expected HeyGen render time for this much audio (None if unknown)"""
+    if duration_seconds is None:
+        return None
+    return _render_estimate['base'] + _render_estimate['per_audio_second'] * duration_seconds
+
+
+# Default progress sink: the module logger (the Streamlit app passes its own)
+log_notify = notifier(logger)
+
+
+def _download_video(video_id, status_data, notify, video_path, parent):
+    """The downloaded video's path for a finished render, or None"""
+    video_status = status_data.get('status')
+    if video_status == 'completed':
+        video_url_result = status_data.get('video_url')
+        if video_url_result:
+            try:
+                with tracing.span('heygen.download', parent=parent, video_id=video_id) as active:
+                    path = stream_download(video_url_result, video_path or MediaStore().new_path('.mp4'))
+                    active.set(bytes=os.path.getsize(path))
+                return path
+            except DownloadError as e:
+                notify('error', f"Video completed but could not be downloaded: {str(e)}")
+                return None
+        notify('error', "Video completed but no video URL was returned")
+        return None
+    elif video_status == 'failed':
+        error_msg = status_data.get('error', 'Unknown error')
+        notify('error', f"Video generation failed: {error_msg}")
+        return None
+    
+    notify('error', "Video generation timed out")
+    return None
+
+
+# Watch a started HeyGen render and download the finished video, without holding a thread meanwhile
+def watch_render(video_id, api_key, eta=None, notify=log_notify, video_path=None):
+    """
+    The render is watched by the shared poller (see VideoStatusPoller) and the
+    finished video streamed to video_path (a new file in the media store if not
+    given) on a small download pool
+    Returns a Future of the video path, or of None if the render failed or timed out
+    """
+    def show_status(_, status_data, attempt):
+        video_status = (status_data or {}).get('status', 'unknown')
+        notify('status', f"Video status: {video_status} (check {attempt})")
+    
+    parent = tracing.current_span()
+    poll_span = tracing.start_span('heygen.poll', parent=parent, video_id=video_id, eta=eta)
+    result = Future()
+    
+    def finish(status_future):
+        try:
+            status_data = status_future.result()
+        except Exception as e:
+            poll_span.record_error(e)
+            tracing.end_span(poll_span)
+            result.set_exception(e)
+            return
+        poll_span.set(status=status_data.get('status'))
+        if status_data.get('status') != 'completed':
+            poll_span.record_error(status_data.get('status'))
+        tracing.end_span(poll_span)
+        try:
+            result.set_result(_download_video(video_id, status_data, notify, video_path, parent))
+        except Exception as e:
+            result.set_exception(e)
+    
+    status_future = get_render_poller().watch(video_id, api_key, eta=eta, on_status=show_status)
+    # Done callbacks run on the poller thread; the download must not hold it up
+    status_future.add_done_callback(lambda done: _download_pool.submit(finish, done))
+    return result
+
+
+class UploadError(Exception):
+    """Raised when an upload strategy could not get the audio to HeyGen"""
+
+
+class UploadStrategyMemory:
+    """
+    Remembers which audio upload strategy last worked for HeyGen (persisted to a
+    small JSON file) so later runs try it first and leave strategies that are
+    known to fail for last.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._state = json.load(f)
+        except (OSError, ValueError):
+            self._state = {}
+        self._state.setdefault('last_success', None)
+        self._state.setdefault('failures', {})
+
+    def order(self, strategies):
+        with self._lock:
+            last_success = self._state['last_success']
+            failures = dict(self._state['failures'])
+        preferred = [name for name in strategies if name == last_success]
+        untried = [name for name in strategies if name != last_success and not failures.get(name)]
+        failing = sorted(
+            (name for name in strategies if name != last_success and failures.get(name)),
+            key=lambda name: failures[name]
+        )
+        return preferred + untried + failing
+
+    def record(self, strategy, success):
+        with self._lock:
+            if success:
+                self._state['last_success'] = strategy
+                self._state['failures'].pop(strategy, None)
+            else:
+                self._state['failures'][strategy] = self._state['failures'].get(strategy, 0) + 1
+                if self._state['last_success'] == strategy:
+                    self._state['last_success'] = None
+            state = json.dumps(self._state)
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(state)
+        except OSError:
+            pass
+
+
+_strategy_memory = None
+_strategy_memory_lock = threading.Lock()
+
+
+def get_strategy_memory():
+    global _strategy_memory
+    with _strategy_memory_lock:
+        if _strategy_memory is None:
+            _strategy_memory = UploadStrategyMemory(UPLOAD_STRATEGY_PATH)
+        return _strategy_memory
+
+
+def _read_head(audio, size=4):
+    """First bytes of a buffer or file object, leaving the file position unchanged"""
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return bytes(audio[:size])
+    position = audio.tell()
+    head = audio.read(size)
+    audio.seek(position)
+    return head
+
+
+def _asset_id(upload_result):
+    data = upload_result.get('data') or {}
+    return data.get('asset_id') or data.get('id') or upload_result.get('asset_id') or upload_result.get('id')
+
+
+def _upload_multipart(path, audio, api_key, fields=None):
+    """
+    Upload the audio as multipart form data, streamed from the buffer or file
+    Returns the asset id; raises UploadError
+    """
+    audio_filename, audio_mime = audio_file_info(_read_head(audio))
+    body = MultipartStream(audio, audio_filename, audio_mime, fields=fields)
+    headers = {
+        "X-API-KEY": api_key,
+        "Content-Type": body.content_type
+    }
+    upload_response = api_client.post(api_client.api_url('heygen', path), headers=headers, data=body)
+    if upload_response.status_code not in (200, 201):
+        raise UploadError(f"{upload_response.status_code} - {upload_response.text}")
+    audio_asset_id = _asset_id(upload_response.json())
+    if not audio_asset_id:
+        raise UploadError("no asset id in response")
+    return audio_asset_id
+
+
+def _audio_data_url(audio):
+    # Last resort only: this needs the whole file base64-encoded in the JSON body
+    if not isinstance(audio, (bytes, bytearray, memoryview)):
+        position = audio.tell()
+        audio_bytes = audio.read()
+        audio.seek(position)
+        audio = audio_bytes
+    _, audio_mime = audio_file_info(bytes(audio[:4]))
+    return f"data:{audio_mime};base64,{base64.b64encode(audio).decode('utf-8')}"
+
+
+def _voice_v1_assets(audio, api_key):
+    return {"type": "audio", "audio_asset_id": _upload_multipart(HEYGEN_ASSETS_UPLOAD_PATH, audio, api_key)}
+
+
+def _voice_v2_assets(audio, api_key):
+    return {"type": "audio", "audio_asset_id": _upload_multipart(HEYGEN_ASSETS_PATH, audio, api_key, fields={'type': 'audio'})}
+
+
+def _voice_audio_url(audio, api_key):
+    return {"type": "audio", "audio_url": _audio_data_url(audio)}
+
+
+# Upload strategies in default order: name -> (label, builds the 'voice' input)
+UPLOAD_STRATEGIES = {
+    'v1_assets_upload': ("v1/assets/upload", _voice_v1_assets),
+    'v2_assets': ("v2/assets", _voice_v2_assets),
+    'audio_url': ("Audio URL", _voice_audio_url)
+}
+
+
+def start_render(voice, api_key, avatar_id):
+    """
+    Ask HeyGen to render the avatar with the given voice input
+    Returns the video_id; raises UploadError
+    """
+    video_headers = {
+        "X-API-KEY": api_key,
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "video_inputs": [
+            {
+                "character": {
+                    "type": "avatar",
+                    "avatar_id": avatar_id
+                },
+                "voice": voice
+            }
+        ],
+        "dimension": {
+            "width": 720,
+            "height": 480
+        },
+        "aspect_ratio": "16:9"
+    }
+    response = api_client.post(api_client.api_url('heygen', HEYGEN_GENERATE_PATH), json=payload, headers=video_headers)
+    if response.status_code != 200:
+        raise UploadError(f"video generation returned {response.status_code} - {response.text}")
+    video_id = response.json().get('data', {}).get('video_id')
+    if not video_id:
+        raise UploadError("no video_id in response")
+    return video_id
+
+
+# Upload audio once for several renders (e.g. one voice with several avatars)
+def upload_voice(audio, api_key, notify=log_notify):
+    """
+    Returns the 'voice' input for start_render from the first upload strategy
+    that works (in remembered order), or None if none does
+    """
+    memory = get_strategy_memory()
+    for strategy in memory.order(list(UPLOAD_STRATEGIES)):
+        label, build_voice = UPLOAD_STRATEGIES[strategy]
+        try:
+            with tracing.span('heygen.upload', strategy=strategy):
+                voice = build_voice(audio, api_key)
+        except (UploadError, requests.exceptions.RequestException, ValueError) as e:
+            memory.record(strategy, success=False)
+            notify('warning', f"{label} approach failed: {str(e)}")
+            continue
+        memory.record(strategy, success=True)
+        if voice.get('audio_asset_id'):
+            notify('success', f"✅ Successfully uploaded audio asset: {voice['audio_asset_id']}")
+        return voice
+    notify('error', "❌ Could not upload the audio to HeyGen")
+    return None
+
+
+# Start rendering an avatar with a voice input from upload_voice
+def submit_render(voice, api_key, avatar_id, notify=log_notify, video_path=None, eta=None):
+    """
+    eta: expected render time in seconds (see estimate_render_seconds)
+    Returns a Future of the downloaded video's path, or of None; a failed render
+    request is not retried with another upload, since the upload itself worked
+    """
+    notify('info', "🎬 Generating video with your custom ElevenLabs voice...")
+    try:
+        with tracing.span('heygen.start_render', avatar_id=avatar_id):
+            video_id = start_render(voice, api_key, avatar_id)
+    except (UploadError, requests.exceptions.RequestException, ValueError) as e:
+        notify('error', f"Video generation failed: {str(e)}")
+        failed = Future()
+        failed.set_result(None)
+        return failed
+    notify('info', f"Video generation started with ID: {video_id}")
+    return watch_render(video_id, api_key, eta=eta, notify=notify, video_path=video_path)
+
+
+# Upload the audio and start the render; the render is then watched by the shared poller
+def submit_video(audio, api_key, avatar_id, notify=log_notify, video_path=None):
+    """
+    Non-blocking form of generate_video_heygen: returns once the render has
+    started, with a Future of the downloaded video's path (or of None)
+    """
+    voice = upload_voice(audio, api_key, notify=notify)
+    if voice is None:
+        # Fallback: STOP if we can't use custom audio
+        notify('error', "🚫 Video generation cancelled - we need your custom voice for proper lip-sync")
+        notify('info', "💡 Your ElevenLabs audio is available in the Generated Audio section")
+        notify('info', "🔧 Please check your HeyGen API plan or try again later")
+        failed = Future()
+        failed.set_result(None)
+        return failed
+    
+    eta = estimate_render_seconds(audio_seconds(audio))
+    return submit_render(voice, api_key, avatar_id, notify=notify, video_path=video_path, eta=eta)
+
+
+# HeyGen API call
+def generate_video_heygen(audio, api_key, avatar_id, notify=log_notify, video_path=None):
+    """
+    Generate video using HeyGen API with avatar and custom ElevenLabs audio
+    audio may be bytes or an open binary file; it is streamed to HeyGen as-is
+    Upload strategies are tried in the order remembered from earlier runs
+    Progress messages go to notify(level, message)
+    Returns the path of the downloaded video, or None
+    """
+    try:
+        return submit_video(audio, api_key, avatar_id, notify=notify, video_path=video_path).result()
+    except Exception as e:
+        notify('error', f"Video generation error: {str(e)}")
+        return None
@@ -0,0 +1,190 @@
+"""
+Background job queue
+Long-running work (HeyGen renders) runs on a worker pool with job records in
+SQLite, so results survive Streamlit reruns, page refreshes and many users
+"""
+
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.path.join(".cache", "jobs.sqlite3")
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    message TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Jobs are submitted with a kind and a JSON payload; handlers registered for
+    that kind run on worker threads as handler(payload, progress) and return a
+    JSON-serializable result. progress(message) stores a status line that the
+    UI can show while the job runs. A handler whose work goes on elsewhere
+    (e.g. a render watched by the shared HeyGen poller) may return a
+    concurrent.futures.Future of the result instead; the worker is free for the
+    next job at once, and the job finishes when the Future resolves.
+
+    Jobs left 'running' by a previous process are marked failed on start, since
+    the work they stood for died with that process.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, workers=2, poll_interval=2.0):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?",
+                (FAILED, "Interrupted by a server restart", time.time(), RUNNING)
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across threads
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def submit(self, kind, payload, owner=None):
+        """Queue a job and return its id"""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, owner, status, payload, message, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, owner, QUEUED, json.dumps(payload), "Waiting for a free worker", time.time())
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """The job record as a dict, or None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def _to_dict(self, row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _claim(self):
+        # Claim the oldest queued job; the status check in the UPDATE makes the
+        # claim atomic when several workers (or processes) race for it
+        while True:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? AND kind IN (%s) ORDER BY created_at LIMIT 1"
+                    % ",".join("?" * len(self._handlers)),
+                    (QUEUED, *self._handlers)
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, message = ? WHERE id = ? AND status = ?",
+                    (RUNNING, time.time(), "Started", row['id'], QUEUED)
+                ).rowcount
+            if claimed:
+                return self.get(row['id'])
+
+    def _set_message(self, job_id, message):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            job = self._claim() if self._handlers else None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            def progress(message, job_id=job['id']):
+                self._set_message(job_id, message)
+
+            try:
+                result = self._handlers[job['kind']](job['payload'], progress)
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job['id'], job['kind'])
+                self._finish(job['id'], FAILED, error=str(e))
+                continue
+            if isinstance(result, Future):
+                result.add_done_callback(functools.partial(self._resolve, job['id'], job['kind']))
+            else:
+                self._finish(job['id'], DONE, result=result)
+
+    def _resolve(self, job_id, kind, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error("Job %s (%s) failed", job_id, kind, exc_info=e)
+            self._finish(job_id, FAILED, error=str(e))
+            return
+        self._finish(job_id, DONE, result=result)
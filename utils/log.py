@@ -0,0 +1,23 @@
+"""
+Logging for progress messages
+The pipeline reports progress through notify(level, message) callbacks; outside
+the Streamlit app (batch runs, background jobs) they go to a module logger
+"""
+
+import logging
+
+# notify() levels and the logging levels they map to
+LOG_LEVELS = {
+    'success': logging.INFO,
+    'info': logging.INFO,
+    'status': logging.DEBUG,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+
+
+def notifier(logger):
+    """A notify(level, message) callback writing to the given logger"""
+    def notify(level, message):
+        logger.log(LOG_LEVELS.get(level, logging.INFO), message)
+    return notify
@@ -0,0 +1,328 @@
+"""
+Managed on-disk media files
+Generated audio and rendered videos live on disk and are referenced by id or
+path, so session state never holds media bytes
+"""
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import requests
+
+from utils import api_client
+
+MEDIA_DIR = os.path.join(".cache", "media")
+
+# Bytes read from the network per write
+CHUNK_SIZE = 1024 * 1024
+# Times a broken download is resumed from the last byte on disk
+MAX_RESUMES = 5
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded"""
+
+
+class MediaQuotaError(Exception):
+    """Raised when a session's media would not fit in its quota"""
+
+
+class MediaStore:
+    """
+    A directory of generated media files with unique names.
+
+    Files can be registered as media ids (their file names) with a reference
+    count. Each session ("owner") holds one reference per media id it keeps,
+    and other users such as a render job acquire their own, so a file is
+    deleted only when the last holder releases it. Owners are limited to
+    session_quota bytes (their oldest media is released first to make room),
+    and owners not seen for idle_timeout seconds have all their media released.
+
+    With url_prefix set (the public address of serve_media() for this store),
+    url() gives a link the browser fetches straight from disk, so media is
+    never held in session state or copied through the script.
+    """
+
+    def __init__(self, directory=MEDIA_DIR, session_quota=None, idle_timeout=None, url_prefix=None):
+        self.directory = directory
+        self.session_quota = session_quota
+        self.idle_timeout = idle_timeout
+        self.url_prefix = url_prefix.rstrip('/') if url_prefix else None
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._sizes = {}
+        # owner -> OrderedDict of media ids, oldest first
+        self._owners = {}
+        self._last_seen = {}
+        self._last_sweep = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        if idle_timeout:
+            self._remove_orphans(idle_timeout)
+
+    def new_path(self, suffix=''):
+        return os.path.join(self.directory, uuid.uuid4().hex + suffix)
+
+    def _remove_orphans(self, max_age):
+        # Files left by an earlier process have no holders; drop the stale ones
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def put(self, owner, data, suffix=''):
+        """Write bytes to a new file held by owner; returns its media id"""
+        path = self.new_path(suffix)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        try:
+            return self.adopt(owner, path)
+        except MediaQuotaError:
+            os.remove(path)
+            raise
+
+    def adopt(self, owner, path):
+        """
+        Register an existing file in this directory (e.g. a finished render) for owner
+        Adopting the same file again just adds a reference
+        Raises MediaQuotaError if it can't fit in the owner's quota
+        """
+        media_id = os.path.basename(path)
+        size = os.path.getsize(self.path_for(media_id))
+        with self._lock:
+            held = self._owners.setdefault(owner, OrderedDict())
+            if media_id in held:
+                held.move_to_end(media_id)
+                self._last_seen[owner] = time.monotonic()
+                return media_id
+            to_release = []
+            if self.session_quota is not None:
+                if size > self.session_quota:
+                    raise MediaQuotaError(f"{size} bytes is more than the {self.session_quota} byte session quota")
+                used = sum(self._sizes.get(held_id, 0) for held_id in held)
+                for held_id in list(held):
+                    if used + size <= self.session_quota:
+                        break
+                    used -= self._sizes.get(held_id, 0)
+                    del held[held_id]
+                    to_release.append(held_id)
+            held[media_id] = None
+            self._sizes[media_id] = size
+            self._refs[media_id] = self._refs.get(media_id, 0) + 1
+            self._last_seen[owner] = time.monotonic()
+        for held_id in to_release:
+            self._release(held_id)
+        return media_id
+
+    def acquire(self, media_id):
+        """Take an extra reference (e.g. for a job reading the file)"""
+        with self._lock:
+            if media_id not in self._refs:
+                raise KeyError(media_id)
+            self._refs[media_id] += 1
+
+    def release(self, media_id, owner=None):
+        """Drop a reference: owner's, or one taken with acquire()"""
+        with self._lock:
+            if owner is not None:
+                held = self._owners.get(owner)
+                if not held or media_id not in held:
+                    return
+                del held[media_id]
+        self._release(media_id)
+
+    def _release(self, media_id):
+        with self._lock:
+            count = self._refs.get(media_id, 0) - 1
+            if count > 0:
+                self._refs[media_id] = count
+                return
+            self._refs.pop(media_id, None)
+            self._sizes.pop(media_id, None)
+        try:
+            os.remove(self.path_for(media_id))
+        except OSError:
+            pass
+
+    def release_owner(self, owner):
+        with self._lock:
+            held = self._owners.pop(owner, {})
+            self._last_seen.pop(owner, None)
+        for media_id in held:
+            self._release(media_id)
+
+    def touch(self, owner):
+        """Mark owner as active; now and then releases media of idle owners"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[owner] = now
+            sweep = self.idle_timeout and now - self._last_sweep > min(60, self.idle_timeout)
+            if sweep:
+                self._last_sweep = now
+                idle = [name for name, seen in self._last_seen.items() if now - seen > self.idle_timeout]
+        if sweep:
+            for name in idle:
+                self.release_owner(name)
+
+    def path_for(self, media_id):
+        return os.path.join(self.directory, os.path.basename(media_id))
+
+    def path(self, media_id):
+        """Path of a live media file, or None if it was evicted"""
+        if not media_id:
+            return None
+        path = self.path_for(media_id)
+        return path if os.path.exists(path) else None
+
+    def url(self, media_id, download=False):
+        """Browser URL served straight from disk (see serve_media), or None without url_prefix"""
+        if not self.url_prefix or not self.path(media_id):
+            return None
+        return f"{self.url_prefix}/{os.path.basename(media_id)}" + ("?download=1" if download else "")
+
+    def usage(self, owner):
+        with self._lock:
+            return sum(self._sizes.get(media_id, 0) for media_id in self._owners.get(owner, ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'owners': len(self._owners),
+                'files': len(self._refs),
+                'bytes': sum(self._sizes.values())
+            }
+
+
+def stream_download(url, dest_path, chunk_size=CHUNK_SIZE, max_resumes=MAX_RESUMES, timeout=60):
+    """
+    Download url to dest_path in chunks, without holding the file in memory
+    Data goes to dest_path + '.part' first; after a dropped connection the
+    download resumes with an HTTP Range request from the bytes already on disk
+    (or restarts if the server ignores the range). The part file is renamed
+    into place only once complete.
+    Returns dest_path; raises DownloadError when it gives up
+    """
+    part_path = dest_path + '.part'
+    last_error = None
+
+    for attempt in range(max_resumes + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with api_client.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # Nothing left to fetch: the part file already holds everything
+                    break
+                if response.status_code not in (200, 206):
+                    raise DownloadError(f"Download failed: {response.status_code}")
+
+                expected = response.headers.get('Content-Length')
+                expected = int(expected) if expected and expected.isdigit() else None
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                received = 0
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            received += len(chunk)
+                if expected is not None and received < expected:
+                    raise requests.exceptions.ConnectionError(
+                        f"Connection closed after {received} of {expected} bytes"
+                    )
+                break
+        except requests.exceptions.RequestException as e:
+            last_error = e
+            if attempt == max_resumes:
+                raise DownloadError(f"Download failed: {str(e)}") from e
+            time.sleep(min(2 ** attempt, 10))
+
+    if not os.path.exists(part_path):
+        raise DownloadError(f"Download failed: {str(last_error)}")
+    os.replace(part_path, dest_path)
+    return dest_path
+
+
+_CONTENT_TYPES = {
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mpeg',
+    '.mp4': 'video/mp4'
+}
+
+
+class _MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        media_id = unquote(urlsplit(self.path).path).lstrip('/')
+        path = self.server.store.path(media_id) if media_id and '/' not in media_id else None
+        if path is None:
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range') or '')
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        extension = os.path.splitext(path)[1].lower()
+        self.send_header('Content-Type', _CONTENT_TYPES.get(extension, 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if 'download' in parse_qs(urlsplit(self.path).query):
+            self.send_header('Content-Disposition', f'attachment; filename="generated{extension}"')
+        self.end_headers()
+        if send_body:
+            self.wfile.flush()
+            with open(path, 'rb') as f:
+                # sendfile() copies from the page cache straight to the socket
+                self.connection.sendfile(f, offset=start, count=end - start + 1)
+
+
+def serve_media(store, host='127.0.0.1', port=8502):
+    """
+    Serve store's media files over HTTP (with Range support for seeking) on a
+    background thread. The Streamlit app links to these URLs instead of
+    passing file contents through the script.
+    Returns the server; call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), _MediaRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    threading.Thread(target=server.serve_forever, name="media-server", daemon=True).start()
+    return server
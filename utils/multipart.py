@@ -0,0 +1,96 @@
+"""
+Streaming multipart/form-data bodies
+The file part is sent straight from a memory buffer or an open file, with no
+temp file and no copy of the whole payload
+"""
+
+import io
+import os
+import uuid
+
+# Largest block handed to the socket per read when streaming from a file
+READ_BLOCK = 256 * 1024
+
+
+class MultipartStream:
+    """
+    File-like multipart body for requests' data= argument.
+
+    source may be bytes/bytearray/memoryview (served as zero-copy memoryview
+    slices) or a binary file object (read in blocks from its current position).
+    len() gives the exact body size, so requests sends a Content-Length instead
+    of chunked encoding; tell()/seek(0) let urllib3 rewind it on a retry.
+    """
+
+    def __init__(self, source, filename, content_type, field_name='file', fields=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        head = []
+        for name, value in (fields or {}).items():
+            head.append(
+                f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+                f"{value}\r\n"
+            )
+        head.append(
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self._head = memoryview("".join(head).encode('utf-8'))
+        self._tail = memoryview(f"\r\n--{self.boundary}--\r\n".encode('utf-8'))
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._buffer = memoryview(source)
+            self._file = None
+            self._file_start = 0
+            file_size = len(self._buffer)
+        else:
+            self._buffer = None
+            self._file = source
+            self._file_start = source.tell()
+            file_size = os.fstat(source.fileno()).st_size - self._file_start
+
+        self._sizes = (len(self._head), file_size, len(self._tail))
+        self._length = sum(self._sizes)
+        self._position = 0
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._position = max(0, min(offset, self._length))
+        return self._position
+
+    def read(self, size=-1):
+        if self._position >= self._length:
+            return b''
+        if size is None or size < 0:
+            size = self._length - self._position
+
+        head_size, file_size, _ = self._sizes
+        position = self._position
+        if position < head_size:
+            chunk = self._head[position:position + size]
+        elif position < head_size + file_size:
+            offset = position - head_size
+            size = min(size, file_size - offset)
+            if self._buffer is not None:
+                chunk = self._buffer[offset:offset + size]
+            else:
+                self._file.seek(self._file_start + offset)
+                chunk = self._file.read(min(size, READ_BLOCK))
+        else:
+            offset = position - head_size - file_size
+            chunk = self._tail[offset:offset + size]
+
+        self._position += len(chunk)
+        return chunk
@@ -0,0 +1,159 @@
+"""
+Per-segment voice pipeline
+Each script segment flows on its own through synthesis and onto the audio
+timeline, so the total time is close to the slowest single segment rather than
+the sum of "synthesize everything" then "assemble everything"
+"""
+
+import queue
+import threading
+
+from utils import tracing
+from utils.audio import PCM_OUTPUT_FORMAT, TimelineWriter
+from utils.tts import MAX_IN_FLIGHT, MAX_RETRIES, synthesize_with_retry
+
+_STOP = object()
+
+
+class _CacheUse:
+    """A view of the TTS cache that remembers whether one segment was served from it"""
+
+    def __init__(self, cache):
+        self._cache = cache
+        self.hit = False
+
+    def get(self, key):
+        audio = self._cache.get(key)
+        self.hit = audio is not None
+        return audio
+
+    def put(self, key, audio):
+        self._cache.put(key, audio)
+
+
+class SegmentPipeline:
+    """
+    Three stages connected by bounded queues:
+
+        caller (segments) -> [synthesis queue] -> max_in_flight TTS workers
+                          -> [timeline queue]  -> timeline writer thread
+
+    The caller's iteration of segments is the first stage. When a queue is full
+    the stage before it blocks, which keeps memory and request bursts bounded.
+    The timeline writer places each segment as soon as the ones before it are
+    done, so only the WAV header is left once the last segment has been
+    synthesized.
+    """
+
+    def __init__(self, api_key, voice_id, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES,
+                 output_format=PCM_OUTPUT_FORMAT, cache=None, queue_size=None):
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.output_format = output_format
+        self.cache = cache
+        self.queue_size = queue_size or self.max_in_flight * 2
+
+    def run(self, segments):
+        """
+        Returns (list of audio segments in script order, WAV file as a bytearray)
+        Each audio segment holds 'audio' (PCM), 'text', the segment's timing and
+        'cached' (served from the TTS cache, so callers can count this run's
+        hits and misses); empty segments are skipped. Raises the first synthesis error, after
+        stopping the workers.
+        """
+        with tracing.span('voice.pipeline', voice_id=self.voice_id) as active:
+            audio_segments, wav = self._run(segments)
+            active.set(segments=len(audio_segments),
+                       cache_hits=sum(1 for segment in audio_segments if segment['cached']))
+            return audio_segments, wav
+
+    def _run(self, segments):
+        to_synthesize = queue.Queue(maxsize=self.queue_size)
+        to_timeline = queue.Queue(maxsize=self.queue_size)
+        failed = threading.Event()
+        errors = []
+        timeline = TimelineWriter()
+        audio_segments = {}
+        # Worker threads don't inherit the caller's span context
+        parent = tracing.current_span()
+
+        def synthesize():
+            while True:
+                item = to_synthesize.get()
+                if item is _STOP:
+                    return
+                if failed.is_set():
+                    # Keep draining so the caller never blocks on a full queue
+                    continue
+                index, segment = item
+                cache = _CacheUse(self.cache) if self.cache is not None else None
+                try:
+                    with tracing.span('tts.segment', parent=parent, index=index, chars=len(segment['text'])) as active:
+                        audio = synthesize_with_retry(
+                            segment['text'], self.api_key, self.voice_id,
+                            max_retries=self.max_retries, output_format=self.output_format, cache=cache
+                        )
+                        active.set(audio_bytes=len(audio))
+                except Exception as e:
+                    errors.append(e)
+                    failed.set()
+                    continue
+                to_timeline.put((index, {
+                    'audio': audio,
+                    'start_time': segment.get('start_time', 0),
+                    'end_time': segment.get('end_time', 0),
+                    'delay_after': segment.get('delay_after', 0),
+                    'text': segment['text'],
+                    'cached': cache is not None and cache.hit
+                }))
+
+        def assemble():
+            while True:
+                item = to_timeline.get()
+                if item is _STOP:
+                    return
+                if failed.is_set():
+                    continue
+                index, audio_segment = item
+                audio_segments[index] = audio_segment
+                try:
+                    timeline.add(index, audio_segment)
+                except Exception as e:
+                    errors.append(e)
+                    failed.set()
+
+        workers = [
+            threading.Thread(target=synthesize, name=f"pipeline-tts-{i}", daemon=True)
+            for i in range(self.max_in_flight)
+        ]
+        writer = threading.Thread(target=assemble, name="pipeline-timeline", daemon=True)
+        for thread in workers + [writer]:
+            thread.start()
+
+        count = 0
+        try:
+            for segment in segments:
+                if failed.is_set():
+                    break
+                if not segment.get('text', '').strip():
+                    continue
+                to_synthesize.put((count, segment))
+                count += 1
+        finally:
+            for _ in workers:
+                to_synthesize.put(_STOP)
+            for thread in workers:
+                thread.join()
+            to_timeline.put(_STOP)
+            writer.join()
+
+        if errors:
+            raise errors[0]
+        if not count:
+            return [], None
+        with tracing.span('audio.concatenate', segments=count) as active:
+            wav = timeline.finish()
+            active.set(wav_bytes=len(wav))
+        return [audio_segments[index] for index in range(count)], wav
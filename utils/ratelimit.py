@@ -0,0 +1,223 @@
+"""
+Per-provider rate limiting
+One token bucket plus concurrency cap per provider, shared by every session
+and worker thread in the process. The rate adapts to what the API reports:
+Retry-After and x-ratelimit-* headers pause or slow it down, 429s halve it,
+and successful responses slowly raise it back to the configured ceiling.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# Requests per second (ceiling), burst size and concurrent requests per provider.
+# Tune with configure() or the rate_limits secret to match your plan's quota.
+DEFAULT_LIMITS = {
+    'gemini': {'rate': 1.0, 'burst': 5, 'max_concurrent': 4},
+    'elevenlabs': {'rate': 5.0, 'burst': 5, 'max_concurrent': 4},
+    'heygen': {'rate': 3.0, 'burst': 6, 'max_concurrent': 8},
+    'youtube': {'rate': 2.0, 'burst': 2, 'max_concurrent': 2}
+}
+
+# The adaptive rate never drops below this fraction of the ceiling
+MIN_RATE_FRACTION = 0.05
+# Share of the ceiling regained per successful response
+RECOVERY_STEP = 0.05
+# Pause after a 429 that has no Retry-After header
+DEFAULT_BACKOFF = 1.0
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def _parse_duration(value):
+    """
+    Seconds from a Retry-After / x-ratelimit-reset value: plain seconds, an epoch
+    timestamp, an HTTP date, or a Go-style duration like "1m30s" or "250ms"
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        pass
+    else:
+        # Large numbers are absolute epoch timestamps rather than deltas
+        if number > 1e12:
+            return max(0.0, number / 1000 - time.time())
+        if number > 1e9:
+            return max(0.0, number - time.time())
+        return max(0.0, number)
+
+    parts = _DURATION_RE.findall(value)
+    if parts and ''.join(n + u for n, u in parts) == value.replace(' ', ''):
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class ProviderLimiter:
+    """
+    Token bucket (rate tokens per second, up to burst) combined with a cap on
+    requests in flight. Use as:
+
+        with limiter.slot():
+            response = send()
+            limiter.observe(response.status_code, response.headers)
+    """
+
+    def __init__(self, name, rate, burst, max_concurrent):
+        self.name = name
+        self._cond = threading.Condition()
+        self._configure(rate, burst, max_concurrent)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._requests = 0
+        self._throttled = 0
+        self._waited = 0.0
+
+    def _configure(self, rate, burst, max_concurrent):
+        self.max_rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._rate = self.max_rate
+
+    def configure(self, rate=None, burst=None, max_concurrent=None):
+        with self._cond:
+            self._configure(
+                rate if rate is not None else self.max_rate,
+                burst if burst is not None else self.burst,
+                max_concurrent if max_concurrent is not None else self.max_concurrent
+            )
+            self._tokens = min(self._tokens, self.burst)
+            self._cond.notify_all()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._in_flight >= self.max_concurrent:
+                    wait = None
+                elif self._tokens < 1:
+                    wait = (1 - self._tokens) / self._rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self._requests += 1
+                    self._waited += now - started
+                    return
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def observe(self, status_code, headers):
+        """Adapt to a response's status and rate limit headers"""
+        retry_after = _parse_duration(headers.get('Retry-After'))
+        remaining = _header(headers, 'x-ratelimit-remaining-requests', 'x-ratelimit-remaining')
+        reset = _parse_duration(_header(headers, 'x-ratelimit-reset-requests', 'x-ratelimit-reset'))
+        try:
+            remaining = float(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+
+        with self._cond:
+            now = time.monotonic()
+            min_rate = self.max_rate * MIN_RATE_FRACTION
+            if status_code == 429:
+                self._throttled += 1
+                self._rate = max(min_rate, self._rate / 2)
+                self._tokens = min(self._tokens, 0.0)
+                pause = retry_after if retry_after is not None else reset
+                self._paused_until = max(self._paused_until, now + (pause if pause is not None else DEFAULT_BACKOFF))
+            elif status_code == 503 and retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            elif status_code < 400:
+                self._rate = min(self.max_rate, self._rate + self.max_rate * RECOVERY_STEP)
+
+            if remaining is not None and reset is not None:
+                if remaining < 1:
+                    # Quota window used up: wait for it to reset instead of collecting 429s
+                    self._paused_until = max(self._paused_until, now + reset)
+                elif reset > 0:
+                    # Spread what's left of the window over the time until it resets
+                    self._rate = max(min_rate, min(self._rate, remaining / reset))
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate': round(self._rate, 3),
+                'max_rate': self.max_rate,
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'throttled': self._throttled,
+                'waited_seconds': round(self._waited, 3),
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 3)
+            }
+
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+def limiter_for(provider):
+    """The process-wide limiter for a provider, or None for unknown providers"""
+    if provider not in DEFAULT_LIMITS:
+        return None
+    with _lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = ProviderLimiter(provider, **DEFAULT_LIMITS[provider])
+        return limiter
+
+
+def configure(provider, rate=None, burst=None, max_concurrent=None):
+    limiter_for(provider).configure(rate=rate, burst=burst, max_concurrent=max_concurrent)
+
+
+def configure_all(limits):
+    """Apply a {provider: {'rate': ..., 'burst': ..., 'max_concurrent': ...}} mapping"""
+    for provider, settings in (limits or {}).items():
+        if provider in DEFAULT_LIMITS:
+            configure(provider, **{key: settings[key] for key in ('rate', 'burst', 'max_concurrent') if key in settings})
+
+
+def stats():
+    with _lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
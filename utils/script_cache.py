@@ -0,0 +1,115 @@
+"""
+Script result cache
+Generated scripts keyed by normalized topic plus everything that shapes Gemini's
+answer (prompt, samples, model, generation config), with single-flight
+deduplication of concurrent requests for the same key
+"""
+
+import json
+import re
+import threading
+import time
+import unicodedata
+
+from utils.cache import BlobCache, content_key
+from utils.gemini import GEMINI_MODEL, GENERATION_CONFIG
+
+# Where a script came from, as returned by ScriptCache.get_or_generate
+GENERATED = 'generated'
+CACHED = 'cached'
+SHARED = 'shared'
+
+
+def normalize_topic(topic):
+    """Case, width, whitespace and trailing punctuation don't change the topic"""
+    topic = unicodedata.normalize('NFKC', str(topic)).casefold()
+    topic = re.sub(r'\s+', ' ', topic).strip()
+    return topic.rstrip('.!?;:, ')
+
+
+def script_cache_key(topic, prompt, samples, model=GEMINI_MODEL, generation_config=None):
+    return content_key(
+        normalize_topic(topic),
+        content_key(prompt),
+        content_key(samples),
+        model,
+        generation_config or GENERATION_CONFIG
+    )
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class ScriptCache:
+    """
+    Successful scripts are stored in a BlobCache as JSON with their creation
+    time. Reuse is opt-in: get_or_generate only returns a stored script when
+    max_age (seconds) is given and the script is younger than that. Concurrent
+    calls for the same key always share one generation, whatever max_age is.
+    Error strings are never stored.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self._blobs = BlobCache(directory, max_bytes=max_bytes)
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def get(self, key, max_age):
+        data = self._blobs.get(key)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            return None
+        if time.time() - entry.get('created_at', 0) > max_age:
+            return None
+        return entry.get('script')
+
+    def put(self, key, topic, script_json):
+        entry = {'created_at': time.time(), 'topic': topic, 'script': script_json}
+        self._blobs.put(key, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+    def get_or_generate(self, topic, prompt, samples, generate, max_age=None):
+        """
+        Returns (script JSON or error string, source) where source is GENERATED,
+        CACHED (reused within max_age) or SHARED (joined a call already in flight)
+        generate() is called at most once per key at a time
+        """
+        key = script_cache_key(topic, prompt, samples)
+        if max_age:
+            script_json = self.get(key, max_age)
+            if script_json is not None:
+                return script_json, CACHED
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            return flight.result, SHARED
+
+        try:
+            flight.result = generate()
+            if isinstance(flight.result, dict):
+                self.put(key, topic, flight.result)
+        except Exception as e:
+            flight.result = f"[Error: Unexpected error - {str(e)}]"
+            raise
+        finally:
+            if flight.result is None:
+                # Interrupted by a BaseException (e.g. Streamlit stopping or rerunning the leader's session)
+                flight.result = "[Error: Script generation was interrupted]"
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, GENERATED
+
+    def stats(self):
+        return self._blobs.stats()
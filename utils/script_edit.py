@@ -0,0 +1,248 @@
+"""
+Script edits and incremental re-voicing
+Edited scripts are diffed segment by segment against the previous version, so
+segments carry a version number that only moves when their text changes. A
+VoiceTake records where each segment's samples sit in a voiced WAV file; after
+an edit, retake() synthesizes only the changed segments and splices them into a
+copy of that file, taking every unchanged segment's audio from the old take.
+The time an edit costs grows with the edit, not with the script.
+"""
+
+import difflib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import tracing
+from utils.audio import (CHANNELS, PCM_OUTPUT_FORMAT, SAMPLE_RATE, SAMPLE_WIDTH, WAV_HEADER_SIZE,
+                         place_segment, plan_timeline, wav_header)
+from utils.tts import MAX_IN_FLIGHT, MAX_RETRIES, synthesize_with_retry
+
+# How an edited segment relates to the previous version (see diff_segments)
+UNCHANGED = 'unchanged'
+RETIMED = 'retimed'
+CHANGED = 'changed'
+ADDED = 'added'
+
+_FRAME_SIZE = SAMPLE_WIDTH * CHANNELS
+# Silence written per call when rebuilding a timeline
+_SILENCE = bytes(256 * 1024)
+
+
+def _text(segment):
+    return str(segment.get('text', '')).strip()
+
+
+def _timing(segment):
+    return float(segment.get('start_time') or 0), float(segment.get('delay_after') or 0)
+
+
+def diff_segments(old_segments, new_segments):
+    """
+    Match edited segments to the previous version by text, in order
+    Returns (one (status, old_index) pair per new segment, indexes of old
+    segments that are gone). status is UNCHANGED, RETIMED (same text, new
+    start_time/delay_after), CHANGED (text edited in place; old_index is the
+    segment it replaces) or ADDED (old_index None)
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [_text(segment) for segment in old_segments], [_text(segment) for segment in new_segments],
+        autojunk=False
+    )
+    entries = [None] * len(new_segments)
+    removed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for k in range(j2 - j1):
+            old_index = i1 + k if k < i2 - i1 else None
+            if tag == 'equal':
+                same_timing = _timing(old_segments[old_index]) == _timing(new_segments[j1 + k])
+                status = UNCHANGED if same_timing else RETIMED
+            else:
+                status = CHANGED if old_index is not None else ADDED
+            entries[j1 + k] = (status, old_index)
+        # Old segments left over once the new ones are paired up
+        removed.extend(range(i1 + (j2 - j1), i2))
+    return entries, removed
+
+
+def version_segments(old_segments, new_segments):
+    """
+    Copy of new_segments with a 'version' on each: kept from the previous
+    version unless the text changed (then +1); new segments start at 1
+    """
+    entries, _ = diff_segments(old_segments, new_segments)
+    versioned = []
+    for segment, (status, old_index) in zip(new_segments, entries):
+        segment = dict(segment)
+        previous = old_segments[old_index].get('version', 1) if old_index is not None else 0
+        segment['version'] = previous + 1 if status in (CHANGED, ADDED) else previous
+        versioned.append(segment)
+    return versioned
+
+
+class VoiceTake:
+    """
+    A voiced WAV file and its layout: the voice, and per voiced (non-empty)
+    segment its text, timing, version and position in the file (offset and
+    frames, in samples). Plain data, so it can live in session state via
+    to_dict() / from_dict().
+    """
+
+    def __init__(self, voice_id, segments, wav_path, total_frames, output_format=PCM_OUTPUT_FORMAT,
+                 sample_rate=SAMPLE_RATE):
+        self.voice_id = voice_id
+        self.segments = segments
+        self.wav_path = wav_path
+        self.total_frames = total_frames
+        self.output_format = output_format
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_audio_segments(cls, voice_id, audio_segments, wav_path, output_format=PCM_OUTPUT_FORMAT,
+                            sample_rate=SAMPLE_RATE):
+        """Layout of a WAV assembled from audio_segments (SegmentPipeline.run's list)"""
+        placements, total_frames = plan_timeline(audio_segments, sample_rate)
+        segments = [
+            {
+                'text': segment['text'],
+                'start_time': segment.get('start_time', 0),
+                'end_time': segment.get('end_time', 0),
+                'delay_after': segment.get('delay_after', 0),
+                'version': segment.get('version', 1),
+                'offset': offset,
+                'frames': len(pcm) // _FRAME_SIZE
+            }
+            for segment, (offset, pcm) in zip(audio_segments, placements)
+        ]
+        return cls(voice_id, segments, wav_path, total_frames, output_format, sample_rate)
+
+    def to_dict(self):
+        return {
+            'voice_id': self.voice_id,
+            'segments': self.segments,
+            'wav_path': self.wav_path,
+            'total_frames': self.total_frames,
+            'output_format': self.output_format,
+            'sample_rate': self.sample_rate
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def pending(self, segments):
+        """Indexes of voiced segments in segments that a retake would synthesize"""
+        voiced = [segment for segment in segments if _text(segment)]
+        entries, _ = diff_segments(self.segments, voiced)
+        return [index for index, (status, _) in enumerate(entries) if status in (CHANGED, ADDED)]
+
+
+def _layout(segments, frames, sample_rate):
+    """Offsets for segments of known length, by the timeline's placement rule (place_segment)"""
+    offsets = []
+    cursor = 0
+    for segment, count in zip(segments, frames):
+        offset, cursor = place_segment(cursor, segment, count, sample_rate)
+        offsets.append(offset)
+    return offsets, cursor
+
+
+def _write_silence(f, frames):
+    remaining = frames * _FRAME_SIZE
+    while remaining > 0:
+        chunk = _SILENCE[:min(len(_SILENCE), remaining)]
+        f.write(chunk)
+        remaining -= len(chunk)
+
+
+def retake(take, segments, api_key, wav_path, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES, cache=None):
+    """
+    Voice an edited script by reusing take: only CHANGED and ADDED segments
+    are synthesized, with the same voice and format. If every reused segment
+    keeps its place on the timeline, take's file is copied to wav_path and
+    patched where segments changed; otherwise wav_path is written segment by
+    segment, with unchanged audio read from take's file.
+    Returns (new VoiceTake for wav_path, stats dict)
+    """
+    voiced = [segment for segment in segments if _text(segment)]
+    entries, removed = diff_segments(take.segments, voiced)
+    to_synthesize = [index for index, (status, _) in enumerate(entries) if status in (CHANGED, ADDED)]
+
+    with tracing.span('voice.retake', voice_id=take.voice_id, segments=len(voiced),
+                      resynthesized=len(to_synthesize)) as active:
+        # Worker threads don't inherit the caller's span context
+        parent = tracing.current_span()
+
+        def synthesize(index):
+            text = voiced[index]['text']
+            with tracing.span('tts.segment', parent=parent, index=index, chars=len(text)):
+                audio = synthesize_with_retry(
+                    text, api_key, take.voice_id,
+                    max_retries=max_retries, output_format=take.output_format, cache=cache
+                )
+            return audio[:len(audio) // _FRAME_SIZE * _FRAME_SIZE]
+
+        synthesized = {}
+        if to_synthesize:
+            workers = max(1, min(max_in_flight, len(to_synthesize)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-retake") as executor:
+                for index, pcm in zip(to_synthesize, executor.map(synthesize, to_synthesize)):
+                    synthesized[index] = pcm
+
+        frames = [
+            len(synthesized[index]) // _FRAME_SIZE if index in synthesized else take.segments[old_index]['frames']
+            for index, (_, old_index) in enumerate(entries)
+        ]
+        offsets, total_frames = _layout(voiced, frames, take.sample_rate)
+        in_place = total_frames == take.total_frames and all(
+            offsets[index] == take.segments[old_index]['offset']
+            for index, (status, old_index) in enumerate(entries)
+            if index not in synthesized
+        )
+
+        if in_place:
+            shutil.copyfile(take.wav_path, wav_path)
+            with open(wav_path, 'r+b') as f:
+                # Silence what the changed and removed segments used to say, then write the new audio
+                replaced = [old_index for index, (_, old_index) in enumerate(entries)
+                            if index in synthesized and old_index is not None]
+                for old_index in replaced + removed:
+                    old = take.segments[old_index]
+                    f.seek(WAV_HEADER_SIZE + old['offset'] * _FRAME_SIZE)
+                    _write_silence(f, old['frames'])
+                for index, pcm in synthesized.items():
+                    f.seek(WAV_HEADER_SIZE + offsets[index] * _FRAME_SIZE)
+                    f.write(pcm)
+        else:
+            with open(take.wav_path, 'rb') as old_file, open(wav_path, 'wb') as f:
+                f.write(wav_header(total_frames * _FRAME_SIZE, take.sample_rate))
+                cursor = 0
+                for index, (_, old_index) in enumerate(entries):
+                    _write_silence(f, offsets[index] - cursor)
+                    if index in synthesized:
+                        f.write(synthesized[index])
+                    else:
+                        old = take.segments[old_index]
+                        old_file.seek(WAV_HEADER_SIZE + old['offset'] * _FRAME_SIZE)
+                        f.write(old_file.read(old['frames'] * _FRAME_SIZE))
+                    cursor = offsets[index] + frames[index]
+                _write_silence(f, total_frames - cursor)
+
+        new_segments = []
+        for index, segment in enumerate(voiced):
+            new_segments.append({
+                'text': segment['text'],
+                'start_time': segment.get('start_time', 0),
+                'end_time': segment.get('end_time', 0),
+                'delay_after': segment.get('delay_after', 0),
+                'version': segment.get('version', 1),
+                'offset': offsets[index],
+                'frames': frames[index]
+            })
+        stats = {
+            'resynthesized': len(to_synthesize),
+            'reused': len(voiced) - len(to_synthesize),
+            'removed': len(removed),
+            'in_place': in_place
+        }
+        active.set(**stats)
+    return VoiceTake(take.voice_id, new_segments, wav_path, total_frames, take.output_format, take.sample_rate), stats
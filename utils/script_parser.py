@@ -0,0 +1,269 @@
+"""
+Tolerant parsing of Gemini script output
+The model's text is reduced to its outermost JSON value and common defects are
+repaired in one pass: markdown fences and chatter around the JSON, smart quotes
+used as JSON quotes, raw newlines inside strings, trailing commas, and output
+cut off at maxOutputTokens. The result is checked against the script schema
+(title + segments). A cut-off script keeps every complete segment and is
+flagged truncated, so the caller can ask Gemini for just the missing tail.
+"""
+
+import json
+
+# Curly double quotes the model sometimes uses around keys and values
+SMART_QUOTES = '“”„‟'
+
+# Repairs reported in ParsedScript.repairs
+FENCE_REPAIR = 'fence'
+SMART_QUOTES_REPAIR = 'smart_quotes'
+NEWLINES_REPAIR = 'newlines'
+TRAILING_COMMAS_REPAIR = 'trailing_commas'
+BRACKETS_REPAIR = 'brackets'
+TRUNCATED_REPAIR = 'truncated'
+UNESCAPED_QUOTES_REPAIR = 'unescaped_quotes'
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class ScriptParseError(ValueError):
+    """The text holds no usable script"""
+
+
+class ParsedScript:
+    """
+    script: {'title': str, 'segments': [...]} (valid per validate_script)
+    repairs: what had to be fixed to parse it
+    truncated: the JSON was cut off; segments after the last complete one are missing
+    problems: segments dropped or fields defaulted by validation
+    """
+
+    def __init__(self, script, repairs=(), truncated=False, problems=()):
+        self.script = script
+        self.repairs = list(repairs)
+        self.truncated = truncated
+        self.problems = list(problems)
+
+
+def _strip_trailing_comma(out):
+    position = len(out) - 1
+    while position >= 0 and out[position].isspace():
+        position -= 1
+    if position >= 0 and out[position] == ',':
+        del out[position]
+        return True
+    return False
+
+
+def _closes_string(text, position):
+    """A quote ends a string only if JSON syntax (or the end of the text) follows it"""
+    for char in text[position + 1:position + 200]:
+        if not char.isspace():
+            return char in ':,}]'
+    return True
+
+
+def repair_json(text):
+    """
+    The outermost JSON object (or array) in text, repaired so json.loads can read it
+    Returns (json text, list of repairs, truncated); raises ScriptParseError if
+    there is no JSON at all
+    """
+    starts = [position for position in (text.find('{'), text.find('[')) if position >= 0]
+    if not starts:
+        raise ScriptParseError("No JSON object in the response")
+
+    out = []
+    stack = []
+    repairs = set()
+    in_string = False
+    smart_string = False
+    escape = False
+    # Last point where the output could be cut and closed: (length of out, open brackets)
+    safe_point = (0, ())
+    complete = False
+
+    text = text[min(starts):]
+    for position, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == '\\':
+                escape = True
+                out.append(char)
+            elif char == '"' or (smart_string and char in SMART_QUOTES):
+                if _closes_string(text, position):
+                    in_string = False
+                    out.append('"')
+                elif char == '"':
+                    # A quotation inside the text, e.g. yeh "acha" hai
+                    repairs.add(UNESCAPED_QUOTES_REPAIR)
+                    out.append('\\"')
+                else:
+                    out.append(char)
+            elif char == '\n':
+                repairs.add(NEWLINES_REPAIR)
+                out.append('\\n')
+            elif char == '\r':
+                continue
+            else:
+                out.append(char)
+        elif char == '"' or char in SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            if smart_string:
+                repairs.add(SMART_QUOTES_REPAIR)
+            out.append('"')
+        elif char in _CLOSERS:
+            stack.append(char)
+            out.append(char)
+            safe_point = (len(out), tuple(stack))
+        elif char in '}]':
+            if not stack:
+                continue
+            expected = _CLOSERS[stack.pop()]
+            if char != expected:
+                repairs.add(BRACKETS_REPAIR)
+            if _strip_trailing_comma(out):
+                repairs.add(TRAILING_COMMAS_REPAIR)
+            out.append(expected)
+            if not stack:
+                complete = True
+                break
+            safe_point = (len(out), tuple(stack))
+        elif char == ',':
+            safe_point = (len(out), tuple(stack))
+            out.append(char)
+        else:
+            out.append(char)
+
+    truncated = not complete
+    if truncated:
+        # Drop the unfinished element and close everything that was still open
+        repairs.add(TRUNCATED_REPAIR)
+        length, open_brackets = safe_point
+        del out[length:]
+        _strip_trailing_comma(out)
+        out.extend(_CLOSERS[bracket] for bracket in reversed(open_brackets))
+    return ''.join(out), sorted(repairs), truncated
+
+
+def _number(value, default):
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        number = float(str(value).strip().rstrip('s'))
+    except (TypeError, ValueError):
+        return default
+    return int(number) if number.is_integer() else number
+
+
+def normalize_segment(raw, previous_end=0):
+    """
+    One segment as validate_script keeps it: text stripped, missing or
+    non-numeric start_time / end_time / delay_after defaulted from previous_end
+    (the end_time of the segment kept before it)
+    Returns (segment or None if it has no text, problem or None)
+    """
+    text = raw.get('text') if isinstance(raw, dict) else None
+    if not isinstance(text, str) or not text.strip():
+        return None, "has no text"
+    start_time = _number(raw.get('start_time'), previous_end)
+    end_time = _number(raw.get('end_time'), start_time)
+    delay_after = _number(raw.get('delay_after', 0), 0)
+    problem = None
+    if raw.get('start_time') is None or start_time != raw.get('start_time') or end_time != raw.get('end_time'):
+        problem = "timing defaulted"
+    segment = dict(raw)
+    segment.update(
+        text=text.strip(),
+        start_time=max(0, start_time),
+        end_time=max(start_time, end_time),
+        delay_after=max(0, delay_after)
+    )
+    return segment, problem
+
+
+def validate_script(data):
+    """
+    Check parsed JSON against the script schema and normalize it
+    Accepts the script object, a bare segments array, or the script wrapped in
+    one outer key. Segments without text are dropped; missing or non-numeric
+    start_time / end_time / delay_after are defaulted from the segment before.
+    Returns (script, problems); raises ScriptParseError if no segment is usable
+    """
+    if isinstance(data, dict) and 'segments' not in data and len(data) == 1:
+        inner = next(iter(data.values()))
+        if isinstance(inner, (dict, list)):
+            data = inner
+    if isinstance(data, list):
+        data = {'title': '', 'segments': data}
+    if not isinstance(data, dict):
+        raise ScriptParseError("Script is not a JSON object")
+
+    problems = []
+    title = data.get('title')
+    if not isinstance(title, str):
+        problems.append("title missing")
+        title = '' if title is None else str(title)
+
+    raw_segments = data.get('segments')
+    if not isinstance(raw_segments, list):
+        raise ScriptParseError("Script has no segments array")
+
+    segments = []
+    previous_end = 0
+    for position, raw in enumerate(raw_segments):
+        segment, problem = normalize_segment(raw, previous_end)
+        if problem:
+            problems.append(f"segment {position + 1} {problem}")
+        if segment is None:
+            continue
+        segments.append(segment)
+        previous_end = segment['end_time']
+
+    if not segments:
+        raise ScriptParseError("Script has no segments with text")
+    return dict(data, title=title.strip(), segments=segments), problems
+
+
+def parse_script(text):
+    """
+    Script JSON from the model's text (see module docstring)
+    Returns a ParsedScript; raises ScriptParseError when nothing usable is there
+    """
+    cleaned = text.strip()
+    fenced = cleaned.startswith('```')
+    if fenced:
+        cleaned = cleaned.split('\n', 1)[1] if '\n' in cleaned else ''
+        cleaned = cleaned.rsplit('```', 1)[0].strip()
+
+    repairs, truncated = [], False
+    try:
+        data = json.loads(cleaned)
+    except ValueError:
+        repaired, repairs, truncated = repair_json(cleaned)
+        try:
+            data = json.loads(repaired)
+        except ValueError as e:
+            raise ScriptParseError(f"Could not repair the JSON: {str(e)}") from e
+
+    if fenced:
+        repairs = [FENCE_REPAIR] + repairs
+    script, problems = validate_script(data)
+    return ParsedScript(script, repairs, truncated, problems)
+
+
+def merge_continuation(script, segments):
+    """
+    script with the continuation's segments appended, skipping any the model repeated
+    """
+    seen = {segment['text'] for segment in script['segments']}
+    merged = list(script['segments'])
+    for segment in segments:
+        if segment['text'] not in seen:
+            merged.append(segment)
+            seen.add(segment['text'])
+    return dict(script, segments=merged)
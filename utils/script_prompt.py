@@ -0,0 +1,72 @@
+"""
+Script-generation prompt for Gemini
+The static part (instructions, prompt.txt, sample scripts) is rendered once and reused
+"""
+
+from functools import lru_cache
+
+# Everything before the topic; {prompt} and {samples} are filled in once per asset version
+SCRIPT_PROMPT_PREFIX = """
+{prompt}
+
+IMPORTANT: You MUST write the entire script in ROMAN URDU only. Do not use English except for technical terms that don't have Roman Urdu equivalents.
+
+Examples of Roman Urdu style you should follow:
+- "Aaj main aap ko bataunga..."
+- "Yeh kya baat hai..."
+- "Dekho yaar..."
+- "Lagta hai..."
+- "Samajh gaye?"
+
+Sample Scripts for Reference:
+{samples}
+
+Video Topic: """
+
+# Everything after the topic
+SCRIPT_PROMPT_SUFFIX = """
+
+CRITICAL: Return the script in this EXACT JSON format:
+{
+  "title": "Video title in Roman Urdu",
+  "segments": [
+    {
+      "start_time": 0,
+      "end_time": 10,
+      "delay_after": 0,
+      "text": "Roman Urdu text for first segment"
+    },
+    {
+      "start_time": 10,
+      "end_time": 25,
+      "delay_after": 1,
+      "text": "Roman Urdu text for second segment"
+    }
+  ]
+}
+
+Remember: 
+- Write ONLY in Roman Urdu with casual, witty tone
+- Include proper timing based on your script timestamps
+- Add delay_after in seconds for pauses between segments
+- Return ONLY the JSON, no extra text before or after
+"""
+
+
+@lru_cache(maxsize=4)
+def render_prompt_prefix(prompt, samples):
+    """
+    Static prompt prefix for the given prompt.txt and sample scripts
+    Cached, so the large sample text is only formatted when the assets change
+    """
+    return SCRIPT_PROMPT_PREFIX.format(prompt=prompt, samples=samples)
+
+
+def build_script_prompt(topic, prompt, samples):
+    """Full prompt asking Gemini for a Roman Urdu script in JSON format"""
+    return render_prompt_prefix(prompt, samples) + build_topic_prompt(topic)
+
+
+def build_topic_prompt(topic):
+    """The per-topic rest of the prompt, sent after a cached prefix"""
+    return topic + SCRIPT_PROMPT_SUFFIX
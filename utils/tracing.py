@@ -0,0 +1,220 @@
+"""
+Lightweight tracing
+Spans around each pipeline stage, exported as OpenTelemetry-style JSON log
+lines and kept in memory for per-stage latency percentiles
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "idea-to-video"
+# Finished spans kept in memory for stage_stats()
+RECENT_SPANS = 5000
+
+# Size at which the span log is rotated, and rotated files kept (traces.jsonl.1, ...)
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+EXPORT_BACKUPS = 3
+
+_current = contextvars.ContextVar('current_span', default=None)
+_recent = deque(maxlen=RECENT_SPANS)
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+_export_path = None
+_export_handler = None
+# Span log lines only, never the application's own log
+_exporter = logging.getLogger(__name__ + '.export')
+_exporter.propagate = False
+_exporter.setLevel(logging.INFO)
+
+
+class Span:
+    """One timed operation; attributes can be added while it runs"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = 'OK'
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = 'ERROR'
+        self.status_message = str(error)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.start_ns + int(self.duration_ms * 1e6),
+            'duration_ms': round(self.duration_ms, 3),
+            'status': {'code': self.status, 'message': self.status_message},
+            'attributes': self.attributes,
+            'resource': {'service.name': SERVICE_NAME}
+        }
+
+
+def set_export_path(path, max_bytes=EXPORT_MAX_BYTES, backups=EXPORT_BACKUPS):
+    """
+    Also append every finished span as a JSON line to path (None to stop)
+    The file is rotated once it reaches max_bytes, keeping backups older files
+    """
+    global _export_path, _export_handler
+    with _export_lock:
+        if path == _export_path:
+            return
+        if _export_handler:
+            _exporter.removeHandler(_export_handler)
+            _export_handler.close()
+            _export_handler = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            _export_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True
+            )
+            _export_handler.setFormatter(logging.Formatter('%(message)s'))
+            _exporter.addHandler(_export_handler)
+        _export_path = path
+
+
+def current_span():
+    return _current.get()
+
+
+def _export(span):
+    record = span.to_dict()
+    with _recent_lock:
+        _recent.append(record)
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    logger.debug(line)
+    if _export_handler:
+        _exporter.info(line)
+
+
+@contextmanager
+def span(name, parent=None, activate=True, **attributes):
+    """
+    Time the enclosed block as a span named name
+    The parent is the current span of this context unless given explicitly
+    (worker threads don't inherit context, so pass current_span() to them).
+    Generators should pass activate=False: they suspend inside the block, so
+    the span must not become the caller's current span.
+    """
+    active = Span(name, parent or _current.get(), attributes)
+    token = _current.set(active) if activate else None
+    try:
+        yield active
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        active.record_error(e)
+        raise
+    finally:
+        if token is not None:
+            _current.reset(token)
+        active.end()
+        _export(active)
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    A span that is ended explicitly with end_span(), possibly on another thread
+    (e.g. a render finished by the shared poller); it never becomes current
+    """
+    return Span(name, parent or _current.get(), attributes)
+
+
+def end_span(active):
+    active.end()
+    _export(active)
+
+
+@contextmanager
+def use_span(active):
+    """Make a span from start_span current for the enclosed block, without ending it"""
+    token = _current.set(active)
+    try:
+        yield active
+    finally:
+        _current.reset(token)
+
+
+def traced(name):
+    """Decorator form of span() for whole functions"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def recent_spans():
+    with _recent_lock:
+        return list(_recent)
+
+
+def clear():
+    """Forget the in-memory spans (the export file is left alone)"""
+    with _recent_lock:
+        _recent.clear()
+
+
+def stage_stats(spans=None):
+    """
+    Latency summary per span name over recent spans:
+    {name: {'count', 'errors', 'p50_ms', 'p95_ms', 'max_ms'}}
+    """
+    durations = {}
+    errors = {}
+    for record in spans if spans is not None else recent_spans():
+        durations.setdefault(record['name'], []).append(record['duration_ms'])
+        if record['status']['code'] == 'ERROR':
+            errors[record['name']] = errors.get(record['name'], 0) + 1
+
+    summary = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        summary[name] = {
+            'count': len(values),
+            'errors': errors.get(name, 0),
+            'p50_ms': round(_percentile(values, 0.5), 1),
+            'p95_ms': round(_percentile(values, 0.95), 1),
+            'max_ms': round(values[-1], 1)
+        }
+    return summary
@@ -0,0 +1,108 @@
+"""
+ElevenLabs text-to-speech helpers
+Single-segment synthesis with caching and retries; utils.pipeline runs segments
+concurrently and keeps them in script order
+"""
+
+import time
+
+import requests
+
+from utils import api_client
+from utils.cache import content_key
+
+ELEVENLABS_TTS_PATH = "/v1/text-to-speech/{voice_id}"
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.75
+}
+# Model ElevenLabs picks when no model_id is sent
+DEFAULT_MODEL = "default"
+
+# Default number of segment requests allowed in flight at once
+MAX_IN_FLIGHT = 4
+# Default number of retries for a single failed segment
+MAX_RETRIES = 2
+# Base delay (seconds) between retries of a segment, doubled each attempt
+RETRY_BACKOFF = 1.0
+
+
+class SynthesisError(Exception):
+    """Raised when ElevenLabs does not return audio for a request"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def retryable(self):
+        # Client errors (bad voice id, bad key, ...) won't fix themselves, except rate limiting
+        if self.status_code is None:
+            return True
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def tts_cache_key(text, voice_id, voice_settings=None, model_id=None, output_format=None):
+    """
+    Content address of a synthesis request: same text, voice, settings and model
+    always produce the same key
+    """
+    voice_settings = voice_settings or DEFAULT_VOICE_SETTINGS
+    return content_key(
+        text,
+        voice_id,
+        voice_settings.get("stability"),
+        voice_settings.get("similarity_boost"),
+        model_id or DEFAULT_MODEL,
+        output_format or "mp3"
+    )
+
+
+def text_to_speech(text, api_key, voice_id, voice_settings=None, output_format=None, model_id=None, cache=None):
+    """
+    Synthesize one piece of text and return the audio bytes
+    (MP3 by default, or e.g. raw PCM with output_format="pcm_24000")
+    When a BlobCache is given, identical requests are served from it
+    Raises SynthesisError on a non-200 response
+    """
+    if cache is not None:
+        key = tts_cache_key(text, voice_id, voice_settings, model_id, output_format)
+        audio = cache.get(key)
+        if audio is not None:
+            return audio
+
+    url = api_client.api_url('elevenlabs', ELEVENLABS_TTS_PATH.format(voice_id=voice_id))
+    headers = {
+        "xi-api-key": api_key,
+        "Content-Type": "application/json"
+    }
+    data = {
+        "text": text,
+        "voice_settings": voice_settings or DEFAULT_VOICE_SETTINGS
+    }
+    if model_id:
+        data["model_id"] = model_id
+    params = {"output_format": output_format} if output_format else None
+    response = api_client.post(url, headers=headers, json=data, params=params)
+    if response.status_code == 200:
+        if cache is not None:
+            cache.put(key, response.content)
+        return response.content
+    raise SynthesisError(f"ElevenLabs API error: {response.status_code}", response.status_code)
+
+
+def synthesize_with_retry(text, api_key, voice_id, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                          output_format=None, cache=None):
+    """
+    Synthesize a single segment, retrying transient failures with exponential backoff
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return text_to_speech(text, api_key, voice_id, output_format=output_format, cache=cache)
+        except SynthesisError as e:
+            if not e.retryable or attempt == max_retries:
+                raise
+        except requests.exceptions.RequestException:
+            if attempt == max_retries:
+                raise
+        time.sleep(backoff * (2 ** attempt))
@@ -0,0 +1,300 @@
+"""
+A/B variants
+One script voiced and rendered several ways, for side-by-side comparison. A
+set of (voice_id, avatar_id) pairs runs concurrently, and nothing shared is
+done twice: each distinct voice is synthesized once (segments already voiced
+come from the TTS cache) and uploaded to HeyGen once, then every avatar paired
+with that voice renders from the same audio asset while other voices are still
+being synthesized. Renders are watched by HeyGen's shared status poller, so
+they don't hold a thread each.
+
+Usage:
+    python -m utils.variants script.json --pair VOICE_A:AVATAR_1 --pair VOICE_B:AVATAR_1 --pair VOICE_B:AVATAR_2
+
+A pair without an avatar (VOICE_C or VOICE_C:) only compares the audio. The
+output directory gets the audio and videos, variants.json and comparison.html.
+"""
+
+import argparse
+import html
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from utils import ratelimit, tracing
+from utils.audio import WAV_HEADER_SIZE, pcm_duration
+from utils.batch import load_api_keys, load_secrets
+from utils.cache import BlobCache
+from utils.heygen import estimate_render_seconds, log_notify, submit_render, upload_voice
+from utils.pipeline import SegmentPipeline
+from utils.tts import MAX_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Voices synthesized at once; each also has tts_max_in_flight segment requests
+VOICE_WORKERS = 2
+
+
+def _slug(value):
+    return re.sub(r'[^A-Za-z0-9]+', '-', str(value)).strip('-')[:24] or 'x'
+
+
+def parse_pairs(values):
+    """'VOICE:AVATAR' strings -> unique (voice_id, avatar_id or None) tuples, in order"""
+    pairs = []
+    for value in values:
+        voice_id, _, avatar_id = value.partition(':')
+        pair = (voice_id.strip(), avatar_id.strip() or None)
+        if pair[0] and pair not in pairs:
+            pairs.append(pair)
+    return pairs
+
+
+class VariantRunner:
+    """
+    Runs the variants of one script. Voices go through a pool of voice_workers
+    (SegmentPipeline + one HeyGen upload each); as soon as a voice is ready, its
+    renders are started and left to the shared poller (submit() returns then, with
+    a Future of the results; run() waits for them). Files are written to out_dir
+    as <run_id>-<voice>.wav and <run_id>-<voice>-<avatar>.mp4, so out_dir can be
+    a media store directory.
+    notify(level, message) gets progress, prefixed with the variant it is about.
+    """
+
+    def __init__(self, api_keys, out_dir, tts_max_in_flight=MAX_IN_FLIGHT, tts_cache=None,
+                 voice_workers=VOICE_WORKERS, notify=log_notify, run_id=None):
+        self.api_keys = api_keys
+        self.out_dir = out_dir
+        self.tts_max_in_flight = tts_max_in_flight
+        self.tts_cache = tts_cache
+        self.voice_workers = max(1, voice_workers)
+        self.notify = notify
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+
+    def _voice(self, script_json, voice_id, render, parent):
+        """Synthesize and (if any of its variants renders) upload one voice"""
+        started = time.monotonic()
+        with tracing.span('variants.voice', parent=parent, voice_id=voice_id) as active:
+            pipeline = SegmentPipeline(
+                self.api_keys['elevenlabs'], voice_id,
+                max_in_flight=self.tts_max_in_flight, cache=self.tts_cache
+            )
+            audio_segments, wav = pipeline.run(script_json.get('segments', []))
+            if not audio_segments:
+                raise RuntimeError("Script has no voice segments")
+            audio_path = os.path.join(self.out_dir, f"{self.run_id}-{_slug(voice_id)}.wav")
+            with open(audio_path, 'wb') as f:
+                f.write(wav)
+            voice = {
+                'audio_path': audio_path,
+                'duration_seconds': round(pcm_duration(wav[WAV_HEADER_SIZE:]), 2),
+                'voice_seconds': round(time.monotonic() - started, 3),
+                'heygen_voice': None
+            }
+            if render:
+                def notify(level, message):
+                    self.notify(level, f"[{voice_id}] {message}")
+
+                with open(audio_path, 'rb') as audio_file:
+                    voice['heygen_voice'] = upload_voice(audio_file, self.api_keys['heygen'], notify=notify)
+                if voice['heygen_voice'] is None:
+                    raise RuntimeError("Could not upload the audio to HeyGen")
+            active.set(duration_seconds=voice['duration_seconds'])
+            return voice
+
+    def _render(self, voice, voice_id, avatar_id, parent):
+        """Start one render; returns a Future of (video path, seconds)"""
+        started = time.monotonic()
+
+        def notify(level, message):
+            self.notify(level, f"[{voice_id} / {avatar_id}] {message}")
+
+        active = tracing.start_span('variants.render', parent=parent, voice_id=voice_id, avatar_id=avatar_id)
+        result = Future()
+
+        def finish(render):
+            try:
+                video_path = render.result()
+                if not video_path:
+                    raise RuntimeError("HeyGen render failed")
+                result.set_result((video_path, round(time.monotonic() - started, 3)))
+            except Exception as e:
+                active.record_error(e)
+                result.set_exception(e)
+            finally:
+                tracing.end_span(active)
+
+        try:
+            render = submit_render(
+                voice['heygen_voice'], self.api_keys['heygen'], avatar_id, notify=notify,
+                video_path=os.path.join(self.out_dir, f"{self.run_id}-{_slug(voice_id)}-{_slug(avatar_id)}.mp4"),
+                eta=estimate_render_seconds(voice['duration_seconds'])
+            )
+        except Exception as e:
+            render = Future()
+            render.set_exception(e)
+        render.add_done_callback(finish)
+        return result
+
+    def submit(self, script_json, pairs):
+        """
+        Synthesizes and uploads the voices and starts the renders, then returns
+        a Future of the records run() returns; the renders are left to the
+        shared poller, so the caller is free while they run
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        variants = [
+            {'voice_id': voice_id, 'avatar_id': avatar_id, 'status': 'running', 'timings': {}}
+            for voice_id, avatar_id in dict.fromkeys(pairs)
+        ]
+        by_voice = {}
+        for variant in variants:
+            by_voice.setdefault(variant['voice_id'], []).append(variant)
+
+        # Ends with the last render, so it is not a with-block; pool threads get it as parent
+        active = tracing.start_span('variants.run', variants=len(variants), voices=len(by_voice))
+        render_futures = {}
+        try:
+            with ThreadPoolExecutor(self.voice_workers, thread_name_prefix="variant-voice") as voice_pool:
+                voice_futures = {
+                    voice_pool.submit(
+                        self._voice, script_json, voice_id,
+                        any(variant['avatar_id'] for variant in group), active
+                    ): voice_id
+                    for voice_id, group in by_voice.items()
+                }
+                for future in as_completed(voice_futures):
+                    voice_id = voice_futures[future]
+                    try:
+                        voice = future.result()
+                    except Exception as e:
+                        self.notify('error', f"[{voice_id}] Voice failed: {str(e)}")
+                        for variant in by_voice[voice_id]:
+                            variant.update(status='failed', error=str(e))
+                        continue
+                    self.notify('info', f"[{voice_id}] Voice ready ({voice['duration_seconds']}s of audio)")
+                    for variant in by_voice[voice_id]:
+                        variant['audio_path'] = voice['audio_path']
+                        variant['duration_seconds'] = voice['duration_seconds']
+                        variant['timings']['voice'] = voice['voice_seconds']
+                        if variant['avatar_id']:
+                            render_futures[self._render(voice, voice_id, variant['avatar_id'], active)] = variant
+                        else:
+                            variant['status'] = 'done'
+        except Exception as e:
+            active.record_error(e)
+            tracing.end_span(active)
+            raise
+
+        result = Future()
+        remaining = [len(render_futures)]
+        lock = threading.Lock()
+
+        def finish(future):
+            variant = render_futures[future]
+            try:
+                variant['video_path'], variant['timings']['render'] = future.result()
+                variant['status'] = 'done'
+            except Exception as e:
+                variant.update(status='failed', error=str(e))
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            tracing.end_span(active)
+            result.set_result(variants)
+
+        if not render_futures:
+            tracing.end_span(active)
+            result.set_result(variants)
+        for future in list(render_futures):
+            future.add_done_callback(finish)
+        return result
+
+    def run(self, script_json, pairs):
+        """
+        Returns one record per unique (voice_id, avatar_id) pair, in order:
+        status ('done' or 'failed' with 'error'), audio_path, duration_seconds,
+        video_path (when an avatar was given) and timings
+        """
+        return self.submit(script_json, pairs).result()
+
+
+def comparison_html(variants, title, out_dir):
+    """Side-by-side page of the variants' videos (or audio), with relative links"""
+    cards = []
+    for variant in variants:
+        label = html.escape(variant['voice_id'] + (f" / {variant['avatar_id']}" if variant['avatar_id'] else ""))
+        if variant['status'] != 'done':
+            media = f"<p class=\"error\">{html.escape(variant.get('error', 'failed'))}</p>"
+        elif variant.get('video_path'):
+            media = f"<video controls preload=\"metadata\" src=\"{html.escape(os.path.relpath(variant['video_path'], out_dir))}\"></video>"
+        else:
+            media = f"<audio controls preload=\"metadata\" src=\"{html.escape(os.path.relpath(variant['audio_path'], out_dir))}\"></audio>"
+        timings = ", ".join(f"{stage} {seconds}s" for stage, seconds in variant['timings'].items())
+        duration = f"{variant['duration_seconds']}s audio" if variant.get('duration_seconds') else ""
+        cards.append(f"<div class=\"card\"><h3>{label}</h3>{media}<p>{duration} {html.escape(timings)}</p></div>")
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)} - variants</title>
+<style>
+body {{ font-family: sans-serif; margin: 24px; }}
+.grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(320px, 1fr)); gap: 16px; }}
+.card {{ border: 1px solid #ccc; border-radius: 8px; padding: 12px; }}
+.card video, .card audio {{ width: 100%; }}
+.error {{ color: #b00; }}
+</style></head>
+<body><h1>{html.escape(title)}</h1><div class="grid">
+{chr(10).join(cards)}
+</div></body></html>
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Voice and render one script several ways for comparison")
+    parser.add_argument("script", help="Script JSON (title + segments), e.g. a batch run's script.json")
+    parser.add_argument("--pair", action="append", required=True, metavar="VOICE_ID[:AVATAR_ID]",
+                        help="A variant to produce; repeat for each")
+    parser.add_argument("--out", default="variants_output", help="Output directory")
+    parser.add_argument("--voice-workers", type=int, default=VOICE_WORKERS)
+    parser.add_argument("--tts-max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--tts-cache-dir", default=os.path.join(".cache", "tts"))
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(message)s")
+
+    with open(args.script, encoding='utf-8') as f:
+        script_json = json.load(f)
+    pairs = parse_pairs(args.pair)
+    api_keys = load_api_keys()
+    needed = ['elevenlabs'] + (['heygen'] if any(avatar_id for _, avatar_id in pairs) else [])
+    missing = [name for name in needed if not api_keys.get(name)]
+    if missing:
+        parser.error(f"Missing API keys: {', '.join(missing)}")
+
+    ratelimit.configure_all(load_secrets().get('rate_limits'))
+
+    runner = VariantRunner(
+        api_keys, args.out,
+        tts_max_in_flight=args.tts_max_in_flight,
+        tts_cache=BlobCache(args.tts_cache_dir),
+        voice_workers=args.voice_workers
+    )
+    variants = runner.run(script_json, pairs)
+    with open(os.path.join(args.out, 'variants.json'), 'w', encoding='utf-8') as f:
+        json.dump(variants, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(args.out, 'comparison.html'), 'w', encoding='utf-8') as f:
+        f.write(comparison_html(variants, script_json.get('title', 'Script'), args.out))
+    failed = [variant for variant in variants if variant['status'] == 'failed']
+    logger.info("Finished %d variants, %d failed; see %s", len(variants), len(failed),
+                os.path.join(args.out, 'comparison.html'))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
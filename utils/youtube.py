@@ -0,0 +1,495 @@
+"""
+YouTube uploads
+Videos go up with the resumable upload protocol: one session per video, then
+chunked PUTs read straight from the file on disk. The session URI is kept next
+to the video, so an upload interrupted by a dropped connection, a provider error
+or a restart of the process continues from the last byte YouTube acknowledged.
+Every request goes through the shared 'youtube' rate limiter, and a daily quota
+budget stops uploads before the API starts refusing them.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import requests
+
+from utils import api_client, tracing
+from utils.log import notifier
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_UPLOAD_PATH = "/upload/youtube/v3/videos"
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+WATCH_URL = "https://youtube.com/watch?v={}"
+
+# Chunks must be multiples of 256 KiB (except the last one)
+CHUNK_GRANULARITY = 256 * 1024
+CHUNK_SIZE = 32 * CHUNK_GRANULARITY
+# Consecutive failed requests without any progress before an upload gives up
+MAX_RETRIES = 8
+# Upload sessions live about a week on YouTube's side; don't try older ones
+SESSION_MAX_AGE = 6 * 24 * 60 * 60
+SESSION_SUFFIX = ".upload.json"
+
+# videos.insert costs 1600 of the default 10,000 daily quota units
+INSERT_QUOTA_COST = 1600
+DAILY_QUOTA = 10000
+QUOTA_PATH = os.path.join(".cache", "youtube_quota.json")
+
+# Responses after which resuming (after a pause) can succeed
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# The session is gone: start a new one
+EXPIRED_STATUSES = (404, 410)
+
+
+class UploadError(Exception):
+    pass
+
+
+class QuotaExhaustedError(UploadError):
+    pass
+
+
+# Default progress sink: the module logger (the Streamlit app passes its own)
+log_notify = notifier(logger)
+
+
+def credentials_from_secrets(secrets):
+    """
+    Upload credentials from the app's secrets (youtube_* keys); environment
+    variables YOUTUBE_ACCESS_TOKEN / YOUTUBE_REFRESH_TOKEN take precedence
+    """
+    return {
+        'client_id': secrets.get('youtube_client_id'),
+        'client_secret': secrets.get('youtube_client_secret'),
+        'token_uri': secrets.get('youtube_token_uri') or GOOGLE_TOKEN_URI,
+        'refresh_token': os.environ.get('YOUTUBE_REFRESH_TOKEN') or secrets.get('youtube_refresh_token'),
+        'access_token': os.environ.get('YOUTUBE_ACCESS_TOKEN') or secrets.get('youtube_access_token')
+    }
+
+
+class AccessToken:
+    """
+    OAuth access token for the upload scope. With a refresh token (and client
+    id/secret) it is refreshed shortly before expiry and after a 401; a bare
+    access token is used as-is.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._lock = threading.Lock()
+        self._token = credentials.get('access_token')
+        self._expires_at = None if self._token else 0
+
+    def can_refresh(self):
+        return bool(self.credentials.get('refresh_token') and self.credentials.get('client_id'))
+
+    def get(self):
+        with self._lock:
+            if self._expires_at is not None and time.time() >= self._expires_at - 60:
+                self._refresh()
+            return self._token
+
+    def invalidate(self):
+        """Called after a 401; False if there is no way to get a new token"""
+        if not self.can_refresh():
+            return False
+        with self._lock:
+            self._expires_at = 0
+        return True
+
+    def _refresh(self):
+        if not self.can_refresh():
+            raise UploadError("No YouTube access token or refresh token configured")
+        response = api_client.post(self.credentials.get('token_uri') or GOOGLE_TOKEN_URI, data={
+            'grant_type': 'refresh_token',
+            'refresh_token': self.credentials['refresh_token'],
+            'client_id': self.credentials['client_id'],
+            'client_secret': self.credentials.get('client_secret') or ''
+        })
+        if response.status_code != 200:
+            raise UploadError(f"Token refresh failed: {response.status_code} - {response.text[:200]}")
+        data = response.json()
+        self._token = data['access_token']
+        self._expires_at = time.time() + float(data.get('expires_in', 3600))
+
+
+def _quota_day():
+    # YouTube's quota resets at midnight Pacific time
+    try:
+        zone = ZoneInfo("America/Los_Angeles")
+    except Exception:
+        # No tz database: standard time is close enough for a budget
+        zone = timezone(timedelta(hours=-8))
+    return datetime.now(zone).strftime('%Y-%m-%d')
+
+
+class QuotaBudget:
+    """
+    Daily quota units spent on uploads (persisted to a small JSON file so
+    restarts and the batch CLI see the same count). A unit reservation is taken
+    before each upload session is created and handed back if creation fails.
+    """
+
+    def __init__(self, path=QUOTA_PATH, daily_units=DAILY_QUOTA):
+        self.path = path
+        self.daily_units = daily_units
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._state = json.load(f)
+        except (OSError, ValueError):
+            self._state = {}
+
+    def _today(self):
+        day = _quota_day()
+        if self._state.get('day') != day:
+            self._state = {'day': day, 'used': 0}
+        return self._state
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f)
+        except OSError:
+            pass
+
+    def reserve(self, units=INSERT_QUOTA_COST):
+        with self._lock:
+            state = self._today()
+            if state['used'] + units > self.daily_units:
+                raise QuotaExhaustedError(
+                    f"YouTube upload quota used up for today ({state['used']}/{self.daily_units} units)"
+                )
+            state['used'] += units
+            self._save()
+
+    def refund(self, units=INSERT_QUOTA_COST):
+        with self._lock:
+            state = self._today()
+            state['used'] = max(0, state['used'] - units)
+            self._save()
+
+    def exhaust(self):
+        """The API reported the quota as exceeded: stop trying until tomorrow"""
+        with self._lock:
+            self._today()['used'] = self.daily_units
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            state = self._today()
+            return {'day': state['day'], 'used': state['used'], 'daily_units': self.daily_units}
+
+
+_quota_budget = None
+_quota_budget_lock = threading.Lock()
+
+
+def get_quota_budget():
+    global _quota_budget
+    with _quota_budget_lock:
+        if _quota_budget is None:
+            _quota_budget = QuotaBudget()
+        return _quota_budget
+
+
+def _error_reason(response):
+    try:
+        errors = response.json().get('error', {}).get('errors') or []
+        return errors[0].get('reason') if errors else None
+    except (ValueError, AttributeError):
+        return None
+
+
+def _acknowledged(response):
+    """Bytes the server has from a 308's Range header ('bytes=0-N'); 0 without one"""
+    value = response.headers.get('Range')
+    if not value or '-' not in value:
+        return 0
+    return int(value.rsplit('-', 1)[1]) + 1
+
+
+class _Retry(Exception):
+    """A failed request worth resuming after a pause"""
+
+
+class _SessionExpired(Exception):
+    pass
+
+
+class ResumableUpload:
+    """
+    One video's upload. The session URI is saved to <video>.upload.json as soon
+    as it exists and removed once YouTube confirms the video; a later
+    ResumableUpload of the same, unchanged file picks the session up again and
+    asks YouTube how many bytes it already has. Chunks that were only partly
+    stored are resent from the acknowledged byte.
+    """
+
+    def __init__(self, path, metadata, token, chunk_size=CHUNK_SIZE, max_retries=MAX_RETRIES,
+                 quota=None, notify=log_notify, on_progress=None):
+        self.path = path
+        self.metadata = metadata
+        self.token = token
+        self.chunk_size = max(CHUNK_GRANULARITY, chunk_size // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+        self.max_retries = max_retries
+        self.quota = quota
+        self.notify = notify
+        self.on_progress = on_progress
+        self.session_path = path + SESSION_SUFFIX
+        self.size = os.path.getsize(path)
+        self.session_uri = None
+
+    # --- session bookkeeping
+
+    def _fingerprint(self):
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_session(self):
+        try:
+            with open(self.session_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if {'size': saved.get('size'), 'mtime': saved.get('mtime')} != self._fingerprint():
+            return None
+        if time.time() - saved.get('created_at', 0) > SESSION_MAX_AGE:
+            return None
+        return saved.get('session_uri')
+
+    def _save_session(self):
+        with open(self.session_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._fingerprint(), session_uri=self.session_uri, created_at=time.time()), f)
+
+    def _clear_session(self):
+        self.session_uri = None
+        try:
+            os.remove(self.session_path)
+        except OSError:
+            pass
+
+    # --- protocol
+
+    def _headers(self, extra=None):
+        headers = {"Authorization": f"Bearer {self.token.get()}"}
+        headers.update(extra or {})
+        return headers
+
+    def _check(self, response):
+        """Raise for responses that aren't progress or completion"""
+        if response.status_code == 401 and self.token.invalidate():
+            raise _Retry("Access token expired")
+        if response.status_code in EXPIRED_STATUSES:
+            raise _SessionExpired()
+        if response.status_code in RETRYABLE_STATUSES:
+            raise _Retry(f"YouTube returned {response.status_code}")
+        if response.status_code == 403 and _error_reason(response) in ('quotaExceeded', 'uploadLimitExceeded'):
+            if self.quota is not None:
+                self.quota.exhaust()
+            raise QuotaExhaustedError(f"YouTube quota exceeded: {_error_reason(response)}")
+        raise UploadError(f"YouTube upload failed: {response.status_code} - {response.text[:200]}")
+
+    def _start_session(self):
+        if self.quota is not None:
+            self.quota.reserve()
+        try:
+            response = api_client.post(
+                api_client.api_url('youtube', YOUTUBE_UPLOAD_PATH),
+                params={"uploadType": "resumable", "part": ",".join(self.metadata)},
+                headers=self._headers({
+                    "Content-Type": "application/json; charset=UTF-8",
+                    "X-Upload-Content-Length": str(self.size),
+                    "X-Upload-Content-Type": "video/*"
+                }),
+                json=self.metadata
+            )
+            if response.status_code != 200 or not response.headers.get('Location'):
+                self._check(response)
+                raise UploadError("YouTube did not return an upload session")
+        except QuotaExhaustedError:
+            raise
+        except BaseException:
+            if self.quota is not None:
+                self.quota.refund()
+            raise
+        self.session_uri = response.headers['Location']
+        self._save_session()
+
+    def _query_offset(self):
+        """(bytes YouTube has, video resource if it already has all of them)"""
+        response = api_client.put(
+            self.session_uri,
+            headers=self._headers({"Content-Range": f"bytes */{self.size}", "Content-Length": "0"}),
+            allow_redirects=False
+        )
+        if response.status_code in (200, 201):
+            return self.size, response.json()
+        if response.status_code == 308:
+            return _acknowledged(response), None
+        self._check(response)
+
+    def _send_chunk(self, f, offset):
+        """(new offset, video resource once the last chunk is in)"""
+        f.seek(offset)
+        data = f.read(self.chunk_size)
+        end = offset + len(data) - 1
+        with tracing.span('youtube.chunk', offset=offset, bytes=len(data)):
+            response = api_client.put(
+                self.session_uri,
+                headers=self._headers({"Content-Range": f"bytes {offset}-{end}/{self.size}"}),
+                data=data,
+                allow_redirects=False
+            )
+        if response.status_code in (200, 201):
+            return self.size, response.json()
+        if response.status_code == 308:
+            return _acknowledged(response), None
+        self._check(response)
+
+    def run(self):
+        """
+        Upload the file; returns a dict with video_id, url and throughput stats
+        Raises UploadError (QuotaExhaustedError for quota) when it gives up
+        """
+        with tracing.span('youtube.upload', bytes=self.size) as active:
+            result = self._run()
+            active.set(**{key: value for key, value in result.items() if key not in ('video_id', 'url')})
+            return result
+
+    def _run(self):
+        started = time.monotonic()
+        offset = 0
+        resumed_from = 0
+        chunks = 0
+        restarts = 0
+        failures = 0
+        video = None
+
+        self.session_uri = self._load_session()
+        need_offset = self.session_uri is not None
+
+        with open(self.path, 'rb') as f:
+            while video is None:
+                try:
+                    if self.session_uri is None:
+                        self._start_session()
+                        offset = 0
+                    elif need_offset:
+                        offset, video = self._query_offset()
+                        if chunks == 0 and restarts == 0:
+                            resumed_from = offset
+                            if offset:
+                                self.notify('info', f"Resuming upload at {offset * 100 // max(1, self.size)}%")
+                        need_offset = False
+                        continue
+                    previous = offset
+                    offset, video = self._send_chunk(f, offset)
+                    chunks += 1
+                    if offset > previous:
+                        failures = 0
+                    self.notify('status', f"Uploaded {offset * 100 // max(1, self.size)}%")
+                    if self.on_progress is not None:
+                        self.on_progress(offset, self.size)
+                except _SessionExpired:
+                    self.notify('warning', "Upload session expired, starting a new one")
+                    self._clear_session()
+                    restarts += 1
+                    failures += 1
+                except (_Retry, requests.exceptions.RequestException) as e:
+                    failures += 1
+                    need_offset = self.session_uri is not None
+                    if failures > self.max_retries:
+                        raise UploadError(f"YouTube upload failed after {self.max_retries} retries: {str(e)}") from e
+                    delay = min(2 ** failures, 30) * random.uniform(0.5, 1.0)
+                    self.notify('warning', f"Upload interrupted ({str(e)}), resuming in {delay:.1f}s")
+                    time.sleep(delay)
+                if failures > self.max_retries:
+                    raise UploadError(f"YouTube upload failed after {self.max_retries} retries")
+
+        self._clear_session()
+        seconds = time.monotonic() - started
+        sent = self.size - resumed_from
+        return {
+            'video_id': video.get('id'),
+            'url': WATCH_URL.format(video.get('id')),
+            'bytes': self.size,
+            'resumed_from': resumed_from,
+            'chunks': chunks,
+            'restarts': restarts,
+            'seconds': round(seconds, 3),
+            'bytes_per_second': round(sent / seconds) if seconds else None
+        }
+
+
+def video_metadata(title, description="", tags=None, privacy="private", category_id="22"):
+    """videos.insert body; parts are the top-level keys"""
+    return {
+        "snippet": {
+            # YouTube rejects titles over 100 characters and '<' / '>'
+            "title": (title or "AI Generated Video").replace('<', '').replace('>', '')[:100],
+            "description": description or "",
+            "tags": list(tags or []),
+            "categoryId": category_id
+        },
+        "status": {"privacyStatus": privacy, "selfDeclaredMadeForKids": False}
+    }
+
+
+def upload_video(path, title, credentials, description="", tags=None, privacy="private",
+                 chunk_size=CHUNK_SIZE, notify=log_notify, on_progress=None, quota=None, token=None):
+    """
+    Upload one video file (see ResumableUpload); returns its result dict
+    credentials: see credentials_from_secrets; token: a shared AccessToken instead
+    on_progress(bytes acknowledged, total bytes) is called after every chunk
+    """
+    upload = ResumableUpload(
+        path,
+        video_metadata(title, description, tags, privacy),
+        token or AccessToken(credentials),
+        chunk_size=chunk_size,
+        quota=quota if quota is not None else get_quota_budget(),
+        notify=notify,
+        on_progress=on_progress
+    )
+    return upload.run()
+
+
+def upload_many(videos, credentials, max_workers=2, chunk_size=CHUNK_SIZE, notify=log_notify, quota=None):
+    """
+    Upload several videos in parallel: videos is a list of dicts with 'path',
+    'title' and optional 'description'/'tags'/'privacy'. The workers share one
+    access token, the quota budget and the youtube rate limiter (whose
+    max_concurrent caps requests in flight, whatever max_workers is).
+    Returns one record per video, in order: the upload result plus 'path' and
+    'status' ('done' or 'failed' with 'error'). Once the quota runs out, the
+    remaining videos fail fast without a request.
+    """
+    token = AccessToken(credentials)
+
+    def upload(video):
+        record = {'path': video['path']}
+        try:
+            record.update(upload_video(
+                video['path'], video.get('title'), credentials,
+                description=video.get('description', ""),
+                tags=video.get('tags'),
+                privacy=video.get('privacy', "private"),
+                chunk_size=chunk_size, notify=notify, quota=quota, token=token
+            ))
+            record['status'] = 'done'
+        except (UploadError, OSError) as e:
+            record.update(status='failed', error=str(e))
+        return record
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="youtube-upload") as pool:
+        return list(pool.map(upload, videos))